@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import argparse
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'local'))
+from bench.stub_server import StubTabelogServer  # noqa: E402
+from async_crawler import run_crawl  # noqa: E402
+import main as local_main  # noqa: E402
+
+
+def run_sequential(rst_names: list):
+    results = []
+    for rst_name in rst_names:
+        url_info = local_main.get_url_info(input_rst_name=rst_name)
+        results.append(local_main.scrape(url=url_info["url"]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スタブサーバーを使った並行クロールのスループット計測")
+    parser.add_argument("--names", type=int, default=100, help="処理する店名の数")
+    parser.add_argument("--latency", type=float, default=0.2, help="スタブサーバーの応答遅延(秒)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--rps", type=float, default=0, help="ホストごとの最大リクエスト数/秒 (0以下で無制限)")
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    input_file = os.path.join(ROOT_DIR, "doc", "test.csv")
+    base_names = [x for x in open(input_file).read().splitlines() if x]
+    rst_names = [base_names[i % len(base_names)] for i in range(args.names)]
+
+    with StubTabelogServer(latency=args.latency) as stub:
+        os.environ["TABELOG_SEARCH_URL"] = stub.search_url
+
+        if not args.skip_sequential:
+            start = time.perf_counter()
+            results = run_sequential(rst_names)
+            elapsed = time.perf_counter() - start
+            print(f"sequential             : {len(results) / elapsed:8.2f} names/sec ({elapsed:.2f}s)")
+
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            results = []
+            run_crawl(rst_names, lambda rst_name, data: results.append(data),
+                      concurrency=concurrency, rps=args.rps)
+            elapsed = time.perf_counter() - start
+            print(f"async concurrency={concurrency:<4d}: {len(results) / elapsed:8.2f} names/sec ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+from bench.stub_server import StubTabelogServer  # noqa: E402
+from bench.bench_suite import InMemoryDynamoDB, reset_clients  # noqa: E402
+from bench.bench_sqs_publish import StubSqsClient  # noqa: E402
+from src.throttle import BlockedError  # noqa: E402
+from src.sqs_batch import call_or_error  # noqa: E402
+from src import metrics  # noqa: E402
+
+DLQ_URL = "https://sqs.ap-northeast-1.amazonaws.com/000000000000/scrape_request_dlq"
+# キューのRedrivePolicyのmaxReceiveCount (serverless.ymlと同じ)
+MAX_RECEIVE_COUNT = 5
+BATCH_SIZE = 10
+
+
+def call_or_blocked(func, *args):
+    # 変更前の方式: ブロック以外の例外はハンドラーの外に送出し、バッチ全体を失敗させる
+    try:
+        return func(*args)
+    except BlockedError as e:
+        return e
+
+
+def run(mode: str, num_urls: int, malformed_rate: float, latency: float):
+    # SQSのキューを真似て、scrapeハンドラーを10件ずつのバッチで呼び出す (可視性タイムアウトの待ち時間は含めない)
+    # whole_batch: 例外でバッチ全体を失敗させ、全てのメッセージを再配信する (maxReceiveCount回でDLQ)
+    # per_record: 失敗したメッセージだけを再配信し、DLQ_MAX_RECEIVE_COUNT回で理由と一緒にDLQに送る
+    from src import scrape as scrape_module
+    reset_clients()
+    os.environ["FETCH_INTERVAL"] = "0"
+    os.environ["DB_RST_DATA_TABLE"] = "TabelogRstData"
+    os.environ["SCRAPE_REQUEST_SQS_URL"] = "https://sqs.ap-northeast-1.amazonaws.com/000000000000/scrape_request"
+    os.environ["SCRAPE_REQUEST_DLQ_URL"] = DLQ_URL if mode == "per_record" else ""
+    os.environ.pop("DB_INFLIGHT_TABLE", None)
+    dynamodb = scrape_module.dynamodb = InMemoryDynamoDB()
+    sqs = scrape_module.sqs = StubSqsClient(0.0)
+    scrape_module.call_or_error = call_or_blocked if mode == "whole_batch" else call_or_error
+    flush = metrics.flush
+    metrics.flush = lambda handler_name: None
+
+    num_invocations = 0
+    num_redelivered = 0
+    redrive_dead_letters = 0
+    try:
+        with StubTabelogServer(latency=latency, validators=False, malformed_rate=malformed_rate) as server, \
+                contextlib.redirect_stdout(io.StringIO()):
+            urls = [f"{server.origin}/tokyo/A1320/A132001/{13000000 + i}/" for i in range(num_urls)]
+            queue = [{"messageId": str(i), "body": json.dumps({"url": url, "use_cache": True}), "receive_count": 0}
+                     for i, url in enumerate(urls)]
+            num_poison = sum(1 for url in urls if server.is_malformed(url[len(server.origin):]))
+            start = time.perf_counter()
+            while queue:
+                messages, queue = queue[:BATCH_SIZE], queue[BATCH_SIZE:]
+                for message in messages:
+                    message["receive_count"] += 1
+                event = {"Records": [{"messageId": message["messageId"], "body": message["body"],
+                                      "attributes": {"ApproximateReceiveCount": str(message["receive_count"])}}
+                                     for message in messages]}
+                num_invocations += 1
+                try:
+                    response = scrape_module.handler(event, None)
+                    failed_ids = {failure["itemIdentifier"] for failure in response["batchItemFailures"]}
+                except Exception:
+                    failed_ids = {message["messageId"] for message in messages}
+                for message in messages:
+                    if message["messageId"] not in failed_ids:
+                        continue
+                    if message["receive_count"] >= MAX_RECEIVE_COUNT:
+                        redrive_dead_letters += 1
+                    else:
+                        num_redelivered += 1
+                        queue.append(message)
+            elapsed = time.perf_counter() - start
+    finally:
+        metrics.flush = flush
+        scrape_module.call_or_error = call_or_error
+    handler_dead_letters = [message for message in sqs.messages if "reason" in message]
+    return {"mode": mode, "urls": num_urls, "poison": num_poison, "seconds": round(elapsed, 2),
+            "urls_per_sec": round(num_urls / elapsed, 2), "http_requests": server.num_requests,
+            "wasted_requests": server.num_requests - num_urls, "invocations": num_invocations,
+            "redelivered": num_redelivered, "items": len(dynamodb.tables["TabelogRstData"].items),
+            "dead_lettered": len(handler_dead_letters) + redrive_dead_letters,
+            "with_reason": len(handler_dead_letters),
+            "reasons": sorted({message["reason"] for message in handler_dead_letters})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQSのバッチ全体の再配信と、メッセージごとの失敗 (batchItemFailures・DLQ) の比較")
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--malformed-rate", type=float, default=0.05, help="構造が変わった (処理できない) ページの割合")
+    parser.add_argument("--latency", type=float, default=0.02, help="スタブサーバーの応答遅延(秒)")
+    args = parser.parse_args()
+
+    for mode in ["whole_batch", "per_record"]:
+        print(json.dumps(run(mode, args.urls, args.malformed_rate, args.latency), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+
+HANDLERS = ["scrape", "get_url", "publish_scrape_request", "publish_get_url_request_by_s3",
+            "publish_get_url_request_by_http", "dump_to_csv"]
+# 初回呼び出しまで計測するハンドラー (SQSから大量に呼ばれるもの)
+INVOKED_HANDLERS = ["scrape", "get_url"]
+# 読み込まれたかを確認する重いパッケージ
+HEAVY_PACKAGES = ["boto3", "bs4", "html5lib", "lxml", "requests"]
+SAVED_URL = "https://tabelog.com/tokyo/A1320/A132001/13000000/"
+
+
+class StubAwsServer:
+    # DynamoDB・SQSのAPI (JSONプロトコル) に空の成功レスポンスを返すスタブ
+    # AWS_ENDPOINT_URLでboto3の接続先にすると、通信を含めた初回呼び出しの時間を計測できる
+    # savedがTrueの場合、BatchGetItemは要求されたキーのアイテムを全て保存済みとして返す (キャッシュを使う呼び出し)
+    def __init__(self):
+        self.saved = False
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler(self))
+        self.server.daemon_threads = True
+        self.endpoint = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @staticmethod
+    def _make_handler(stub):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                target = self.headers.get("X-Amz-Target", "").split(".")[-1]
+                if target == "BatchGetItem":
+                    response = {"Responses": {name: [dict({"url": {"S": SAVED_URL}}, **key) for key in table["Keys"]]
+                                              if stub.saved else [] for name, table in request["RequestItems"].items()}}
+                elif target == "BatchWriteItem":
+                    response = {"UnprocessedItems": {}}
+                elif target == "SendMessageBatch":
+                    response = {"Successful": [{"Id": entry["Id"], "MessageId": entry["Id"],
+                                                "MD5OfMessageBody": ""} for entry in request["Entries"]],
+                                "Failed": []}
+                else:
+                    response = {}
+                body = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-amz-json-1.0")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def child_env(extra=None):
+    env = dict(os.environ, AWS_DEFAULT_REGION="ap-northeast-1", AWS_ACCESS_KEY_ID="testing",
+               AWS_SECRET_ACCESS_KEY="testing", DB_RST_URL_TABLE="TabelogRstUrl",
+               DB_RST_DATA_TABLE="TabelogRstData", FETCH_INTERVAL="0",
+               SCRAPE_REQUEST_SQS_URL="https://sqs.ap-northeast-1.amazonaws.com/000000000000/scrape_request")
+    env.update(extra or {})
+    return env
+
+
+def measure_import(handler: str):
+    # python -X importtime の出力からハンドラーのモジュールの累積時間と読み込まれたパッケージを取り出す
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import src.{handler}"],
+                            cwd=ROOT_DIR, env=child_env(), check=True, capture_output=True, text=True).stderr
+    total_us = 0
+    loaded = set()
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        if not match:
+            continue
+        cumulative, name = int(match.group(1)), match.group(3)
+        if name == f"src.{handler}":
+            total_us = cumulative
+        if name.split(".")[0] in HEAVY_PACKAGES:
+            loaded.add(name.split(".")[0])
+    return round(total_us / 1000, 1), sorted(loaded)
+
+
+def run_child(handler: str, event_json: str):
+    # インポートから初回呼び出しの完了までの時間を計測する (インタープリターの起動時間は含まない)
+    start = time.perf_counter()
+    import importlib
+    module = importlib.import_module(f"src.{handler}")
+    imported = time.perf_counter()
+    module.handler(json.loads(event_json), None)
+    end = time.perf_counter()
+    print(json.dumps({"import_ms": round((imported - start) * 1000, 1),
+                      "first_call_ms": round((end - start) * 1000, 1)}))
+
+
+def measure_first_call(handler: str, aws, tabelog):
+    if handler == "scrape":
+        body = {"url": f"{tabelog.origin}/tokyo/A1320/A132001/13000000/", "use_cache": True}
+    else:
+        body = {"name": "吉祥寺 ばぁど家", "use_cache": True}
+    event = json.dumps({"Records": [{"body": json.dumps(body)}]})
+    env = child_env({"AWS_ENDPOINT_URL": aws.endpoint, "TABELOG_SEARCH_URL": tabelog.search_url})
+    stdout = subprocess.run([sys.executable, __file__, "--child", handler, event], cwd=ROOT_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lambdaハンドラーのインポート時間と初回呼び出しの時間の計測")
+    parser.add_argument("--repeat", type=int, default=5, help="計測の回数 (中央値を表示する)")
+    parser.add_argument("--handlers", nargs="+", default=HANDLERS)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    from bench.stub_server import StubTabelogServer
+    with StubAwsServer() as aws, StubTabelogServer() as tabelog:
+        for handler in args.handlers:
+            results = [measure_import(handler) for _ in range(args.repeat)]
+            result = {"handler": handler, "importtime_ms": median([ms for ms, _ in results]),
+                      "loaded": results[0][1]}
+            if handler in INVOKED_HANDLERS:
+                # 全てのページを取得する呼び出しと、全てDynamoDBに保存済み (use_cache) の呼び出し
+                for saved, name in [(False, "first_call_ms"), (True, "first_call_cached_ms")]:
+                    aws.saved = saved
+                    calls = [measure_first_call(handler, aws, tabelog) for _ in range(args.repeat)]
+                    result[name] = median([call["first_call_ms"] for call in calls])
+            print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
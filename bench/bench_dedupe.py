@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import random
+import argparse
+import threading
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ["GET_URL_REQUEST_SQS_URL"] = "https://sqs.ap-northeast-1.amazonaws.com/000000000000/get_url_request"
+os.environ["DB_RST_DATA_TABLE"] = "TabelogRstData"
+from bench.stub_server import StubTabelogServer  # noqa: E402
+from bench.bench_sqs_publish import StubSqsClient  # noqa: E402
+from bench.bench_scrape_handler import StubDynamoDB  # noqa: E402
+from bench.bench_global_rate_limit import SerializedClient  # noqa: E402
+from src import publish_get_url_request_by_s3 as publish_module  # noqa: E402
+from src import scrape as scrape_module  # noqa: E402
+from src import inflight  # noqa: E402
+
+INPUT_FILE = os.path.join(ROOT_DIR, "doc", "test.csv")
+
+
+class StubS3Body:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+class StubS3Client:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": StubS3Body(self.body)}
+
+
+def make_variant(name: str, rng: random.Random):
+    # 実際の入力ファイルにある重複 (そのまま・前後の空白・全角の空白) を作る (完全に同じ店名だけが1件になる)
+    return rng.choice([name, f" {name}", name.replace(" ", "　"), f"{name} "])
+
+
+def bench_publish(num_lines: int, rng: random.Random):
+    names = [x for x in open(INPUT_FILE).read().splitlines() if x]
+    lines = [make_variant(rng.choice(names), rng) for _ in range(num_lines)]
+    publish_module.s3 = StubS3Client("\n".join(lines).encode("utf-8"))
+    publish_module.sqs = StubSqsClient(0.0)
+    event = {"Records": [{"s3": {"bucket": {"name": "tabelog-scraping-input"}, "object": {"key": "bench.csv"}}}]}
+    publish_module.handler(event, None)
+    return {"lines": num_lines, "messages": len(publish_module.sqs.messages)}
+
+
+def bench_inflight(use_inflight: bool, num_workers: int, num_urls: int):
+    # 同じURLを含むSQSバッチを複数のLambdaが同時に処理した場合のリクエスト数を数える
+    import boto3
+    from moto import mock_aws
+    with mock_aws(), StubTabelogServer(latency=0.05) as server:
+        if use_inflight:
+            client = boto3.client("dynamodb")
+            client.create_table(TableName="TabelogInflight",
+                                AttributeDefinitions=[{"AttributeName": "key", "AttributeType": "S"}],
+                                KeySchema=[{"AttributeName": "key", "KeyType": "HASH"}],
+                                BillingMode="PAY_PER_REQUEST")
+            os.environ["DB_INFLIGHT_TABLE"] = "TabelogInflight"
+            inflight._client = SerializedClient(client, threading.Lock())
+        else:
+            os.environ.pop("DB_INFLIGHT_TABLE", None)
+        scrape_module.dynamodb = StubDynamoDB()
+        urls = [f"{server.origin}/tokyo/A1320/A132001/{13000000 + i}/" for i in range(num_urls)]
+        # get_urlが送るスクレイピングリクエストと同じくuse_cache=True (use_cache=Falseの再取得は印を使わない)
+        event = {"Records": [{"messageId": str(i), "body": json.dumps({"url": url, "use_cache": True})}
+                             for i, url in enumerate(urls)]}
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(scrape_module.handler(event, None)))
+                   for _ in range(num_workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 処理中だったURLのメッセージは再配信される (再配信時には保存済みのデータを使う)
+        redelivered = sum(len(response["batchItemFailures"]) for response in responses)
+        num_requests = server.num_requests
+        scrape_module.handler(event, None)
+        return {"inflight": use_inflight, "workers": num_workers, "urls": num_urls,
+                "detail_requests": num_requests, "redelivered": redelivered,
+                "redelivery_requests": server.num_requests - num_requests,
+                "markers_left": client.scan(TableName="TabelogInflight")["Count"] if use_inflight else 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入力の重複排除と処理中の印による重複スクレイピングの削減の計測")
+    parser.add_argument("--lines", type=int, default=1000, help="入力ファイルの行数 (doc/test.csvの店名を重複させる)")
+    parser.add_argument("--workers", type=int, default=4, help="同じバッチを同時に処理するLambdaの数")
+    parser.add_argument("--urls", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ["FETCH_INTERVAL"] = "0"
+    print(json.dumps(bench_publish(args.lines, random.Random(args.seed))))
+    for use_inflight in [False, True]:
+        print(json.dumps(bench_inflight(use_inflight, args.workers, args.urls)))
+
+
+if __name__ == "__main__":
+    main()
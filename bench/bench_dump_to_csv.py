@@ -0,0 +1,171 @@
+import os
+import sys
+import csv
+import time
+import json
+import argparse
+import resource
+import threading
+import subprocess
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ["DB_RST_DATA_TABLE"] = "TabelogRstData"
+os.environ["S3_OUTPUT_BUCKET"] = "tabelog-scraping-output"
+
+# アイテムの属性名 (TabelogRstDataと同じ)
+ITEM_KEYS = ["url", "name", "has_official_badge", "score", "num_reviews", "num_bookmarks", "nearest_station",
+             "genre", "budget_dinner", "budget_lunch", "regular_holiday", "is_serve_takeout", "pr_title",
+             "pr-comment", "kodawari", "hygiene", "top-course", "coupon", "booking_inquiry",
+             "booking_availability", "address", "transportation", "business_hours", "payment_method",
+             "service_charge", "num_seat", "num_max_booking", "private_room", "charter", "smoking", "parking",
+             "space_equipment", "mobile_phone", "course", "drink", "cuisine", "go_to_eat", "scene", "location",
+             "service", "with_children", "homepage", "twitter", "instagram", "facebook", "opening_date",
+             "telephone", "other", "has_google_ad", "created_at"]
+
+
+def synthetic_item(i: int):
+    item = {key: f"値{i % 97}" * 5 for key in ITEM_KEYS}
+    item["url"] = f"https://tabelog.com/tokyo/A1320/A132001/{13000000 + i}/"
+    return item
+
+
+class StubTable:
+    # DynamoDBのscanを模したテーブル
+    # motoはテーブル全体をメモリに持つためメモリ使用量の計測に向かず、100万件では遅すぎるので、
+    # アイテムをページ(1MB相当)ごとにその場で生成して返す
+    def __init__(self, num_items: int, page_size: int):
+        self.num_items = num_items
+        self.page_size = page_size
+
+    def scan(self, ExclusiveStartKey=None, Segment=0, TotalSegments=1, **kwargs):
+        # セグメントごとに i % TotalSegments == Segment のアイテムを返す
+        start = ExclusiveStartKey["offset"] if ExclusiveStartKey else Segment
+        indexes = range(start, self.num_items, TotalSegments)[:self.page_size]
+        response = {"Items": [synthetic_item(i) for i in indexes]}
+        end = start + len(indexes) * TotalSegments
+        if end < self.num_items:
+            response["LastEvaluatedKey"] = {"offset": end}
+        return response
+
+
+class StubS3Client:
+    # アップロードされたデータはサイズだけ数えて捨てる
+    def __init__(self):
+        self.num_bytes = 0
+        self.num_parts = 0
+
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "bench"}
+
+    def upload_part(self, Body, PartNumber, **kwargs):
+        self.num_bytes += len(Body)
+        self.num_parts += 1
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, **kwargs):
+        return {}
+
+    def abort_multipart_upload(self, **kwargs):
+        return {}
+
+    def upload_file(self, file_path, bucket, key):
+        self.num_bytes += os.path.getsize(file_path)
+        self.num_parts += 1
+
+    def generate_presigned_url(self, **kwargs):
+        return "https://example.com/presigned"
+
+
+class PeakRssSampler:
+    # 一定間隔でRSSを読み取り、計測区間中の最大値を記録する (Linuxのみ)
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.page_size = resource.getpagesize()
+        self.peak = self.baseline = self.current()
+        self.running = False
+        self.thread = None
+
+    def current(self):
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * self.page_size
+
+    def _run(self):
+        while self.running:
+            self.peak = max(self.peak, self.current())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def legacy_handler(dump_module, table):
+    # 変更前の実装: テーブル全体をリストに読み込み、/tmpにcsvを書いてからアップロードする
+    response = table.scan()
+    data = response['Items']
+    while 'LastEvaluatedKey' in response:
+        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
+        data.extend(response['Items'])
+    file_path = "/tmp/bench-scraping-result.csv"
+    with open(file_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=dump_module.FIELDNAMES)
+        writer.writeheader()
+        for da in data:
+            writer.writerow(dump_module.to_csv_row(da))
+    dump_module.s3_client.upload_file(file_path, os.environ['S3_OUTPUT_BUCKET'], "legacy.csv")
+    os.remove(file_path)
+
+
+def run_mode(mode: str, num_items: int, page_size: int):
+    from src import dump_to_csv as dump_module
+    from src import dynamodb_utils
+    s3_client = StubS3Client()
+    table = StubTable(num_items, page_size)
+    dynamodb_utils.create_table = lambda table_name: table
+    dump_module.s3_client = s3_client
+
+    event = {"queryStringParameters": {"gzip": "1"}} if mode == "stream-gzip" else {}
+    start = time.perf_counter()
+    with PeakRssSampler() as sampler:
+        if mode == "legacy":
+            legacy_handler(dump_module, table)
+        else:
+            dump_module.handler(event, None)
+    elapsed = time.perf_counter() - start
+    return {"mode": mode, "items": num_items, "seconds": round(elapsed, 2),
+            "uploaded_mb": round(s3_client.num_bytes / 1024 / 1024, 1), "parts": s3_client.num_parts,
+            "peak_rss_increase_mb": round((sampler.peak - sampler.baseline) / 1024 / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="dump_to_csvのメモリ使用量と実行時間の計測")
+    parser.add_argument("--items", type=int, default=1000000, help="テーブルのアイテム数")
+    parser.add_argument("--page-size", type=int, default=400, help="1回のscanで返すアイテム数 (1MB相当)")
+    parser.add_argument("--modes", nargs="+", default=["legacy", "stream", "stream-gzip"])
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.items, args.page_size)))
+        return
+
+    # モードごとに別プロセスで実行してメモリ使用量が混ざらないようにする
+    for mode in args.modes:
+        output = subprocess.run([sys.executable, __file__, "--child", mode, "--items", str(args.items),
+                                 "--page-size", str(args.page_size)],
+                                check=True, capture_output=True, text=True).stdout
+        print(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
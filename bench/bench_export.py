@@ -0,0 +1,94 @@
+import os
+import io
+import sys
+import csv
+import gzip
+import json
+import time
+import random
+import argparse
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+from bench.pages import load_detail_pages  # noqa: E402
+from src.parser import parse_html  # noqa: E402
+from src.extractor import extract_rst_data  # noqa: E402
+from src.dump_to_csv import dump_to_csv  # noqa: E402
+from src.result_parquet import dump_to_parquet  # noqa: E402
+
+
+def make_items(num_items: int, rng: random.Random):
+    # 保存済みの店舗詳細ページから抽出したアイテムを元に、URL・スコア・件数を変えて増やす
+    templates = [extract_rst_data(parse_html(page), f"https://tabelog.com/tokyo/A1320/A132001/{13000000 + i}/")
+                 for i, page in enumerate(load_detail_pages().values())]
+    for i in range(num_items):
+        item = dict(templates[i % len(templates)])
+        item["url"] = f"https://tabelog.com/tokyo/A1320/A132001/{13000000 + i}/"
+        item["score"] = f"{rng.uniform(3.0, 4.5):.2f}"
+        item["num_reviews"] = f"{rng.randint(0, 3000):,}"
+        item["num_bookmarks"] = f"{rng.randint(0, 30000):,}"
+        item["num_seat"] = f"{rng.randint(8, 120)}席"
+        yield item
+
+
+def pages_of(items: list, page_size: int = 1000):
+    return [items[i:i + page_size] for i in range(0, len(items), page_size)]
+
+
+def query_csv(data: bytes, use_gzip: bool):
+    # 口コミが100件以上の店舗の平均スコア (csvは全ての列を文字列として読み、数値に変換し直す)
+    f = io.TextIOWrapper(gzip.GzipFile(fileobj=io.BytesIO(data)) if use_gzip else io.BytesIO(data),
+                         encoding="utf-8", newline='')
+    scores = [float(row["食べログスコア"]) for row in csv.DictReader(f)
+              if int(row["レビュー数"].replace(",", "")) >= 100]
+    return sum(scores) / len(scores)
+
+
+def query_parquet(data: bytes):
+    # 必要な列だけを数値のまま読み込む
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    table = pq.read_table(io.BytesIO(data), columns=["score", "num_reviews"])
+    return pc.mean(table.filter(pc.greater_equal(table["num_reviews"], 100))["score"]).as_py()
+
+
+def run(export_format: str, pages: list):
+    buffer = io.BytesIO()
+    start = time.perf_counter()
+    if export_format == "parquet":
+        num_rows = dump_to_parquet(pages, buffer)
+    else:
+        stream = gzip.GzipFile(fileobj=buffer, mode="wb") if export_format == "csv-gzip" else buffer
+        f = io.TextIOWrapper(stream, encoding="utf-8", newline='')
+        num_rows = dump_to_csv(pages, f)
+        f.flush()
+        f.detach()
+        if export_format == "csv-gzip":
+            stream.close()
+    export_seconds = time.perf_counter() - start
+    data = buffer.getvalue()
+
+    start = time.perf_counter()
+    if export_format == "parquet":
+        mean_score = query_parquet(data)
+    else:
+        mean_score = query_csv(data, export_format == "csv-gzip")
+    query_seconds = time.perf_counter() - start
+    return {"format": export_format, "rows": num_rows, "export_seconds": round(export_seconds, 2),
+            "mb": round(len(data) / 1024 / 1024, 2), "query_seconds": round(query_seconds, 3),
+            "mean_score": round(mean_score, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="csvとParquetの出力の速度・サイズと、出力したファイルの集計速度の比較")
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pages = pages_of(list(make_items(args.items, random.Random(args.seed))))
+    for export_format in ["csv", "csv-gzip", "parquet"]:
+        print(json.dumps(run(export_format, pages)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import datetime
+import argparse
+from bs4 import BeautifulSoup
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.extractor import extract_rst_data  # noqa: E402
+from bench.pages import load_detail_pages, load_saved_pages  # noqa: E402
+
+
+# 比較用に残している変更前の抽出処理 (find()を項目ごとに呼び出す実装)
+def legacy_extract_rst_data(html, url: str):
+    rstinfo_table = html.find("div", class_="rstinfo-table")
+
+    def filter_booking_inquiry(tag):
+        if tag.name == 'th' and tag.get_text(strip=True) == '予約・お問い合わせ':
+            return True
+        return False
+
+    def filter_business_hours(tag):
+        if tag.name == 'th' and tag.get_text(strip=True) == '営業時間・定休日':
+            return True
+        return False
+
+    def filter_service_charge(tag):
+        if tag.name == 'th' and tag.get_text(strip=True) == 'サービス料・チャージ':
+            return True
+        return False
+
+    def get_pr_comment():
+        if html.find("div", class_="pr-comment") is None:
+            return ""
+        return '\n'.join([x for x in html.find("div", class_="pr-comment").stripped_strings])
+
+    def get_data_from_table(key: str):
+        # キーが存在しない場合には空文字
+        if rstinfo_table.find("th", string=key) is None:
+            return ""
+        return '\n'.join([x for x in rstinfo_table.find("th", string=key).find_next("td").stripped_strings])
+
+    def get_data_from_table_by_filter(filter):
+        # キーが存在しない場合には空文字
+        if rstinfo_table.find(filter) is None:
+            return ""
+        return '\n'.join([x for x in rstinfo_table.find(filter).find_next("td").stripped_strings])
+
+    def get_sns_url(sns_name: str):
+        # 公式アカウントキーが存在しない場合は空文字
+        th_tag = rstinfo_table.find("th", string="公式アカウント")
+        if th_tag is None:
+            return ""
+        # 該当のsnsアカウントが存在しない場合は空文字
+        a_tag = th_tag.find_next("td").find(
+            "a", class_=f"rstinfo-sns-{sns_name}")
+        if a_tag is None:
+            return ""
+        return a_tag.get("href")
+
+    return {
+        "url": url,
+        "name": str(html.find("h2", class_="display-name").find("span").get_text(strip=True)),
+        "has_official_badge": html.find("p", class_="owner-badge__icon") is not None,
+        "score": str(html.find("span", class_="rdheader-rating__score-val-dtl").string),
+        "num_reviews": str(html.find("span", class_="rdheader-rating__review-target").find("em").string),
+        "num_bookmarks": str(html.find("span", class_="rdheader-rating__hozon-target").find("em").string),
+        "nearest_station": str(html.find("dl", class_="rdheader-subinfo__item--station").find("span", class_="linktree__parent-target-text").string if html.find("dl", class_="rdheader-subinfo__item--station") is not None else ""),
+        "genre": str(rstinfo_table.find("th", string="ジャンル").find_next("td").find("span").string),
+        "budget_dinner": str(html.find("p", class_="rdheader-budget__icon--dinner").find("a", class_="rdheader-budget__price-target").string),
+        "budget_lunch": str(html.find("p", class_="rdheader-budget__icon--lunch").find("a", class_="rdheader-budget__price-target").string),
+        "regular_holiday": str(html.find("dd", class_="rdheader-subinfo__closed-text").get_text(strip=True) if html.find("dd", class_="rdheader-subinfo__closed-text") is not None else ""),
+        "is_serve_takeout": html.find("div", class_="rstdtl-takeout-info") is not None,
+        "pr_title": str(html.find("h3", class_="pr-comment-title").string if html.find("h3", class_="pr-comment-title") else ""),
+        "pr-comment": get_pr_comment(),
+        "kodawari": '\n'.join([x.get_text(strip=True) for x in html.find_all("p", class_="rstdtl-top-kodawari__title")]),
+        "hygiene": '、'.join([x.get_text(strip=True) for x in html.find("div", class_="rstdtl-hygiene").find_all("p", class_="rstdtl-hygiene__data")]) if html.find("div", class_="rstdtl-hygiene") else "",
+        "top-course": '、'.join([x.text for x in html.find_all("span", class_="rstdtl-course-list__price-num")]),
+        "coupon": '、'.join([x.text for x in html.find_all("p", class_="rstdtl-rstinfo-coupon__description")]),
+        "booking_inquiry": get_data_from_table_by_filter(filter_booking_inquiry),
+        "booking_availability": get_data_from_table(key="予約可否"),
+        "address": str(rstinfo_table.find("th", string="住所").find_next("td").find("p", class_="rstinfo-table__address").text),
+        "transportation": get_data_from_table(key="交通手段"),
+        "business_hours": get_data_from_table_by_filter(filter_business_hours),
+        "payment_method": get_data_from_table(key="支払い方法"),
+        "service_charge": get_data_from_table_by_filter(filter_service_charge),
+        "num_seat": get_data_from_table(key="席数"),
+        "num_max_booking": get_data_from_table(key="最大予約可能人数"),
+        "private_room": get_data_from_table(key="個室"),
+        "charter": get_data_from_table(key="貸切"),
+        "smoking": get_data_from_table(key="禁煙・喫煙"),
+        "parking": get_data_from_table(key="駐車場"),
+        "space_equipment": get_data_from_table(key="空間・設備"),
+        "mobile_phone": get_data_from_table(key="携帯電話"),
+        "course": get_data_from_table(key="コース"),
+        "drink": get_data_from_table(key="ドリンク"),
+        "cuisine": get_data_from_table(key="料理"),
+        "go_to_eat": get_data_from_table(key="Go To Eat"),
+        "scene": get_data_from_table(key="利用シーン"),
+        "location": get_data_from_table(key="ロケーション"),
+        "service": get_data_from_table(key="サービス"),
+        "with_children": get_data_from_table(key="お子様連れ"),
+        "homepage": get_data_from_table(key="ホームページ"),
+        "twitter": get_sns_url(sns_name="twitter"),
+        "instagram": get_sns_url(sns_name="instagram"),
+        "facebook": get_sns_url(sns_name="facebook"),
+        "opening_date": get_data_from_table(key="オープン日"),
+        "telephone": get_data_from_table(key="電話番号"),
+        "other": get_data_from_table(key="備考"),
+        "has_google_ad": html.find("aside", class_="rstdtl-side-banner") is not None,
+        "created_at": datetime.datetime.now().isoformat()
+    }
+
+
+def strip_created_at(data: dict):
+    return {k: v for k, v in data.items() if k != "created_at"}
+
+
+def measure(func, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="詳細ページの抽出処理のベンチマーク")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--parser", default="html5lib")
+    parser.add_argument("--pages", nargs="+", default=[],
+                        help="一致を確認する実際の店舗詳細ページ (.htmlまたはHTML_CACHE_DIRのディレクトリ)")
+    args = parser.parse_args()
+
+    pages = load_detail_pages()
+    # thのラベルの前後に空白があるページ (変更前はfind("th", string=key)の完全一致のため空文字になる)
+    pages["detail_full_padded_th"] = pages["detail_full.html"].replace("<th>席数</th>".encode(),
+                                                                       "<th> 席数 </th>".encode())
+    saved_pages = load_saved_pages(args.pages)
+    if args.pages and not saved_pages:
+        sys.exit(f"no saved detail pages found in {args.pages}")
+    pages.update(saved_pages)
+    for name, content in pages.items():
+        url = f"https://tabelog.com/bench/{name}"
+        html = BeautifulSoup(content, args.parser)
+
+        # 新旧の抽出結果が一致することを確認してから計測する
+        legacy = strip_created_at(legacy_extract_rst_data(html, url))
+        current = strip_created_at(extract_rst_data(html, url))
+        if legacy != current:
+            diff = {k: (legacy[k], current[k]) for k in legacy if legacy[k] != current[k]}
+            sys.exit(f"{name}: extraction results differ: {diff}")
+
+        parse_time = measure(lambda: BeautifulSoup(content, args.parser), args.repeat)
+        legacy_time = measure(lambda: legacy_extract_rst_data(html, url), args.repeat)
+        current_time = measure(lambda: extract_rst_data(html, url), args.repeat)
+        print(f"{name} ({len(content) // 1024}KB, parser={args.parser})")
+        print(f"  parse:            {parse_time * 1000:8.2f} ms")
+        print(f"  extract (before): {legacy_time * 1000:8.2f} ms")
+        print(f"  extract (after):  {current_time * 1000:8.2f} ms  x{legacy_time / current_time:.1f}")
+        print(f"  parse+extract:    {(parse_time + legacy_time) * 1000:8.2f} ms -> {(parse_time + current_time) * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
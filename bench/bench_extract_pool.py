@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'local'))
+from src import html_cache  # noqa: E402
+from src.result_csv import CsvResultWriter  # noqa: E402
+from bench.pages import load_detail_pages  # noqa: E402
+import main as local_main  # noqa: E402
+
+
+def build_corpus(num_pages: int):
+    pages = list(load_detail_pages().values())
+    for i in range(num_pages):
+        html_cache.put(f"https://tabelog.com/tokyo/A1320/A132001/{13000000 + i}/", pages[i % len(pages)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="キャッシュ済みのページを複数プロセスで再抽出するベンチマーク")
+    parser.add_argument("--pages", type=int, default=200, help="キャッシュに用意するページ数")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({0, 1, 2, 4, os.cpu_count()}))
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="bench-html-cache-")
+    os.environ["HTML_CACHE_DIR"] = cache_dir
+    try:
+        build_corpus(args.pages)
+        print(f"cpu_count={os.cpu_count()} pages={args.pages}")
+        base = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            with CsvResultWriter(os.path.join(cache_dir, "result.csv")) as writer:
+                local_main.reextract_from_cache(writer, workers=workers)
+            elapsed = time.perf_counter() - start
+            throughput = writer.num_rows / elapsed
+            if workers == 1 or base is None:
+                base = throughput
+            print(f"workers={workers:<3d}: {throughput:8.2f} pages/sec  x{throughput / base:.2f}")
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+from src.rate_limit import NoRateLimiter, LocalRateLimiter, DynamoDBRateLimiter  # noqa: E402
+
+TABLE_NAME = "TabelogRateLimit"
+
+
+def create_table(client):
+    client.create_table(TableName=TABLE_NAME,
+                        AttributeDefinitions=[{"AttributeName": "limiter_key", "AttributeType": "S"}],
+                        KeySchema=[{"AttributeName": "limiter_key", "KeyType": "HASH"}],
+                        BillingMode="PAY_PER_REQUEST")
+
+
+class SerializedClient:
+    # motoは条件付き更新が複数スレッドに対してアトミックではないため、呼び出しを直列にして
+    # DynamoDB本体と同じく1アイテムへの条件付き更新がアトミックに行われる状態にする
+    def __init__(self, client, lock):
+        self.client = client
+        self.lock = lock
+        self.exceptions = client.exceptions
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def call(**kwargs):
+            with self.lock:
+                return method(**kwargs)
+        return call
+
+
+def run(limiters, num_requests: int, window: float):
+    # ワーカー(同時に動くLambdaに相当)ごとに別のスレッドでリクエストの枠を取り、通した時刻を記録する
+    times = []
+    lock = threading.Lock()
+
+    def worker(limiter):
+        for _ in range(num_requests):
+            limiter.acquire()
+            with lock:
+                times.append(time.time())
+
+    threads = [threading.Thread(target=worker, args=(limiter,)) for limiter in limiters]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    per_window = Counter(int(t // window) for t in times)
+    return {"requests": len(times), "seconds": round(elapsed, 2),
+            "requests_per_second": round(len(times) / elapsed, 2),
+            "max_requests_per_window": max(per_window.values())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全てのワーカーで共有するレート制限のベンチマーク")
+    parser.add_argument("--workers", type=int, default=8, help="同時に動くワーカー(Lambda)の数")
+    parser.add_argument("--requests", type=int, default=5, help="ワーカーごとのリクエスト数")
+    parser.add_argument("--limit", type=int, default=4, help="区間あたりのリクエストの上限")
+    parser.add_argument("--window", type=float, default=1.0, help="区間の長さ(秒)")
+    args = parser.parse_args()
+
+    # レート制限なし: ワーカーの数だけリクエスト頻度が増える
+    result = run([NoRateLimiter() for _ in range(args.workers)], args.requests, args.window)
+    print(json.dumps({"backend": "none", **result}))
+
+    # local: 1つのリミッターを全てのワーカーで共有する
+    limiter = LocalRateLimiter(args.limit, args.window)
+    result = run([limiter] * args.workers, args.requests, args.window)
+    print(json.dumps({"backend": "local", "limit": args.limit, **result, "stats": limiter.stats}))
+
+    # dynamodb: ワーカーごとに別のリミッターを作り、DynamoDBのカウンターだけを共有する
+    import boto3
+    from moto import mock_aws
+    with mock_aws():
+        client = boto3.client("dynamodb")
+        create_table(client)
+        lock = threading.Lock()
+        limiters = [DynamoDBRateLimiter(SerializedClient(boto3.client("dynamodb"), lock), TABLE_NAME,
+                                        args.limit, args.window)
+                    for _ in range(args.workers)]
+        result = run(limiters, args.requests, args.window)
+        throttled = sum(limiter.stats["throttled"] for limiter in limiters)
+        # 通信の遅延で記録した時刻が次の区間にずれることがあるため、テーブルのカウンターでも確認する
+        counts = [int(item["count"]["N"]) for item in client.scan(TableName=TABLE_NAME)["Items"]]
+        print(json.dumps({"backend": "dynamodb", "limit": args.limit, **result, "throttled": throttled,
+                          "max_count_in_table": max(counts)}))
+
+
+if __name__ == "__main__":
+    main()
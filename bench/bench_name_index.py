@@ -0,0 +1,90 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import unicodedata
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'local'))
+from src.name_index import NameIndex, build_from_items  # noqa: E402
+from build_name_index import iter_csv_items  # noqa: E402
+
+RESULT_CSV = os.path.join(ROOT_DIR, "local", "scraping-result_20210720_173105.csv")
+KATAKANA = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン"
+GENRES = ["居酒屋", "焼肉", "寿司", "ラーメン", "カフェ", "ビストロ", "Bar", "食堂"]
+AREAS = ["渋谷", "新宿", "吉祥寺", "銀座", "池袋", "恵比寿", "中目黒", "上野"]
+
+
+def synthetic_items(num_items: int, rng: random.Random):
+    # 実在しそうな店名 (カタカナの屋号 + ジャンル + 支店名) を作る
+    for i in range(num_items):
+        brand = "".join(rng.choice(KATAKANA) for _ in range(rng.randint(3, 7)))
+        name = f"{brand} {rng.choice(GENRES)} {rng.choice(AREAS)}店"
+        yield {"rst_name": name, "url": f"https://tabelog.com/tokyo/A1320/A132001/{14000000 + i}/"}
+
+
+def make_variant(name: str, rng: random.Random):
+    # 入力ファイルでよくある表記の揺れを1つ加える
+    kind = rng.choice(["width", "space", "hiragana", "halfwidth_kana"])
+    if kind == "width":
+        # 半角英数字・記号を全角にする
+        return "".join(chr(ord(c) + 0xFEE0) if "!" <= c <= "~" else c for c in name)
+    if kind == "space":
+        return name.replace(" ", "") if " " in name else name.replace("店", " 店")
+    if kind == "hiragana":
+        return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in name)
+    # 半角カナ (NFKCの逆変換の代わりに、濁点のないカタカナのみ置き換える)
+    table = {unicodedata.normalize("NFKC", chr(c)): chr(c) for c in range(0xFF66, 0xFF9E)}
+    return "".join(table.get(c, c) for c in name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="店名の索引の一致率・大きさ・読み込み時間の計測")
+    parser.add_argument("--names", type=int, default=50000, help="索引に登録する店名の数 (csvの店名に加える)")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    items = list(iter_csv_items(RESULT_CSV)) + list(synthetic_items(args.names, rng))
+    start = time.perf_counter()
+    index = build_from_items(items)
+    build_seconds = time.perf_counter() - start
+
+    buffer = io.BytesIO()
+    index.dump(buffer)
+    # Lambdaのコールドスタートでの読み込みに相当する
+    start = time.perf_counter()
+    index = NameIndex.load(io.BytesIO(buffer.getvalue()))
+    load_seconds = time.perf_counter() - start
+
+    # 登録済みの店名に表記の揺れを加えたもの (検索せずに解決したい) と、登録されていない店名を半分ずつ引く
+    known = rng.sample(items, args.queries // 2)
+    queries = [(make_variant(item["rst_name"], rng), item["url"]) for item in known]
+    queries += [(f"{name['rst_name']}2号館", None) for name in synthetic_items(args.queries // 2, random.Random(-1))]
+    counts = {"matched": 0, "wrong": 0, "missed": 0, "unknown_matched": 0, "unknown_missed": 0}
+    latencies = []
+    for query, url in queries:
+        start = time.perf_counter()
+        result = index.lookup(query)
+        latencies.append(time.perf_counter() - start)
+        if url is None:
+            counts["unknown_matched" if result else "unknown_missed"] += 1
+        elif result is None:
+            counts["missed"] += 1
+        else:
+            counts["matched" if result[1] == url else "wrong"] += 1
+    latencies.sort()
+    print(json.dumps({"names": len(index), "index_bytes": len(buffer.getvalue()),
+                      "build_seconds": round(build_seconds, 2), "load_seconds": round(load_seconds, 2),
+                      "lookup_p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+                      "lookup_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+                      **counts}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.parser import PARSERS, parse_html  # noqa: E402
+from src.extractor import extract_rst_data, extract_url_info  # noqa: E402
+from bench.pages import load_detail_pages, load_search_pages, load_saved_pages  # noqa: E402
+
+# 検索ページに対して試す店名 (完全一致あり・なし)
+SEARCH_NAMES = ["吉祥寺 ばぁど家", "ラ・ベファーナ 吉祥寺", "存在しない店名"]
+
+
+def strip_created_at(data: dict):
+    return {k: v for k, v in data.items() if k != "created_at"}
+
+
+def run_all(parser: str, detail_pages: dict, search_pages: dict):
+    results = {}
+    for name, content in detail_pages.items():
+        html = parse_html(content, parser)
+        results[name] = strip_created_at(extract_rst_data(html, f"https://tabelog.com/bench/{name}"))
+    for name, content in search_pages.items():
+        html = parse_html(content, parser)
+        for rst_name in SEARCH_NAMES:
+            results[(name, rst_name)] = strip_created_at(extract_url_info(html, rst_name))
+    return results
+
+
+def check_parity(detail_pages: dict, search_pages: dict):
+    # すべてのパーサーで同じ抽出結果になることを確認する
+    expected = run_all(PARSERS[0], detail_pages, search_pages)
+    ok = True
+    for parser in PARSERS[1:]:
+        actual = run_all(parser, detail_pages, search_pages)
+        for key, data in expected.items():
+            diff = {k: (data.get(k), actual[key].get(k)) for k in set(data) | set(actual[key])
+                    if data.get(k) != actual[key].get(k)}
+            if diff:
+                ok = False
+                print(f"[NG] {parser} {key}: {diff}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTMLパーサーごとの一致確認とベンチマーク")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--check", action="store_true",
+                        help="一致確認のみを行う (一致しない場合は終了コード1。CIで実行する)")
+    parser.add_argument("--pages", nargs="+", default=[],
+                        help="一致を確認する実際の店舗詳細ページ (.htmlまたはHTML_CACHE_DIRのディレクトリ)")
+    args = parser.parse_args()
+
+    detail_pages = load_detail_pages()
+    search_pages = load_search_pages()
+    saved_pages = load_saved_pages(args.pages)
+    if args.pages and not saved_pages:
+        sys.exit(f"no saved detail pages found in {args.pages}")
+    if not check_parity({**detail_pages, **saved_pages}, search_pages):
+        sys.exit("extraction results differ between parsers")
+    print(f"parity OK: {', '.join(PARSERS)} ({len(detail_pages) + len(saved_pages) + len(search_pages)} pages)")
+    if args.check:
+        return
+
+    pages = {**detail_pages, **search_pages}
+    for parser_name in PARSERS:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for name, content in pages.items():
+                html = parse_html(content, parser_name)
+                if name.startswith("detail_"):
+                    extract_rst_data(html, name)
+                else:
+                    extract_url_info(html, SEARCH_NAMES[0])
+        elapsed = (time.perf_counter() - start) / (args.repeat * len(pages))
+        print(f"{parser_name:12s} parse+extract: {elapsed * 1000:8.2f} ms/page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import random
+import argparse
+import datetime
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+from src.refresh_schedule import next_interval, select_stale  # noqa: E402
+
+
+def simulate(mode: str, num_pages: int, days: int, budget: int, seed: int):
+    # 1日1回の再取得をdays日分シミュレーションする
+    # 各ページは1日あたりchange_rateの確率で変更される (大半はほとんど変更されない)
+    rng = random.Random(seed)
+    change_rates = [0.3 if rng.random() < 0.1 else 0.01 for _ in range(num_pages)]
+    urls = [f"https://tabelog.com/tokyo/A1320/A132001/{13000000 + i}/" for i in range(num_pages)]
+    start = datetime.datetime(2024, 1, 1)
+    # 初日に全てのページを取得済みとする
+    items = {url: {"url": url, "created_at": start.isoformat(), "checked_at": start.isoformat(),
+                   "revisit_interval": next_interval(None, changed=True)} for url in urls}
+    version = [0] * num_pages
+    saved_version = [0] * num_pages
+    changed_since = [None] * num_pages
+    fetches = 0
+    detected = 0
+    stale_page_days = 0
+    for day in range(1, days + 1):
+        now = start + datetime.timedelta(days=day)
+        for i in range(num_pages):
+            if rng.random() < change_rates[i]:
+                version[i] += 1
+                if changed_since[i] is None:
+                    changed_since[i] = day
+
+        if mode == "full":
+            targets = urls
+        else:
+            targets, _ = select_stale(urls, items.values(), budget, now)
+        for url in targets:
+            i = int(url.rstrip("/").rsplit("/", 1)[1]) - 13000000
+            changed = version[i] != saved_version[i]
+            fetches += 1
+            item = items[url]
+            item["revisit_interval"] = next_interval(item, changed)
+            item["checked_at"] = now.isoformat()
+            if changed:
+                detected += 1
+                saved_version[i] = version[i]
+                changed_since[i] = None
+        # 変更を取り込めていないページの日数を数える
+        stale_page_days += sum([1 for x in changed_since if x is not None])
+    return {"mode": mode, "pages": num_pages, "days": days, "fetches": fetches, "changes_detected": detected,
+            "fetches_per_change": round(fetches / max(detected, 1), 1),
+            "avg_stale_pages": round(stale_page_days / days, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="再取得のスケジューラーのシミュレーション")
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--budget", type=int, default=500, help="1回の再取得で取得するページ数の上限")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for mode in ["full", "incremental"]:
+        print(json.dumps(simulate(mode, args.pages, args.days, args.budget, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
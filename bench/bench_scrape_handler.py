@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ["DB_RST_DATA_TABLE"] = "TabelogRstData"
+from bench.stub_server import StubTabelogServer  # noqa: E402
+from src import scrape as scrape_module  # noqa: E402
+from src import rate_limit  # noqa: E402
+
+
+class StubBatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def put_item(self, Item):
+        self.table.items[Item["url"]] = Item
+        self.table.num_writes += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class StubTable:
+    def __init__(self):
+        self.items = {}
+        self.num_writes = 0
+        self.num_updates = 0
+
+    def batch_writer(self, **kwargs):
+        return StubBatchWriter(self)
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues):
+        # "SET a = :a, b = :b" の形式のみ対応する
+        item = self.items[Key["url"]]
+        for assignment in UpdateExpression[len("SET "):].split(","):
+            name, value = [x.strip() for x in assignment.split("=")]
+            item[name] = ExpressionAttributeValues[value]
+        self.num_updates += 1
+
+
+class StubDynamoDB:
+    # DynamoDBのスタブ (計測対象はスクレイピングの待ち時間なので、DynamoDBの処理は省く)
+    def __init__(self):
+        self.table = StubTable()
+
+    def Table(self, table_name):
+        return self.table
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for table_name, request in RequestItems.items():
+            responses[table_name] = [self.table.items[key["url"]] for key in request["Keys"]
+                                     if key["url"] in self.table.items]
+        return {"Responses": responses}
+
+
+def legacy_handler(event, interval: float):
+    # 変更前の実装: 1件ずつ取得し、次のリクエストの前に固定で待機する
+    table = scrape_module.dynamodb.Table(os.environ['DB_RST_DATA_TABLE'])
+    urls = [json.loads(record['body'])["url"] for record in event['Records']]
+    with table.batch_writer(overwrite_by_pkeys=["url"]) as batch:
+        for i, url in enumerate(urls):
+            batch.put_item(Item=scrape_module.scrape(url)[0])
+            if i != len(urls) - 1:
+                time.sleep(interval)
+
+
+def run(mode: str, event, concurrency: int):
+    os.environ["FETCH_CONCURRENCY"] = str(concurrency)
+    # 間隔の計測がモードをまたがないようにリミッターを作り直す
+    rate_limit._limiter = None
+    scrape_module.dynamodb = StubDynamoDB()
+    start = time.perf_counter()
+    if mode == "legacy":
+        # 変更前は待機をハンドラー内で行うため、リミッターでは待機しない
+        interval = os.environ["FETCH_INTERVAL"]
+        os.environ["FETCH_INTERVAL"] = "0"
+        try:
+            legacy_handler(event, float(interval))
+        finally:
+            os.environ["FETCH_INTERVAL"] = interval
+    else:
+        scrape_module.handler(event, None)
+    return time.perf_counter() - start, len(scrape_module.dynamodb.table.items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スタブサーバーを使ったscrapeハンドラーの実行時間の計測")
+    parser.add_argument("--messages", type=int, default=10, help="SQSバッチ1回分のメッセージ数")
+    parser.add_argument("--latency", type=float, default=0.5, help="スタブサーバーの応答遅延(秒)")
+    parser.add_argument("--interval", type=float, default=2.0, help="リクエストの間隔 FETCH_INTERVAL(秒)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    os.environ["FETCH_INTERVAL"] = str(args.interval)
+    with StubTabelogServer(latency=args.latency) as server:
+        event = {"Records": [{"body": json.dumps({"url": f"{server.origin}/tokyo/A1320/A132001/{13000000 + i}/",
+                                                  "use_cache": False})}
+                             for i in range(args.messages)]}
+        modes = [("legacy", 1)] + [("concurrent", c) for c in args.concurrency]
+        for mode, concurrency in modes:
+            seconds, num_items = run(mode, event, concurrency)
+            print(json.dumps({"mode": mode, "concurrency": concurrency, "messages": args.messages,
+                              "items": num_items, "seconds": round(seconds, 2),
+                              "requests_per_second": round(args.messages / seconds, 2)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+
+from bench.stub_server import StubTabelogServer  # noqa: E402
+from bench.bench_scrape_handler import StubDynamoDB  # noqa: E402
+from src import scrape as scrape_module  # noqa: E402
+
+
+def run(server, dynamodb, event):
+    scrape_module.dynamodb = dynamodb
+    num_requests = server.num_requests
+    num_not_modified = server.num_not_modified
+    num_writes = dynamodb.table.num_writes
+    num_updates = dynamodb.table.num_updates
+    start = time.perf_counter()
+    scrape_module.handler(event, None)
+    return {"seconds": round(time.perf_counter() - start, 2),
+            "http_requests": server.num_requests - num_requests,
+            "not_modified": server.num_not_modified - num_not_modified,
+            "writes": dynamodb.table.num_writes - num_writes,
+            "updates": dynamodb.table.num_updates - num_updates}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="条件付きリクエストによる再スクレイピングの計測")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="スタブサーバーの応答遅延(秒)")
+    args = parser.parse_args()
+
+    os.environ["FETCH_INTERVAL"] = "0"
+    # 検証子を返すサーバー(304で応答)と、返さないサーバー(HTMLのハッシュで比較)の両方で計測する
+    for validators in [True, False]:
+        with StubTabelogServer(latency=args.latency, validators=validators) as server:
+            urls = [f"{server.origin}/tokyo/A1320/A132001/{13000000 + i}/" for i in range(args.messages)]
+            event = {"Records": [{"body": json.dumps({"url": url, "use_cache": False})} for url in urls]}
+            dynamodb = StubDynamoDB()
+            for run_name in ["initial", "refresh"]:
+                result = run(server, dynamodb, event)
+                print(json.dumps({"validators": validators, "run": run_name, "pages": args.messages, **result}))
+
+
+if __name__ == "__main__":
+    main()
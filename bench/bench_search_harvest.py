@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ["DB_RST_URL_TABLE"] = "TabelogRstUrl"
+os.environ["SCRAPE_REQUEST_SQS_URL"] = "https://sqs.ap-northeast-1.amazonaws.com/000000000000/scrape_request"
+from bench.stub_server import StubTabelogServer  # noqa: E402
+from bench.bench_sqs_publish import StubSqsClient  # noqa: E402
+from bench.pages import load_search_pages  # noqa: E402
+from src import get_url as get_url_module  # noqa: E402
+from src.parser import parse_html  # noqa: E402
+from src.extractor import extract_search_listings  # noqa: E402
+
+KEY_NAMES = {"TabelogRstUrl": "input_rst_name", "TabelogRstListing": "rst_name"}
+
+
+class StubBatchWriter:
+    def __init__(self, items, key_name):
+        self.items = items
+        self.key_name = key_name
+
+    def put_item(self, Item):
+        self.items[Item[self.key_name]] = Item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class StubTable:
+    def __init__(self, key_name):
+        self.key_name = key_name
+        self.items = {}
+
+    def batch_writer(self, **kwargs):
+        return StubBatchWriter(self.items, self.key_name)
+
+
+class StubDynamoDB:
+    # TabelogRstUrlとTabelogRstListingのスタブ
+    def __init__(self):
+        self.tables = {name: StubTable(key_name) for name, key_name in KEY_NAMES.items()}
+
+    def Table(self, table_name):
+        return self.tables[table_name]
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = self.tables[table_name]
+            responses[table_name] = [table.items[key[table.key_name]] for key in request["Keys"]
+                                     if key[table.key_name] in table.items]
+        return {"Responses": responses}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="検索結果ページの一覧を使った検索リクエストの削減の計測")
+    parser.add_argument("--others", type=int, default=10, help="検索結果ページに載っていない店名の数")
+    parser.add_argument("--batch-size", type=int, default=10, help="SQSバッチ1回分のメッセージ数")
+    parser.add_argument("--latency", type=float, default=0.1, help="スタブサーバーの応答遅延(秒)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # 地域ごとの入力リストを想定し、同じ検索結果ページに載っている店名を多く含める
+    search_page = list(load_search_pages().values())[0]
+    names = [listing["rst_name"] for listing in extract_search_listings(parse_html(search_page))]
+    names += [f"店舗{i}" for i in range(args.others)]
+    random.Random(args.seed).shuffle(names)
+    batches = [names[i:i + args.batch_size] for i in range(0, len(names), args.batch_size)]
+
+    os.environ["FETCH_INTERVAL"] = "0"
+    for harvest in [False, True]:
+        if harvest:
+            os.environ["DB_RST_LISTING_TABLE"] = "TabelogRstListing"
+        else:
+            os.environ.pop("DB_RST_LISTING_TABLE", None)
+        get_url_module.dynamodb = StubDynamoDB()
+        get_url_module.sqs = StubSqsClient(0.0)
+        with StubTabelogServer(latency=args.latency) as server:
+            os.environ["TABELOG_SEARCH_URL"] = server.search_url
+            start = time.perf_counter()
+            for batch in batches:
+                event = {"Records": [{"body": json.dumps({"name": name, "use_cache": True})} for name in batch]}
+                get_url_module.handler(event, None)
+            elapsed = time.perf_counter() - start
+            print(json.dumps({"harvest": harvest, "names": len(names), "search_requests": server.num_requests,
+                              "seconds": round(elapsed, 2)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import os
+import io
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+import subprocess
+import contextlib
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ["DB_RST_DATA_TABLE"] = "TabelogRstData"
+from bench.stub_server import StubTabelogServer  # noqa: E402
+from bench.bench_dump_to_csv import synthetic_item  # noqa: E402
+from bench.bench_suite import load_names, child_env, reset_clients  # noqa: E402
+from src.sqlite_store import SqliteStore, SqliteDynamoDB  # noqa: E402
+
+LOCAL_MAIN = os.path.join(ROOT_DIR, "local", "main.py")
+
+
+def make_item(i: int):
+    item = synthetic_item(i)
+    item["created_at"] = (datetime.datetime(2021, 7, 1) + datetime.timedelta(minutes=i)).isoformat()
+    return item
+
+
+def bench_write(work_dir: str, num_items: int, batch_size: int):
+    # batch_size件ごとにコミットする (1の場合は1件ごと)
+    path = os.path.join(work_dir, f"write-{batch_size}.sqlite")
+    start = time.perf_counter()
+    with SqliteStore(path, batch_size=batch_size) as store:
+        for i in range(num_items):
+            store.put_item("TabelogRstData", make_item(i))
+    elapsed = time.perf_counter() - start
+    return path, {"scenario": "write", "batch_size": batch_size, "items": num_items,
+                  "seconds": round(elapsed, 2), "items_per_sec": round(num_items / elapsed)}
+
+
+def bench_read(path: str, num_items: int, num_lookups: int, rng: random.Random):
+    store = SqliteStore(path)
+    urls = [make_item(rng.randrange(num_items))["url"] for _ in range(num_lookups)]
+    start = time.perf_counter()
+    for url in urls:
+        store.get_item("TabelogRstData", url)
+    lookup_seconds = time.perf_counter() - start
+
+    # created_atのインデックスを使った範囲の検索 (1日分)
+    start = time.perf_counter()
+    [count] = store.connection.execute('SELECT COUNT(*) FROM "TabelogRstData" WHERE created_at BETWEEN ? AND ?',
+                                       ("2021-07-02", "2021-07-03")).fetchone()
+    range_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    num_rows = sum(len(page) for page in store.iter_pages("TabelogRstData"))
+    scan_seconds = time.perf_counter() - start
+    store.close()
+    return {"scenario": "read", "lookups": num_lookups, "lookups_per_sec": round(num_lookups / lookup_seconds),
+            "range_rows": count, "range_ms": round(range_seconds * 1000, 2),
+            "scan_rows": num_rows, "scan_rows_per_sec": round(num_rows / scan_seconds)}
+
+
+def run_local_main(server: StubTabelogServer, work_dir: str, input_file: str, extra_args: list):
+    before = server.num_requests
+    start = time.perf_counter()
+    subprocess.run([sys.executable, LOCAL_MAIN, input_file, "--db", "results.sqlite"] + extra_args,
+                   cwd=work_dir, env=child_env(server), check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start, server.num_requests - before
+
+
+def bench_local_main(num_names: int, latency: float):
+    # 1回目は全て取得し、2回目は保存済みの結果を使う (--refreshの場合は取得し直す)
+    names = load_names(num_names)
+    results = []
+    with StubTabelogServer(latency=latency, unique_listings=True) as server, \
+            tempfile.TemporaryDirectory() as work_dir:
+        input_file = os.path.join(work_dir, "names.txt")
+        with open(input_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(names))
+        for run, extra_args in [("first", []), ("second", []), ("second_async", ["--async", "--workers", "0"]),
+                                ("refresh", ["--refresh"])]:
+            seconds, num_requests = run_local_main(server, work_dir, input_file, extra_args)
+            results.append({"scenario": f"local_main_{run}", "names": num_names, "seconds": round(seconds, 2),
+                            "http_requests": num_requests})
+
+        # データベースからcsvを出力し、行数を確かめる
+        for name in os.listdir(work_dir):
+            if name.endswith(".csv"):
+                os.remove(os.path.join(work_dir, name))
+        start = time.perf_counter()
+        subprocess.run([sys.executable, LOCAL_MAIN, "--db", "results.sqlite", "--export"], cwd=work_dir,
+                       env=child_env(server), check=True, stdout=subprocess.DEVNULL)
+        seconds = time.perf_counter() - start
+        [output_file] = [name for name in os.listdir(work_dir) if name.endswith(".csv")]
+        with open(os.path.join(work_dir, output_file), newline='', encoding="utf-8") as f:
+            num_rows = sum(1 for _ in csv.DictReader(f))
+        results.append({"scenario": "local_main_export", "rows": num_rows, "seconds": round(seconds, 2)})
+    return results
+
+
+def bench_scrape_handler(work_dir: str, num_urls: int):
+    # scrapeハンドラーをDynamoDBの代わりにSQLiteで動かす (2回目は保存済みのため取得しない)
+    from src import scrape as scrape_module
+    reset_clients()
+    os.environ["FETCH_INTERVAL"] = "0"
+    store = SqliteStore(os.path.join(work_dir, "handler.sqlite"))
+    scrape_module.dynamodb = SqliteDynamoDB(store)
+    results = []
+    with StubTabelogServer(unique_listings=True) as server, contextlib.redirect_stdout(io.StringIO()):
+        urls = [f"{server.origin}/tokyo/A1320/A132001/{13000000 + i}/" for i in range(num_urls)]
+        event = {"Records": [{"body": json.dumps({"url": url, "use_cache": True})} for url in urls]}
+        for run in ["first", "second"]:
+            before = server.num_requests
+            start = time.perf_counter()
+            scrape_module.handler(event, None)
+            results.append({"scenario": f"scrape_handler_{run}", "urls": num_urls,
+                            "seconds": round(time.perf_counter() - start, 2),
+                            "http_requests": server.num_requests - before,
+                            "items": store.count("TabelogRstData")})
+    store.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLiteの結果の保存先の書き込み・読み込み速度と、ローカル実行のキャッシュの効果の計測")
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--names", type=int, default=30, help="local/main.pyで処理する店名の数")
+    parser.add_argument("--latency", type=float, default=0.05, help="スタブサーバーの応答遅延(秒)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for batch_size in [1, 100, 1000]:
+            path, result = bench_write(work_dir, args.items if batch_size > 1 else args.items // 10, batch_size)
+            print(json.dumps(result))
+        print(json.dumps(bench_read(path, args.items, args.lookups, random.Random(args.seed))))
+        for result in bench_scrape_handler(work_dir, 10):
+            print(json.dumps(result))
+    for result in bench_local_main(args.names, args.latency):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
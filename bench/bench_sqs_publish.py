@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+from src.sqs_publisher import publish_messages  # noqa: E402
+
+
+class StubSqsClient:
+    # SQSのスタブ (motoはバッチ送信の処理自体が遅く、通信遅延の影響を計測できないため)
+    # latency: API呼び出し1回あたりの遅延(秒), failure_rate: バッチ内の各メッセージが失敗する確率
+    def __init__(self, latency: float, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.num_calls = 0
+        self.messages = []
+        self.lock = threading.Lock()
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        time.sleep(self.latency)
+        with self.lock:
+            self.num_calls += 1
+            self.messages.append(json.loads(MessageBody))
+        return {"MessageId": str(len(self.messages))}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        time.sleep(self.latency)
+        successful, failed = [], []
+        with self.lock:
+            self.num_calls += 1
+            for entry in Entries:
+                if random.random() < self.failure_rate:
+                    failed.append({"Id": entry["Id"], "SenderFault": False, "Code": "InternalError"})
+                else:
+                    self.messages.append(json.loads(entry["MessageBody"]))
+                    successful.append({"Id": entry["Id"], "MessageId": str(len(self.messages))})
+        return {"Successful": successful, "Failed": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQSへのメッセージ送信のベンチマーク")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.02, help="API呼び出し1回あたりの遅延(秒)")
+    parser.add_argument("--failure-rate", type=float, default=0.01, help="バッチ送信時にメッセージが失敗する確率")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    queue_url = "https://sqs.ap-northeast-1.amazonaws.com/000000000000/bench"
+    bodies = [{"name": f"店舗{i}", "use_cache": True} for i in range(args.messages)]
+
+    # 変更前: 1件ずつsend_message
+    client = StubSqsClient(args.latency)
+    start = time.perf_counter()
+    for body in bodies:
+        client.send_message(QueueUrl=queue_url, DelaySeconds=0, MessageBody=json.dumps(body))
+    elapsed = time.perf_counter() - start
+    print(f"send_message     : {args.messages / elapsed:9.1f} msg/sec, {client.num_calls} calls, {elapsed:.1f}s")
+
+    # 変更後: 10件ずつsend_message_batchを並行して送信
+    client = StubSqsClient(args.latency, args.failure_rate)
+    start = time.perf_counter()
+    counts, _ = publish_messages(client, queue_url, bodies, max_workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"publish_messages : {args.messages / elapsed:9.1f} msg/sec, {client.num_calls} calls, {elapsed:.1f}s")
+    print(f"  {counts}, delivered={len(client.messages)}")
+
+
+if __name__ == "__main__":
+    main()
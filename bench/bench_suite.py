@@ -0,0 +1,333 @@
+import os
+import io
+import sys
+import csv
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ["DB_RST_URL_TABLE"] = "TabelogRstUrl"
+os.environ["DB_RST_DATA_TABLE"] = "TabelogRstData"
+os.environ["SCRAPE_REQUEST_SQS_URL"] = "https://sqs.ap-northeast-1.amazonaws.com/000000000000/scrape_request"
+os.environ["GET_URL_REQUEST_SQS_URL"] = "https://sqs.ap-northeast-1.amazonaws.com/000000000000/get_url_request"
+from bench.stub_server import StubTabelogServer  # noqa: E402
+from bench.bench_sqs_publish import StubSqsClient  # noqa: E402
+from bench.bench_dump_to_csv import synthetic_item  # noqa: E402
+from src import metrics  # noqa: E402
+from src import rate_limit  # noqa: E402
+from src import http_client  # noqa: E402
+from src import throttle  # noqa: E402
+
+INPUT_CSV = os.path.join(ROOT_DIR, "doc", "test.csv")
+LOCAL_MAIN = os.path.join(ROOT_DIR, "local", "main.py")
+# テーブル名 -> パーティションキー
+KEY_NAMES = {"TabelogRstUrl": "input_rst_name", "TabelogRstData": "url", "TabelogRstListing": "rst_name"}
+# 比較する指標 (接尾辞で良し悪しの向きを決める)
+HIGHER_IS_BETTER = "_per_sec"
+LOWER_IS_BETTER = "_ms"
+
+
+class InMemoryBatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # 実際のbatch_writerと同様に、抜けるときにまとめて書き込む (1回分の遅延)
+        self.table.dynamodb.wait()
+
+
+class InMemoryTable:
+    def __init__(self, dynamodb, key_name: str):
+        self.dynamodb = dynamodb
+        self.key_name = key_name
+        self.items = {}
+
+    def batch_writer(self, **kwargs):
+        return InMemoryBatchWriter(self)
+
+    def put_item(self, Item):
+        with self.dynamodb.lock:
+            self.items[Item[self.key_name]] = dict(Item)
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues):
+        # "SET a = :a, b = :b" の形式のみ対応する
+        self.dynamodb.wait()
+        with self.dynamodb.lock:
+            item = self.items.setdefault(Key[self.key_name], dict(Key))
+            for assignment in UpdateExpression[len("SET "):].split(","):
+                name, value = [x.strip() for x in assignment.split("=")]
+                item[name] = ExpressionAttributeValues[value]
+
+
+class InMemoryDynamoDB:
+    # Lambdaのハンドラーを動かすためのDynamoDB (boto3のresource) の代わり
+    # latency: API呼び出し1回あたりの遅延(秒)
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.tables = {name: InMemoryTable(self, key_name) for name, key_name in KEY_NAMES.items()}
+
+    def wait(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def Table(self, table_name):
+        return self.tables[table_name]
+
+    def batch_get_item(self, RequestItems):
+        self.wait()
+        responses = {}
+        with self.lock:
+            for table_name, request in RequestItems.items():
+                table = self.tables[table_name]
+                responses[table_name] = [dict(table.items[key[table.key_name]]) for key in request["Keys"]
+                                         if key[table.key_name] in table.items]
+        return {"Responses": responses}
+
+
+def load_names(num_names: int):
+    # doc/test.csvの店名を使い、足りない分は番号を付けて別の店名にする
+    names = [line for line in open(INPUT_CSV, encoding="utf-8").read().splitlines() if line]
+    return [names[i % len(names)] + (f" {i // len(names)}" if i >= len(names) else "") for i in range(num_names)]
+
+
+def describe(seconds: list):
+    # 1回あたりの処理時間の集計 (ミリ秒)
+    values = sorted(seconds)
+    return {"calls": len(values), "mean_ms": round(sum(values) / len(values) * 1000, 2),
+            "p50_ms": round(metrics.percentile(values, 50) * 1000, 2),
+            "p95_ms": round(metrics.percentile(values, 95) * 1000, 2)}
+
+
+def reset_clients():
+    # シナリオごとにセッション(接続プール)とリミッターを作り直す
+    http_client._session = None
+    rate_limit._limiter = None
+    rate_limit._global_limiter = None
+    throttle._controller = None
+
+
+def child_env(server: StubTabelogServer):
+    return dict(os.environ, TABELOG_SEARCH_URL=server.search_url, FETCH_INTERVAL="0",
+                HTTP_BACKOFF_FACTOR="0.05", THROTTLE_BACKOFF="0.05", HTML_CACHE_DIR="")
+
+
+def run_local_main(names: list, args, extra_args: list):
+    # local/main.py を別プロセスで実行する (インタープリターの起動を含む)
+    with StubTabelogServer(latency=args.latency, error_rate=args.error_rate, unique_listings=True,
+                           seed=args.seed) as server, tempfile.TemporaryDirectory() as work_dir:
+        input_file = os.path.join(work_dir, "names.txt")
+        with open(input_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(names))
+        start = time.perf_counter()
+        subprocess.run([sys.executable, LOCAL_MAIN, input_file] + extra_args, cwd=work_dir,
+                       env=child_env(server), check=True, stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        [output_file] = [name for name in os.listdir(work_dir) if name.endswith(".csv")]
+        with open(os.path.join(work_dir, output_file), newline='', encoding="utf-8") as f:
+            num_rows = sum(1 for _ in csv.DictReader(f))
+    return {"names": len(names), "rows": num_rows, "seconds": round(elapsed, 2),
+            "names_per_sec": round(len(names) / elapsed, 2),
+            "http_requests": server.num_requests, "http_errors": server.num_errors}
+
+
+def run_lambda_pipeline(names: list, args):
+    # get_url -> (SQS) -> scrape をSQSのバッチ単位で順に呼び出す (AWSはメモリ上のスタブ)
+    from src import get_url as get_url_module
+    from src import scrape as scrape_module
+    dynamodb = InMemoryDynamoDB(args.aws_latency)
+    get_url_module.dynamodb = scrape_module.dynamodb = dynamodb
+    get_url_module.sqs = scrape_module.sqs = sqs = StubSqsClient(args.aws_latency)
+    batch_size = 10
+    failed_batches = 0
+    failed_messages = 0
+
+    def invoke(handler, bodies):
+        nonlocal failed_batches, failed_messages
+        for start in range(0, len(bodies), batch_size):
+            sent_timestamp = str(int(time.time() * 1000))
+            event = {"Records": [{"body": json.dumps(body), "attributes": {"SentTimestamp": sent_timestamp}}
+                                 for body in bodies[start:start + batch_size]]}
+            try:
+                response = handler(event, None)
+                # Lambdaでは再配信されるメッセージ (batchItemFailures。ここでは数えるだけ)
+                failed_messages += len(response["batchItemFailures"])
+            except Exception:
+                # Lambdaでは再配信されるバッチ (ここでは数えるだけ)
+                failed_batches += 1
+
+    reset_clients()
+    os.environ["FETCH_INTERVAL"] = "0"
+    os.environ["HTTP_BACKOFF_FACTOR"] = "0.05"
+    os.environ["THROTTLE_BACKOFF"] = "0.05"
+    # 段階ごとの処理時間を実行全体で集計するため、ハンドラーごとの出力とリセットを止める
+    flush = metrics.flush
+    metrics.flush = lambda handler_name: None
+    metrics.get_metrics().reset()
+    try:
+        with StubTabelogServer(latency=args.latency, error_rate=args.error_rate, unique_listings=True,
+                               seed=args.seed) as server, contextlib.redirect_stdout(io.StringIO()):
+            os.environ["TABELOG_SEARCH_URL"] = server.search_url
+            start = time.perf_counter()
+            invoke(get_url_module.handler, [{"name": name, "use_cache": True} for name in names])
+            # ブロックされてキューに戻された店名 (遅延は待たない) を処理してからスクレイピングする
+            retried = [message for message in sqs.messages if "name" in message]
+            invoke(get_url_module.handler, retried)
+            invoke(scrape_module.handler, [message for message in sqs.messages if "url" in message])
+            elapsed = time.perf_counter() - start
+    finally:
+        metrics.flush = flush
+    summary = metrics.get_metrics().summary()
+    metrics.get_metrics().reset()
+    return {"names": len(names), "items": len(dynamodb.tables["TabelogRstData"].items),
+            "seconds": round(elapsed, 2), "names_per_sec": round(len(names) / elapsed, 2),
+            "http_requests": server.num_requests, "http_errors": server.num_errors,
+            "failed_batches": failed_batches, "failed_messages": failed_messages, "retried": len(retried),
+            "stages": {name: {"p50_ms": stage["p50_ms"], "p95_ms": stage["p95_ms"]}
+                       for name, stage in summary["stages"].items()},
+            "counters": summary["counters"]}
+
+
+def run_micro(args):
+    # 関数単体の処理時間 (スタブサーバーの遅延・エラーなし。通信はローカルホストのみ)
+    from src.get_url import get_url_info
+    from src.scrape import scrape
+    from src.dump_to_csv import dump_to_csv
+    results = {}
+    reset_clients()
+    os.environ["FETCH_INTERVAL"] = "0"
+    with StubTabelogServer(unique_listings=True) as server, contextlib.redirect_stdout(io.StringIO()):
+        os.environ["TABELOG_SEARCH_URL"] = server.search_url
+        names = load_names(args.calls + 1)
+        # 最初の1回は遅延読み込み・接続の確立を含むため計測しない
+        get_url_info(names[0])
+        seconds = []
+        for name in names[1:]:
+            start = time.perf_counter()
+            get_url_info(name)
+            seconds.append(time.perf_counter() - start)
+        results["micro_get_url_info"] = describe(seconds)
+
+        urls = [f"{server.origin}/tokyo/A1320/A132001/{13000000 + i}/" for i in range(args.calls + 1)]
+        scrape(urls[0])
+        seconds = []
+        for url in urls[1:]:
+            start = time.perf_counter()
+            scrape(url)
+            seconds.append(time.perf_counter() - start)
+        results["micro_scrape"] = describe(seconds)
+
+    # DynamoDBのscanの1ページ(1000件)ずつcsvに変換する
+    pages = [[synthetic_item(i) for i in range(start, start + 1000)] for start in range(0, args.rows, 1000)]
+    start = time.perf_counter()
+    num_rows = dump_to_csv(pages, io.StringIO())
+    elapsed = time.perf_counter() - start
+    results["micro_dump_to_csv"] = {"rows": num_rows, "seconds": round(elapsed, 3),
+                                    "rows_per_sec": round(num_rows / elapsed)}
+
+    # Parquetの出力はpyarrowがインストールされている場合のみ計測する
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return results
+    from src.result_parquet import dump_to_parquet
+    start = time.perf_counter()
+    num_rows = dump_to_parquet(pages, io.BytesIO())
+    elapsed = time.perf_counter() - start
+    results["micro_dump_to_parquet"] = {"rows": num_rows, "seconds": round(elapsed, 3),
+                                        "rows_per_sec": round(num_rows / elapsed)}
+    return results
+
+
+def compare(baseline: dict, results: dict, tolerance: float):
+    # 前回の結果と比べ、tolerance以上悪化した指標を返す
+    regressions = []
+    for name, result in results.items():
+        for key, value in result.items():
+            before = baseline.get(name, {}).get(key)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or not before:
+                continue
+            if key.endswith(HIGHER_IS_BETTER):
+                change = value / before - 1
+                worse = change < -tolerance
+            elif key.endswith(LOWER_IS_BETTER):
+                change = value / before - 1
+                worse = change > tolerance
+            else:
+                continue
+            print(f"{name}.{key}: {before} -> {value} ({change:+.1%}){' REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append(f"{name}.{key}")
+    return regressions
+
+
+def get_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スタブサーバーを使ったオフラインのベンチマーク (結果をJSONで保存し、前回と比較する)")
+    parser.add_argument("--output", default="bench-results.json", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比較する前回の結果のJSONファイル (悪化した指標があれば終了コード1)")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="悪化とみなす変化の割合")
+    parser.add_argument("--only", nargs="+", choices=["local", "lambda", "micro"], default=["local", "lambda", "micro"])
+    parser.add_argument("--names", type=int, default=50, help="エンドツーエンドで処理する店名の数")
+    parser.add_argument("--latency", type=float, default=0.05, help="スタブサーバーの応答遅延(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="スタブサーバーが503を返す割合")
+    parser.add_argument("--aws-latency", type=float, default=0.005, help="DynamoDB・SQSのスタブのAPI呼び出しの遅延(秒)")
+    parser.add_argument("--calls", type=int, default=30, help="関数単体の計測の呼び出し回数")
+    parser.add_argument("--rows", type=int, default=20000, help="dump_to_csvの計測の件数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    names = load_names(args.names)
+    results = {}
+    if "local" in args.only:
+        results["e2e_local_sync"] = run_local_main(names, args, [])
+        print(json.dumps({"e2e_local_sync": results["e2e_local_sync"]}, ensure_ascii=False))
+        results["e2e_local_async"] = run_local_main(names, args, ["--async", "--rps", "0", "--workers", "0"])
+        print(json.dumps({"e2e_local_async": results["e2e_local_async"]}, ensure_ascii=False))
+    if "lambda" in args.only:
+        results["e2e_lambda"] = run_lambda_pipeline(names, args)
+        print(json.dumps({"e2e_lambda": results["e2e_lambda"]}, ensure_ascii=False))
+    if "micro" in args.only:
+        for name, result in run_micro(args).items():
+            results[name] = result
+            print(json.dumps({name: result}, ensure_ascii=False))
+
+    document = {"revision": get_revision(), "python": platform.python_version(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args), "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+    print(f"saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
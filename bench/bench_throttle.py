@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR)
+from bench.stub_server import StubTabelogServer  # noqa: E402
+from src import http_client  # noqa: E402
+from src import rate_limit  # noqa: E402
+from src import throttle  # noqa: E402
+
+# 適応制御の設定 (ベンチマークが短く終わるよう待ち時間を短くする)
+ADAPTIVE_ENV = {"FETCH_INTERVAL": "0", "THROTTLE_BACKOFF": "0.5", "THROTTLE_MAX_WAIT": "10",
+                "CIRCUIT_COOLDOWN": "2", "CIRCUIT_MAX_COOLDOWN": "10", "HTML_CACHE_DIR": ""}
+# 食べログのスタブサーバーのブロックの仕方
+SCENARIOS = {
+    # 1秒あたり20リクエストを超えると429 (Retry-After: 1)
+    "rate_limit_429": {"block_rps": 20, "block_status": 429, "retry_after": 1},
+    # 1秒あたり20リクエストを超えるとcaptchaのページを200で返す
+    "captcha": {"block_rps": 20, "block_status": 200},
+    # 起動から5秒間はすべてのリクエストに503 (Retry-Afterなし)
+    "outage_503": {"block_for": 5, "block_status": 503},
+}
+
+
+def create_fixed_retry_session():
+    # 変更前の方式: リクエストごとに固定回数リトライする (429・503も対象。他のリクエストとは連携しない)
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[429, 500, 502, 503, 504])
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retries))
+    return session
+
+
+def run(mode: str, scenario: str, num_urls: int, concurrency: int, latency: float):
+    for key, value in ADAPTIVE_ENV.items():
+        os.environ[key] = value
+    http_client._session = None
+    rate_limit._limiter = None
+    rate_limit._global_limiter = None
+    throttle._controller = None
+    fixed_session = create_fixed_retry_session() if mode == "fixed_retry" else None
+
+    def fetch(url: str):
+        # 戻り値: ok (通常のページ), bad_page (ブロックのページを通常のページとして受け取った), parked, dropped
+        try:
+            if fixed_session is not None:
+                response = fixed_session.get(url, timeout=10)
+                response.raise_for_status()
+                content = response.content
+            else:
+                content = http_client.fetch(url)
+        except throttle.BlockedError:
+            return "parked"
+        except Exception:
+            return "dropped"
+        return "bad_page" if throttle.detect_block(200, content) else "ok"
+
+    with StubTabelogServer(latency=latency, **SCENARIOS[scenario]) as server:
+        urls = [f"{server.origin}/tokyo/A1320/A132001/{13000000 + i}/" for i in range(num_urls)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(fetch, urls))
+        elapsed = time.perf_counter() - start
+    result = {"mode": mode, "scenario": scenario, "urls": num_urls, "seconds": round(elapsed, 2),
+              "requests": server.num_requests, "blocked_responses": server.num_blocked}
+    for status in ["ok", "bad_page", "parked", "dropped"]:
+        result[status] = results.count(status)
+    if mode == "adaptive":
+        result["throttle"] = throttle.get_controller().snapshot()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ブロックされた場合の適応制御 (AIMD・サーキットブレーカー) と固定回数のリトライの比較")
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="スタブサーバーの応答遅延(秒)")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    for scenario in args.scenarios:
+        for mode in ["fixed_retry", "adaptive"]:
+            print(json.dumps(run(mode, scenario, args.urls, args.concurrency, args.latency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import gzip
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# 実際の食べログのページは口コミ・写真・ナビゲーションで数百KBになるため、
+# 抽出対象外の要素を埋めて実ページに近いサイズ・ノード数にする
+NAV_ITEM = ('<li class="p-header-nav__item"><a class="p-header-nav__target" href="/area/{i}/">'
+            '<span class="p-header-nav__label">エリア{i}</span></a></li>')
+REVIEW_ITEM = ('<div class="rvw-item js-rvw-item-clickable-area">'
+               '<div class="rvw-item__rvwr-data"><p class="rvw-item__rvwr-name"><a href="/rvwr/{i}/">'
+               '<span>ユーザー{i}</span></a></p><p class="rvw-item__rvwr-count">口コミ {i}件</p></div>'
+               '<div class="rvw-item__contents"><ul class="rvw-item__ratings">'
+               '<li class="rvw-item__ratings-item"><span class="c-rating-v3__val">3.{i2}</span></li></ul>'
+               '<div class="rvw-item__rvw-comment"><p class="rvw-item__title">また来たいお店 {i}</p>'
+               '<p>料理も雰囲気も良く、スタッフの対応も丁寧でした。<br>次回はコースで利用したいです。</p></div>'
+               '<ul class="rvw-photo__list">'
+               '<li class="rvw-photo__list-item"><img class="c-img" src="/photo/{i}/1.jpg" alt=""></li>'
+               '<li class="rvw-photo__list-item"><img class="c-img" src="/photo/{i}/2.jpg" alt=""></li>'
+               '</ul></div></div>')
+FOOTER_ITEM = ('<li class="l-footer__link-item"><a class="l-footer__link-target" href="/keywords/{i}/">'
+               'キーワード{i}</a></li>')
+
+
+def _filler(template: str, count: int, tag: str):
+    items = ''.join([template.format(i=i, i2=i % 10) for i in range(count)])
+    return f'<{tag}>{items}</{tag}>'
+
+
+def load_page(file_name: str, num_reviews: int = 150):
+    with open(os.path.join(FIXTURE_DIR, file_name), encoding="utf-8") as f:
+        page = f.read()
+    page = page.replace("<!-- filler:nav -->", _filler(NAV_ITEM, 80, "ul"))
+    page = page.replace("<!-- filler:reviews -->", _filler(REVIEW_ITEM, num_reviews, "div"))
+    page = page.replace("<!-- filler:footer -->", _filler(FOOTER_ITEM, 200, "ul"))
+    return page.encode("utf-8")
+
+
+def load_detail_pages():
+    return {name: load_page(name)
+            for name in sorted(os.listdir(FIXTURE_DIR)) if name.startswith("detail_")}
+
+
+def load_search_pages():
+    return {name: load_page(name, num_reviews=40)
+            for name in sorted(os.listdir(FIXTURE_DIR)) if name.startswith("search")}
+
+
+def load_saved_pages(paths):
+    # 実際に取得して保存した店舗詳細ページを読み込む (.htmlと、HTML_CACHE_DIRのキャッシュの.html.gz)
+    # キャッシュは1行目がURLと取得日時のため読み飛ばす (検索結果ページは除く)
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, _, names in os.walk(path):
+                files.extend(os.path.join(dir_path, name) for name in sorted(names))
+        else:
+            files.append(path)
+    pages = {}
+    for file_path in files:
+        if file_path.endswith(".html.gz"):
+            with gzip.open(file_path, "rb") as f:
+                url = f.readline().decode("utf-8").split("\t")[0]
+                content = f.read()
+            if "/rstLst/" in url:
+                continue
+        elif file_path.endswith(".html"):
+            with open(file_path, "rb") as f:
+                content = f.read()
+        else:
+            continue
+        pages[os.path.basename(file_path)] = content
+    return pages
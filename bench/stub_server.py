@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import zlib
+import random
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench.pages import load_detail_pages, load_search_pages  # noqa: E402
+
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+# 200で返されるアクセス制限のページ
+BLOCK_PAGE = ('<html><body><p>アクセスが集中しております。</p>'
+              '<div class="g-recaptcha"></div></body></html>').encode()
+# 店舗詳細ページの構造が変わったページ (抽出に必要な要素がないため、何度取得しても処理できない)
+MALFORMED_PAGE = '<html><body><p>この店舗のページは移転しました。</p></body></html>'.encode()
+
+
+class StubTabelogServer:
+    # 保存済みのHTMLを返す食べログのスタブサーバー
+    # latency: 1リクエストあたりの応答遅延(秒)
+    # validators: ETag・Last-Modifiedを返し、条件付きリクエストに304で応答する
+    # error_rate: 503を返すリクエストの割合 (seedで再現できる)
+    # unique_listings: 検索クエリごとに一覧の店舗URLを変え、店名ごとに別の店舗詳細ページを取得させる
+    # block_rps: 直近1秒のリクエスト数がこれを超えたらブロックする (0の場合はブロックしない)
+    # block_for: 起動してからこの秒数の間はすべてのリクエストをブロックする (一時的なアクセス制限)
+    # block_status: ブロックするときのステータス (429, 503, 200の場合はcaptchaのページ)
+    # retry_after: ブロックするときに返すRetry-After(秒) (Noneの場合は返さない)
+    # malformed_rate: 構造が変わったページを返す店舗詳細ページの割合 (パスごとに決まり、毎回同じページを返す)
+    def __init__(self, latency: float = 0.0, port: int = 0, validators: bool = True, error_rate: float = 0.0,
+                 unique_listings: bool = False, seed: int = 0, block_rps: float = 0.0, block_for: float = 0.0,
+                 block_status: int = 429, retry_after: int = None, malformed_rate: float = 0.0):
+        self.latency = latency
+        self.validators = validators
+        self.error_rate = error_rate
+        self.unique_listings = unique_listings
+        self.block_rps = block_rps
+        self.block_status = block_status
+        self.retry_after = retry_after
+        self.malformed_rate = malformed_rate
+        self.block_until = time.monotonic() + block_for
+        self.recent = collections.deque()
+        self.num_blocked = 0
+        self.random = random.Random(seed)
+        self.detail_pages = list(load_detail_pages().values())
+        self.search_page = list(load_search_pages().values())[0]
+        self.num_requests = 0
+        self.num_not_modified = 0
+        self.num_errors = 0
+        self.num_malformed = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self.server.daemon_threads = True
+        self.origin = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = None
+
+    def _rewrite(self, page: bytes):
+        # ページ内のリンクをスタブサーバーに向ける
+        return page.replace(b"https://tabelog.com", self.origin.encode())
+
+    def _is_blocked(self):
+        # stub.lockを持った状態で呼ぶ
+        now = time.monotonic()
+        self.recent.append(now)
+        while self.recent[0] < now - 1:
+            self.recent.popleft()
+        return now < self.block_until or (self.block_rps > 0 and len(self.recent) > self.block_rps)
+
+    def is_malformed(self, path: str):
+        return zlib.crc32(path.encode()) % 10000 < self.malformed_rate * 10000
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub.lock:
+                    stub.num_requests += 1
+                    is_error = stub.error_rate > 0 and stub.random.random() < stub.error_rate
+                    if is_error:
+                        stub.num_errors += 1
+                    is_blocked = stub._is_blocked()
+                    if is_blocked:
+                        stub.num_blocked += 1
+                if stub.latency > 0:
+                    time.sleep(stub.latency)
+                if is_blocked:
+                    body = BLOCK_PAGE if stub.block_status == 200 else b""
+                    self.send_response(stub.block_status)
+                    if stub.retry_after is not None:
+                        self.send_header("Retry-After", str(stub.retry_after))
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if is_error:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.path.startswith("/rstLst/"):
+                    body = stub._rewrite(stub.search_page)
+                    if stub.unique_listings:
+                        # 店舗URLのエリアの部分をクエリのハッシュに置き換える
+                        area = f"/A{zlib.crc32(self.path.encode()) % 1000000:06d}/".encode()
+                        body = body.replace(b"/A132001/", area)
+                elif stub.is_malformed(self.path):
+                    with stub.lock:
+                        stub.num_malformed += 1
+                    body = MALFORMED_PAGE
+                else:
+                    index = zlib.crc32(self.path.encode()) % len(stub.detail_pages)
+                    body = stub._rewrite(stub.detail_pages[index])
+                etag = f'"{zlib.crc32(body):08x}"'
+                if stub.validators and self.headers.get("If-None-Match") == etag:
+                    with stub.lock:
+                        stub.num_not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if stub.validators:
+                    self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", LAST_MODIFIED)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def search_url(self):
+        return f"{self.origin}/rstLst/?"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
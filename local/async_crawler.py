@@ -0,0 +1,229 @@
+import os
+import sys
+import time
+import asyncio
+import urllib.parse
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src import html_cache  # noqa: E402
+from src import metrics  # noqa: E402
+from src.extractor import build_search_url, listing_to_url_info  # noqa: E402
+from src.throttle import (BlockedError, CircuitOpenError, detect_block, get_controller, get_max_retries,  # noqa: E402
+                          parse_retry_after)
+from extract_pool import ExtractionPool, extract_rst_data_from_bytes, extract_search_page_from_bytes  # noqa: E402
+
+
+class TokenBucket:
+    # rate: 1秒あたりに補充するトークン数, capacity: バースト可能なリクエスト数
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        # ロックを持ったまま待つことで、待っているリクエストを到着順に通す
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostRateLimiter:
+    # ホストごとにトークンバケットを持つ (rpsが0以下の場合は制限しない)
+    def __init__(self, rps: float, burst: float = 1):
+        self.rps = rps
+        self.burst = burst
+        self.buckets = {}
+
+    async def acquire(self, url: str):
+        if self.rps <= 0:
+            return
+        host = urllib.parse.urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rps, self.burst)
+        await self.buckets[host].acquire()
+
+
+async def acquire(controller):
+    # AdaptiveController.acquireのasyncio版
+    # 同時実行数の枠が空くまでイベントループを止めずに待ち、送ってよい時刻まで眠る
+    while not controller.try_enter():
+        await asyncio.sleep(0.05)
+    try:
+        delay = controller.reserve()
+    except BlockedError:
+        controller.leave()
+        raise
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def fetch(client: httpx.AsyncClient, limiter: HostRateLimiter, url: str):
+    # HTMLキャッシュが有効な場合はキャッシュを優先する
+    content = html_cache.get(url)
+    if content is not None:
+        metrics.count("html_cache_hits")
+        return content
+    if html_cache.is_offline():
+        raise html_cache.CacheMissError(url)
+
+    # ブロックされた場合の扱いはsrc.http_clientと同じ (頻度と同時実行数を下げ、待ってから送り直す)
+    controller = get_controller()
+    for attempt in range(get_max_retries() + 1):
+        with metrics.timer("rate_limit_wait"):
+            await acquire(controller)
+            try:
+                await limiter.acquire(url)
+            except BaseException:
+                controller.leave()
+                raise
+        try:
+            response = await client.get(url)
+        except BaseException:
+            controller.on_error()
+            raise
+        finally:
+            controller.leave()
+        metrics.count("bytes_fetched", len(response.content))
+        reason = detect_block(response.status_code, response.content)
+        if reason is None:
+            controller.on_success()
+            response.raise_for_status()
+            html_cache.put(url, response.content)
+            return response.content
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        controller.on_block(retry_after)
+        metrics.count("http_blocked")
+    raise BlockedError(reason, retry_after, url)
+
+
+def get_cached(store, table_name: str, key: str):
+    # storeに保存済みのアイテムを返す (storeがない場合はNone)
+    item = store.get_item(table_name, key) if store is not None else None
+    if item is not None:
+        metrics.count("db_cache_hits")
+    return item
+
+
+def print_failure(rst_name: str, target: str, error: Exception):
+    print(f"network error occured for {target}, skipping...")
+
+
+async def crawl_one(client: httpx.AsyncClient, limiter: HostRateLimiter, pool: ExtractionPool,
+                    rst_name: str, skip_urls: set, listings: dict, store=None, use_cache: bool = True,
+                    on_failure=print_failure):
+    # (処理済みかどうか, スクレイピング結果) を返す
+    # 通信エラーの場合は未処理として扱い、on_failure(店名, 失敗したURLまたは店名, 例外) を呼ぶ (再開時にもう一度処理する)
+    # サーキットブレーカーが開いている場合はCircuitOpenErrorを送出する
+    # storeを渡した場合、use_cacheがTrueなら保存済みの店名・URLは取得せず、取得した結果はstoreに保存する
+
+    # 店舗詳細URLを取得 (以前の検索結果ページに載っていた店名は検索しない)
+    # パース処理はCPUを使うため、取得したHTMLは抽出用のワーカープロセスに渡す
+    url_info = get_cached(store, "TabelogRstUrl", rst_name) if use_cache else None
+    if url_info is None:
+        # 以前の実行で保存した検索結果ページの店舗も使う (main.pyのget_url_infoと同じ)
+        if use_cache and rst_name not in listings:
+            listing = get_cached(store, "TabelogRstListing", rst_name)
+            if listing is not None:
+                listings.setdefault(rst_name, listing)
+        if rst_name in listings:
+            url_info = listing_to_url_info(listings[rst_name], rst_name)
+        else:
+            try:
+                with metrics.timer("search_fetch"):
+                    content = await fetch(client, limiter, build_search_url(rst_name))
+                with metrics.timer("pool_extract"):
+                    url_info, page_listings = await pool.run(extract_search_page_from_bytes, content, rst_name)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                on_failure(rst_name, rst_name, e)
+                return False, None
+            for listing in page_listings:
+                listings.setdefault(listing["rst_name"], listing)
+                if store is not None:
+                    store.put_item("TabelogRstListing", listing)
+        if store is not None:
+            store.put_item("TabelogRstUrl", url_info)
+
+    # 店舗詳細URLが取得できなかった時・取得済みのURLはスキップ
+    target_url = url_info["url"]
+    if not target_url or target_url in skip_urls:
+        return True, None
+
+    data = get_cached(store, "TabelogRstData", target_url) if use_cache else None
+    if data is not None:
+        return True, data
+    try:
+        with metrics.timer("detail_fetch"):
+            content = await fetch(client, limiter, target_url)
+        with metrics.timer("pool_extract"):
+            data = await pool.run(extract_rst_data_from_bytes, content, target_url)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        on_failure(rst_name, target_url, e)
+        return False, None
+    if store is not None:
+        store.put_item("TabelogRstData", data)
+    return True, data
+
+
+async def crawl(rst_names: list, pool: ExtractionPool, on_result, concurrency: int = 8, rps: float = 1.0,
+                skip_urls: set = frozenset(), store=None, use_cache: bool = True, on_failure=print_failure):
+    # concurrency個のワーカーがキューから店名を取り出して処理する
+    # 結果は保持せず、処理済みの店名ごとに on_result(店名, スクレイピング結果) を呼ぶ
+    queue = asyncio.Queue()
+    for rst_name in rst_names:
+        queue.put_nowait(rst_name)
+
+    limiter = HostRateLimiter(rps)
+    # 検索結果ページに載っていた店舗 (店名 -> 一覧の情報)
+    listings = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=10, follow_redirects=True) as client:
+        async def worker():
+            # キューが空になっても終了せず、全ての店名を処理し終える (queue.join()) まで次の店名を待つ
+            # (サーキットブレーカーが開いて店名をキューに戻した場合も、全てのワーカーで処理を続ける)
+            while True:
+                rst_name = await queue.get()
+                try:
+                    try:
+                        done, data = await crawl_one(client, limiter, pool, rst_name, skip_urls, listings,
+                                                     store=store, use_cache=use_cache, on_failure=on_failure)
+                    except CircuitOpenError as e:
+                        # 食べログにブロックされている間はリクエストを送らずに待ち、店名をキューに戻す
+                        print(f"circuit open, waiting {e.retry_after:.0f}s...")
+                        await asyncio.sleep(e.retry_after)
+                        queue.put_nowait(rst_name)
+                        continue
+                    if done:
+                        on_result(rst_name, data)
+                finally:
+                    queue.task_done()
+
+        # 全ての店名を処理し終えるか、いずれかのワーカーが例外で終了するまで待つ
+        tasks = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        joined = asyncio.ensure_future(queue.join())
+        finished, _ = await asyncio.wait([joined] + tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks + [joined]:
+            task.cancel()
+        await asyncio.gather(*tasks, joined, return_exceptions=True)
+        for task in finished:
+            task.result()
+
+
+def run_crawl(rst_names: list, on_result, concurrency: int = 8, rps: float = 1.0, workers: int = None,
+              skip_urls: set = frozenset(), store=None, use_cache: bool = True, on_failure=print_failure):
+    with ExtractionPool(workers) as pool:
+        asyncio.run(crawl(rst_names, pool, on_result, concurrency=concurrency, rps=rps, skip_urls=skip_urls,
+                          store=store, use_cache=use_cache, on_failure=on_failure))
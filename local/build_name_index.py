@@ -0,0 +1,49 @@
+import os
+import io
+import sys
+import csv
+import argparse
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.dynamodb_utils import parallel_scan  # noqa: E402
+from src.name_index import NameIndex, build_from_items  # noqa: E402
+
+
+def iter_csv_items(file_path: str):
+    # スクレイピング結果のcsv (local/main.py・dump_to_csvの出力) の店名とURLを使う
+    with open(file_path, newline='') as f:
+        for row in csv.DictReader(f):
+            yield {"rst_name": row["店名"], "url": row["URL"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="店名 -> 店舗詳細URL の索引ファイルを作る (NAME_INDEX_PATHで指定して使う)")
+    parser.add_argument("output", help="出力先 (ローカルのパスまたは s3://bucket/key)")
+    parser.add_argument("--table", nargs="*", default=[],
+                        help="店名とURLを読み込むDynamoDBのテーブル (TabelogRstUrl, TabelogRstListing)")
+    parser.add_argument("--csv", nargs="*", default=[], help="店名とURLを読み込むスクレイピング結果のcsv")
+    args = parser.parse_args()
+    if not args.table and not args.csv:
+        parser.error("--table or --csv is required")
+
+    def iter_items():
+        for table_name in args.table:
+            yield from parallel_scan(table_name)
+        for file_path in args.csv:
+            yield from iter_csv_items(file_path)
+
+    index: NameIndex = build_from_items(iter_items())
+    buffer = io.BytesIO()
+    index.dump(buffer)
+    if args.output.startswith("s3://"):
+        bucket, key = args.output[len("s3://"):].split("/", 1)
+        boto3.client("s3").put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+    else:
+        with open(args.output, "wb") as f:
+            f.write(buffer.getvalue())
+    print(f"{len(index)} names, {len(buffer.getvalue())} bytes -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
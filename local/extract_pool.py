@@ -0,0 +1,76 @@
+import os
+import sys
+import asyncio
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.parser import parse_html  # noqa: E402
+from src.extractor import extract_rst_data, extract_url_info, extract_search_listings  # noqa: E402
+
+
+# ワーカープロセスで実行する関数 (pickleできるようにモジュールのトップレベルに置く)
+def extract_search_page_from_bytes(content: bytes, input_rst_name: str):
+    # 店舗詳細URLと、検索結果ページに載っているすべての店舗の一覧を返す
+    html = parse_html(content)
+    return extract_url_info(html, input_rst_name), extract_search_listings(html)
+
+
+def extract_rst_data_from_bytes(content: bytes, url: str):
+    return extract_rst_data(parse_html(content), url)
+
+
+class ExtractionPool:
+    # 取得したHTMLのパース・抽出を複数プロセスで並列に実行する
+    # workers: ワーカープロセス数 (0の場合は別プロセスを使わない)
+    # max_pending: 処理待ちにできるページ数の上限。上限に達すると取得側を待たせる
+    def __init__(self, workers: int = None, max_pending: int = None):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.max_pending = max_pending or max(self.workers, 1) * 4
+        self.executor = ProcessPoolExecutor(self.workers) if self.workers > 0 else None
+        self.pending = None
+
+    async def run(self, fn, *args):
+        # asyncio用: 処理待ちが上限に達している間は呼び出し側を待たせる
+        if self.pending is None:
+            self.pending = asyncio.Semaphore(self.max_pending)
+        async with self.pending:
+            loop = asyncio.get_running_loop()
+            # workers=0の場合はスレッドで実行してイベントループを止めないようにする
+            return await loop.run_in_executor(self.executor, fn, *args)
+
+    def map(self, fn, args_iter):
+        # 引数を順に投入し、結果を投入順に (引数, 結果, 例外) で返す
+        # 処理待ちがmax_pending件を超えないように、古いものから結果を受け取ってから次を投入する
+        if self.executor is None:
+            for args in args_iter:
+                try:
+                    yield args, fn(*args), None
+                except Exception as e:
+                    yield args, None, e
+            return
+
+        queue = collections.deque()
+        for args in args_iter:
+            if len(queue) >= self.max_pending:
+                yield self._result(*queue.popleft())
+            queue.append((args, self.executor.submit(fn, *args)))
+        while queue:
+            yield self._result(*queue.popleft())
+
+    @staticmethod
+    def _result(args, future):
+        try:
+            return args, future.result(), None
+        except Exception as e:
+            return args, None, e
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -1,293 +1,256 @@
-import urllib.parse
+import os
 import sys
-import csv
+import argparse
 import datetime
 import time
-import requests
-from requests.packages.urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
-from bs4 import BeautifulSoup
 
+# src配下の共通モジュールを使うためリポジトリのルートをパスに追加
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src import html_cache  # noqa: E402
+from src import metrics  # noqa: E402
+from src.http_client import fetch, get_connection_stats  # noqa: E402
+from src.parser import PARSERS, parse_html  # noqa: E402
+from src.extractor import (build_search_url, extract_rst_data, extract_url_info, extract_search_listings,  # noqa: E402
+                           is_search_url, listing_to_url_info)
+from src.result_csv import CsvResultWriter, RetryQueue, load_progress  # noqa: E402
+from src.result_parquet import ParquetResultWriter  # noqa: E402
+from src.sqlite_store import SqliteStore  # noqa: E402
+from src.throttle import CircuitOpenError, get_controller  # noqa: E402
+from extract_pool import ExtractionPool, extract_rst_data_from_bytes  # noqa: E402
 
-def create_request_session():
-    # 5回リトライ、リトライ毎に待ち時間を1秒追加
-    session = requests.Session()
-    retries = Retry(total=5, backoff_factor=1,
-                    status_forcelist=[500, 502, 503, 504])
-    session.mount('https://', HTTPAdapter(max_retries=retries))
-    session.mount('http://', HTTPAdapter(max_retries=retries))
-    return session
 
+# 検索結果ページに載っていた店舗 (店名 -> 一覧の情報)
+# 同じページに載っていた店名は検索せずにURLを答える
+listings = {}
+# --dbを指定した場合の結果の保存先 (SqliteStore)
+store = None
+
+
+def get_url_info(input_rst_name: str, use_cache: bool = True):
+    # use_cacheがTrueの場合は保存済みの店名は検索しない
+    if store is not None and use_cache:
+        url_info = store.get_item("TabelogRstUrl", input_rst_name)
+        if url_info is not None:
+            metrics.count("db_cache_hits")
+            return url_info
+        # 以前の検索結果ページに載っていた店名も検索しない
+        listing = store.get_item("TabelogRstListing", input_rst_name)
+        if listing is not None:
+            listings.setdefault(input_rst_name, listing)
+    url_info = search_url_info(input_rst_name)
+    if store is not None:
+        store.put_item("TabelogRstUrl", url_info)
+    return url_info
+
+
+def search_url_info(input_rst_name: str):
+    if input_rst_name in listings:
+        return listing_to_url_info(listings[input_rst_name], input_rst_name)
 
-def get_url_info(input_rst_name: str):
     # 検索URLの生成
-    query: str = urllib.parse.urlencode({'sw': input_rst_name})
-    base_url: str = 'https://tabelog.com/rstLst/?'
-    search_url: str = base_url + query
-
-    session = create_request_session()
-    html = BeautifulSoup(session.request(
-        'GET', search_url, timeout=10).content, 'html5lib')
-
-    # 検索結果の1ページ目に店名が完全一致の結果があればそれを使う
-    if html.find("a", string=input_rst_name):
-        name_tag = html.find("a", string=input_rst_name)
-    # 店名が完全一致の結果がない場合は検索結果の一番上のものを取得
-    else:
-        name_tag = html.find("a", class_="list-rst__rst-name-target")
-
-    return {"input_rst_name": input_rst_name,
-            "rst_name": str(name_tag.string if name_tag else ""),
-            "url": str(name_tag.get('href') if name_tag else ""),
-            "is_matched_name": input_rst_name == str(name_tag.string if name_tag else ""),
-            "created_at": datetime.datetime.now().isoformat()}
-
-
-def scrape(url: str):
-    session = create_request_session()
-    html = BeautifulSoup(session.request(
-        'GET', url, timeout=10).content, "html5lib")
-
-    rstinfo_table = html.find("div", class_="rstinfo-table")
-
-    def filter_booking_inquiry(tag):
-        if tag.name == 'th' and tag.get_text(strip=True) == '予約・お問い合わせ':
-            return True
-        return False
-
-    def filter_business_hours(tag):
-        if tag.name == 'th' and tag.get_text(strip=True) == '営業時間・定休日':
-            return True
-        return False
-
-    def filter_service_charge(tag):
-        if tag.name == 'th' and tag.get_text(strip=True) == 'サービス料・チャージ':
-            return True
-        return False
-
-    def get_pr_comment():
-        if html.find("div", class_="pr-comment") is None:
-            return ""
-        return '\n'.join([x for x in html.find("div", class_="pr-comment").stripped_strings])
-
-    def get_data_from_table(key: str):
-        # キーが存在しない場合には空文字
-        if rstinfo_table.find("th", string=key) is None:
-            return ""
-        return '\n'.join([x for x in rstinfo_table.find("th", string=key).find_next("td").stripped_strings])
-
-    def get_data_from_table_by_filter(filter):
-        # キーが存在しない場合には空文字
-        if rstinfo_table.find(filter) is None:
-            return ""
-        return '\n'.join([x for x in rstinfo_table.find(filter).find_next("td").stripped_strings])
-
-    def get_sns_url(sns_name: str):
-        # 公式アカウントキーが存在しない場合は空文字
-        th_tag = rstinfo_table.find("th", string="公式アカウント")
-        if th_tag is None:
-            return ""
-        # 該当のsnsアカウントが存在しない場合は空文字
-        a_tag = th_tag.find_next("td").find(
-            "a", class_=f"rstinfo-sns-{sns_name}")
-        if a_tag is None:
-            return ""
-        return a_tag.get("href")
-
-    return {
-        "url": url,
-        "name": str(html.find("h2", class_="display-name").find("span").get_text(strip=True)),
-        "has_official_badge": html.find("p", class_="owner-badge__icon") is not None,
-        "score": str(html.find("span", class_="rdheader-rating__score-val-dtl").string),
-        "num_reviews": str(html.find("span", class_="rdheader-rating__review-target").find("em").string),
-        "num_bookmarks": str(html.find("span", class_="rdheader-rating__hozon-target").find("em").string),
-        "nearest_station": str(html.find("dl", class_="rdheader-subinfo__item--station").find("span", class_="linktree__parent-target-text").string if html.find("dl", class_="rdheader-subinfo__item--station") is not None else ""),
-        "genre": str(rstinfo_table.find("th", string="ジャンル").find_next("td").find("span").string),
-        "budget_dinner": str(html.find("p", class_="rdheader-budget__icon--dinner").find("a", class_="rdheader-budget__price-target").string),
-        "budget_lunch": str(html.find("p", class_="rdheader-budget__icon--lunch").find("a", class_="rdheader-budget__price-target").string),
-        "regular_holiday": str(html.find("dd", class_="rdheader-subinfo__closed-text").get_text(strip=True) if html.find("dd", class_="rdheader-subinfo__closed-text") is not None else ""),
-        "is_serve_takeout": html.find("div", class_="rstdtl-takeout-info") is not None,
-        "pr_title": str(html.find("h3", class_="pr-comment-title").string if html.find("h3", class_="pr-comment-title") else ""),
-        "pr-comment": get_pr_comment(),
-        "kodawari": '\n'.join([x.get_text(strip=True) for x in html.find_all("p", class_="rstdtl-top-kodawari__title")]),
-        "hygiene": '、'.join([x.get_text(strip=True) for x in html.find("div", class_="rstdtl-hygiene").find_all("p", class_="rstdtl-hygiene__data")]) if html.find("div", class_="rstdtl-hygiene") else "",
-        "top-course": '、'.join([x.text for x in html.find_all("span", class_="rstdtl-course-list__price-num")]),
-        "coupon": '、'.join([x.text for x in html.find_all("p", class_="rstdtl-rstinfo-coupon__description")]),
-        "booking_inquiry": get_data_from_table_by_filter(filter_booking_inquiry),
-        "booking_availability": get_data_from_table(key="予約可否"),
-        "address": str(rstinfo_table.find("th", string="住所").find_next("td").find("p", class_="rstinfo-table__address").text),
-        "transportation": get_data_from_table(key="交通手段"),
-        "business_hours": get_data_from_table_by_filter(filter_business_hours),
-        "payment_method": get_data_from_table(key="支払い方法"),
-        "service_charge": get_data_from_table_by_filter(filter_service_charge),
-        "num_seat": get_data_from_table(key="席数"),
-        "num_max_booking": get_data_from_table(key="最大予約可能人数"),
-        "private_room": get_data_from_table(key="個室"),
-        "charter": get_data_from_table(key="貸切"),
-        "smoking": get_data_from_table(key="禁煙・喫煙"),
-        "parking": get_data_from_table(key="駐車場"),
-        "space_equipment": get_data_from_table(key="空間・設備"),
-        "mobile_phone": get_data_from_table(key="携帯電話"),
-        "course": get_data_from_table(key="コース"),
-        "drink": get_data_from_table(key="ドリンク"),
-        "cuisine": get_data_from_table(key="料理"),
-        "go_to_eat": get_data_from_table(key="Go To Eat"),
-        "scene": get_data_from_table(key="利用シーン"),
-        "location": get_data_from_table(key="ロケーション"),
-        "service": get_data_from_table(key="サービス"),
-        "with_children": get_data_from_table(key="お子様連れ"),
-        "homepage": get_data_from_table(key="ホームページ"),
-        "twitter": get_sns_url(sns_name="twitter"),
-        "instagram": get_sns_url(sns_name="instagram"),
-        "facebook": get_sns_url(sns_name="facebook"),
-        "opening_date": get_data_from_table(key="オープン日"),
-        "telephone": get_data_from_table(key="電話番号"),
-        "other": get_data_from_table(key="備考"),
-        "has_google_ad": html.find("aside", class_="rstdtl-side-banner") is not None,
-        "created_at": datetime.datetime.now().isoformat()
-    }
-
-
-def dump_to_csv(data: list, file_path: str):
-    fieldnames = ["URL",
-                  "店名",
-                  "公式マーク有無",
-                  "食べログスコア",
-                  "レビュー数",
-                  "ブックマーク数",
-                  "最寄り駅",
-                  "ジャンル",
-                  "予算（昼）",
-                  "予算（夜）",
-                  "定休日",
-                  "テイクアウト実施有無",
-                  "PRタイトル",
-                  "PRコメント",
-                  "こだわり",
-                  "感染症対策",
-                  "コース料金",
-                  "クーポン",
-                  "予約・問い合わせ",
-                  "予約可否",
-                  "住所",
-                  "交通手段",
-                  "営業時間・定休日",
-                  "支払い方法",
-                  "サービス料・チャージ",
-                  "席数",
-                  "最大予約可能人数",
-                  "個室",
-                  "貸切",
-                  "喫煙・禁煙",
-                  "駐車場",
-                  "空間・設備",
-                  "携帯電話",
-                  "コース",
-                  "ドリンク",
-                  "料理",
-                  "Go to Eat",
-                  "利用シーン",
-                  "ロケーション",
-                  "サービス",
-                  "お子様連れ",
-                  "ホームページ",
-                  "公式アカウント（Twitter）",
-                  "公式アカウント（Instagram）",
-                  "公式アカウント（Facebook）",
-                  "オープン日",
-                  "電話番号",
-                  "備考",
-                  "Google広告表示有無"]
-
-    with open(file_path, 'w') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for da in data:
-            writer.writerow({"URL": da["url"],
-                             "店名": da["name"],
-                             "公式マーク有無": da["has_official_badge"],
-                             "食べログスコア": da["score"],
-                             "レビュー数": da["num_reviews"],
-                             "ブックマーク数": da["num_bookmarks"],
-                             "最寄り駅": da["nearest_station"],
-                             "ジャンル": da["genre"],
-                             "予算（昼）": da["budget_dinner"],
-                             "予算（夜）": da["budget_lunch"],
-                             "定休日": da["regular_holiday"],
-                             "テイクアウト実施有無": da["is_serve_takeout"],
-                             "PRタイトル": da["pr_title"],
-                             "PRコメント": da["pr-comment"],
-                             "こだわり": da["kodawari"],
-                             "感染症対策": da["hygiene"],
-                             "コース料金": da["top-course"],
-                             "クーポン": da["coupon"],
-                             "予約・問い合わせ": da["booking_inquiry"],
-                             "予約可否": da["booking_availability"],
-                             "住所": da["address"],
-                             "交通手段": da["transportation"],
-                             "営業時間・定休日": da["business_hours"],
-                             "支払い方法": da["payment_method"],
-                             "サービス料・チャージ": da["service_charge"],
-                             "席数": da["num_seat"],
-                             "最大予約可能人数": da["num_max_booking"],
-                             "個室": da["private_room"],
-                             "貸切": da["charter"],
-                             "喫煙・禁煙": da["smoking"],
-                             "駐車場": da["parking"],
-                             "空間・設備": da["space_equipment"],
-                             "携帯電話": da["mobile_phone"],
-                             "コース": da["course"],
-                             "ドリンク": da["drink"],
-                             "料理": da["cuisine"],
-                             "Go to Eat": da["go_to_eat"],
-                             "利用シーン": da["scene"],
-                             "ロケーション": da["location"],
-                             "サービス": da["service"],
-                             "お子様連れ": da["with_children"],
-                             "ホームページ": da["homepage"],
-                             "公式アカウント（Twitter）": da["twitter"],
-                             "公式アカウント（Instagram）": da["instagram"],
-                             "公式アカウント（Facebook）": da["facebook"],
-                             "オープン日": da["opening_date"],
-                             "電話番号": da["telephone"],
-                             "備考": da["other"],
-                             "Google広告表示有無": da["has_google_ad"]})
+    search_url: str = build_search_url(input_rst_name)
+
+    with metrics.timer("search_fetch"):
+        content = fetch(search_url)
+    html = parse_html(content)
+    with metrics.timer("extract"):
+        for listing in extract_search_listings(html):
+            listings.setdefault(listing["rst_name"], listing)
+            if store is not None:
+                store.put_item("TabelogRstListing", listing)
+        return extract_url_info(html, input_rst_name)
+
+
+def scrape(url: str, use_cache: bool = True):
+    # use_cacheがTrueの場合は保存済みのURLはスクレイピングしない
+    if store is not None and use_cache:
+        data = store.get_item("TabelogRstData", url)
+        if data is not None:
+            metrics.count("db_cache_hits")
+            return data
+    with metrics.timer("detail_fetch"):
+        content = fetch(url)
+    html = parse_html(content)
+
+    with metrics.timer("extract"):
+        data = extract_rst_data(html, url)
+    if store is not None:
+        store.put_item("TabelogRstData", data)
+    return data
+
+
+def print_stats():
+    # 段階ごとの処理時間のパーセンタイルを表示し、ボトルネックを確認できるようにする
+    print(f"connection stats: {get_connection_stats()}")
+    print(f"cache stats: {html_cache.stats}")
+    print(f"throttle stats: {get_controller().snapshot()}")
+    print(metrics.get_metrics().format_table())
+
+
+def reextract_from_cache(writer, workers: int = None):
+    # ネットワークにアクセスせず、キャッシュ済みの店舗詳細ページをすべて抽出し直す
+    entries = ((content, url) for url, content in html_cache.iter_entries() if not is_search_url(url))
+    with ExtractionPool(workers) as pool:
+        for (_, url), data, error in pool.map(extract_rst_data_from_bytes, entries):
+            if error is not None:
+                print(f"failed to extract {url}, skipping...")
+                continue
+            writer.write(data)
+
+
+def export_from_db(writer):
+    # データベースに保存済みのすべての店舗のデータを出力する
+    for page in store.iter_pages("TabelogRstData"):
+        for data in page:
+            writer.write(data)
 
 
 def main():
+    global store
+
+    parser = argparse.ArgumentParser(description="食べログスクレイピング (ローカル実行)")
     # インプットの店名は行ごとになっていて、コマンドライン引数から与えられることを想定
-    rst_names = open(sys.argv[1]).read().splitlines()
-    output_file_path = f"scraping-result_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    parser.add_argument("input_file", nargs="?", help="店名を1行ずつ記載したファイル")
+    parser.add_argument("--parser", choices=PARSERS,
+                        help="HTMLパーサー (未指定の場合は環境変数HTML_PARSERまたはlxml)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="複数の店舗を並行してスクレイピングする")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="--async時に同時に処理する店舗数")
+    parser.add_argument("--rps", type=float, default=1.0,
+                        help="--async時のホストごとの最大リクエスト数/秒 (0以下で無制限)")
+    parser.add_argument("--workers", type=int,
+                        help="--async, --reextract時にパース・抽出を行うプロセス数 (デフォルトはCPUコア数、0で別プロセスを使わない)")
+    parser.add_argument("--cache-dir",
+                        help="取得したHTMLを保存するキャッシュディレクトリ (環境変数HTML_CACHE_DIRと同じ)")
+    parser.add_argument("--cache-only", action="store_true",
+                        help="ネットワークにアクセスせず、キャッシュ済みのHTMLのみを使う")
+    parser.add_argument("--reextract", action="store_true",
+                        help="キャッシュ済みのすべての店舗詳細ページを再抽出してcsvに出力する")
+    parser.add_argument("--resume", metavar="CSV_FILE",
+                        help="途中まで出力済みのcsvに追記し、処理済みの店名・URLをスキップして再開する")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="csvへ書き込む間隔(件数)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="出力形式 (parquetはスコア・口コミ数などを数値の列で持つ。pyarrowが必要で、--resumeには対応しない)")
+    parser.add_argument("--db", metavar="SQLITE_FILE",
+                        help="結果をSQLiteに保存し、保存済みの店名・URLは取得せずにデータベースの結果を使う")
+    parser.add_argument("--refresh", action="store_true",
+                        help="--db時に保存済みの結果を使わずに取得し直す (結果はデータベースに上書きする)")
+    parser.add_argument("--export", action="store_true",
+                        help="--dbのデータベースに保存済みのすべての店舗をcsvまたはParquetに出力する")
+    args = parser.parse_args()
+    if args.parser:
+        os.environ["HTML_PARSER"] = args.parser
+    if args.cache_dir:
+        os.environ["HTML_CACHE_DIR"] = args.cache_dir
+    if args.cache_only:
+        os.environ["HTML_CACHE_OFFLINE"] = "1"
+    if (args.cache_only or args.reextract) and not html_cache.is_enabled():
+        parser.error("--cache-only and --reextract require --cache-dir or HTML_CACHE_DIR")
+    if (args.refresh or args.export) and not args.db:
+        parser.error("--refresh and --export require --db")
+    if not args.input_file and not args.reextract and not args.export:
+        parser.error("input_file is required")
+    if args.resume and args.format == "parquet":
+        parser.error("--resume is not supported with --format parquet")
+
+    if args.resume:
+        output_file_path = args.resume
+        done_urls, done_names = load_progress(output_file_path)
+        print(f"resuming {output_file_path}: {len(done_names)} names and {len(done_urls)} urls already done")
+    else:
+        output_file_path = f"scraping-result_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{args.format}"
+        done_urls, done_names = set(), set()
+    if args.format == "parquet":
+        writer = ParquetResultWriter(output_file_path)
+    else:
+        writer = CsvResultWriter(output_file_path, append=bool(args.resume), batch_size=args.batch_size)
+
+    if args.db:
+        store = SqliteStore(args.db)
+
+    if args.export:
+        with store, writer:
+            export_from_db(writer)
+        print(f"exported {writer.num_rows} rows from {args.db} to {output_file_path}")
+        return
 
-    scrape_data = []
-    for i, rst_name in enumerate(rst_names):
+    if args.reextract:
+        with writer:
+            reextract_from_cache(writer, workers=args.workers)
+        print(f"re-extracted {writer.num_rows} pages from cache")
+        return
+
+    rst_names = [x for x in open(args.input_file).read().splitlines() if x not in done_names]
+    use_cache = not args.refresh
+    # 失敗した店名は<出力ファイル名>.retryに記録し、再実行時の入力ファイルにできるようにする
+    retry_queue = RetryQueue(output_file_path)
+
+    def on_result(rst_name: str, data: dict):
+        # スクレイピング結果はメモリに溜めずにcsvへ書き込む
+        if data is None:
+            writer.mark_done(rst_name)
+            return
+        print(data)
+        writer.write(data, rst_name)
+        done_urls.add(data["url"])
+
+    def on_failure(rst_name: str, target: str, error: Exception):
+        print(f"network error occured for {target}, skipping... ({error})")
+        retry_queue.add(rst_name)
+        metrics.count("retry_queued")
+
+    def process(rst_name: str):
+        # サーキットブレーカーが開いている場合はCircuitOpenErrorを送出する (リトライキューには入れない)
         # 店舗詳細URLを取得
         try:
-            url_info = get_url_info(input_rst_name=rst_name)
-        except:
-            print(f"network error occured for {rst_name}, skipping...")
-            continue
+            url_info = get_url_info(input_rst_name=rst_name, use_cache=use_cache)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            on_failure(rst_name, rst_name, e)
+            return
 
-        # 店舗詳細URLが取得できなかった時はスキップ
+        # 店舗詳細URLが取得できなかった時・取得済みのURLはスキップ
         target_url = url_info["url"]
-        if not target_url:
-            continue
+        if not target_url or target_url in done_urls:
+            on_result(rst_name, None)
+            return
 
         try:
-            data = scrape(url=target_url)
-        except:
-            print(f"network error occured for {target_url}, skipping...")
-            continue
+            data = scrape(url=target_url, use_cache=use_cache)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            on_failure(rst_name, target_url, e)
+            return
 
-        print(data)
-        scrape_data.append(data)
+        on_result(rst_name, data)
 
-        # # 次のリクエストをする前に少し待機する
-        # if i != len(rst_names) - 1:
-        #     time.sleep(2)
+    if args.use_async:
+        # httpxは並行実行モードでのみ必要なため、ここでimportする
+        from async_crawler import run_crawl
+        with writer:
+            run_crawl(rst_names, on_result, concurrency=args.concurrency, rps=args.rps, workers=args.workers,
+                      skip_urls=done_urls, store=store, use_cache=use_cache, on_failure=on_failure)
+    else:
+        with writer:
+            for rst_name in rst_names:
+                while True:
+                    try:
+                        process(rst_name)
+                        break
+                    except CircuitOpenError as e:
+                        # 食べログにブロックされている間はリクエストを送らずに待ち、同じ店名からやり直す
+                        print(f"circuit open, waiting {e.retry_after:.0f}s...")
+                        time.sleep(e.retry_after)
 
-    # csvファイルにダンプ
-    dump_to_csv(data=scrape_data, file_path=output_file_path)
+    if store is not None:
+        store.close()
+    if retry_queue.num_names:
+        print(f"{retry_queue.num_names} names failed and were saved to {retry_queue.file_path}")
+    print_stats()
 
 
 if __name__ == "__main__":
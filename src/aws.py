@@ -0,0 +1,34 @@
+import threading
+
+# boto3のclient・resourceを最初に使うときに作る
+# boto3の読み込み(約0.2秒)とclientの作成をインポート時に行わず、Lambdaのコールドスタートを短くする
+# キャッシュされたページのみを扱う呼び出しや、使わないハンドラーではboto3を読み込まない
+
+
+class LazyClient:
+    def __init__(self, service_name: str, resource: bool = False):
+        self.service_name = service_name
+        self.resource = resource
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    factory = boto3.resource if self.resource else boto3.client
+                    self._client = factory(self.service_name)
+        return self._client
+
+    def __getattr__(self, name):
+        # client・resourceのメソッド・属性 (Table, send_message_batch, exceptions など) をそのまま渡す
+        return getattr(self.get(), name)
+
+
+def client(service_name: str):
+    return LazyClient(service_name)
+
+
+def resource(service_name: str):
+    return LazyClient(service_name, resource=True)
@@ -0,0 +1,117 @@
+import os
+import time
+import queue
+import threading
+from src import metrics
+
+# ページを受け渡すキューの上限 (セグメント数 x この値)
+# 呼び出し側の処理が遅い場合にscanを待たせ、メモリにページを溜め込まないようにする
+QUEUE_PAGES_PER_SEGMENT = 2
+_DONE = object()
+
+
+def create_table(table_name: str):
+    # boto3のresourceはスレッドセーフではないため、スレッドごとにセッションから作る
+    import boto3
+    return boto3.session.Session().resource("dynamodb").Table(table_name)
+
+
+def get_total_segments():
+    return int(os.environ.get("SCAN_TOTAL_SEGMENTS", "4"))
+
+
+def scan_segment_pages(table, **scan_kwargs):
+    response = table.scan(**scan_kwargs)
+    yield response['Items']
+    # レスポンスに LastEvaluatedKey が含まれなくなるまでループ処理を実行する
+    while 'LastEvaluatedKey' in response:
+        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'], **scan_kwargs)
+        yield response['Items']
+
+
+def parallel_scan_pages(table_name: str, total_segments: int = None, max_workers: int = None, **scan_kwargs):
+    # テーブルをtotal_segments個のセグメントに分けて並列にscanし、取得したページから順に返す
+    total_segments = total_segments or get_total_segments()
+    if total_segments <= 1:
+        yield from scan_segment_pages(create_table(table_name), **scan_kwargs)
+        return
+
+    max_workers = min(max_workers or total_segments, total_segments)
+    pages = queue.Queue(maxsize=total_segments * QUEUE_PAGES_PER_SEGMENT)
+    segments = queue.Queue()
+    for segment in range(total_segments):
+        segments.put(segment)
+    stop = threading.Event()
+
+    def put(item):
+        # 呼び出し側が途中でやめた場合に備えて、待ちながら停止を確認する
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker():
+        table = create_table(table_name)
+        try:
+            while not stop.is_set():
+                try:
+                    segment = segments.get_nowait()
+                except queue.Empty:
+                    break
+                for page in scan_segment_pages(table, Segment=segment, TotalSegments=total_segments, **scan_kwargs):
+                    if not put(page):
+                        return
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max_workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        num_done = 0
+        while num_done < max_workers:
+            page = pages.get()
+            if page is _DONE:
+                num_done += 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def parallel_scan(table_name: str, total_segments: int = None, max_workers: int = None, **scan_kwargs):
+    # parallel_scan_pagesをアイテム単位で返す
+    for page in parallel_scan_pages(table_name, total_segments, max_workers, **scan_kwargs):
+        yield from page
+
+
+def batch_get_items(dynamodb, table_name: str, key_name: str, keys, max_retries: int = 5):
+    # BatchGetItemでまとめて取得し、キーの値 -> アイテム の辞書を返す
+    # (1回のリクエストは100件まで。重複したキーはエラーになるため取り除く)
+    keys = list(dict.fromkeys(keys))
+    items = {}
+    for start in range(0, len(keys), 100):
+        request = {table_name: {"Keys": [{key_name: key} for key in keys[start:start + 100]]}}
+        for attempt in range(max_retries + 1):
+            if attempt > 0:
+                # 処理されなかったキーはスループット超過のため、少し待ってから再取得する
+                time.sleep(0.05 * 2 ** (attempt - 1))
+            with metrics.timer("db_read"):
+                response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response["Responses"].get(table_name, []):
+                items[item[key_name]] = item
+            request = response.get("UnprocessedKeys") or {}
+            if not request:
+                break
+        else:
+            raise RuntimeError(f"failed to get {len(request[table_name]['Keys'])} items from {table_name}")
+    return items
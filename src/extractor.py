@@ -0,0 +1,208 @@
+import os
+import datetime
+import urllib.parse
+
+DEFAULT_SEARCH_URL = "https://tabelog.com/rstLst/?"
+
+# ページ全体を1回だけ走査して集める要素 (タグ名, クラス名)
+# 最初に見つかった要素のみを保持する
+FIRST_SELECTORS = {
+    ("div", "rstinfo-table"),
+    ("h2", "display-name"),
+    ("p", "owner-badge__icon"),
+    ("span", "rdheader-rating__score-val-dtl"),
+    ("span", "rdheader-rating__review-target"),
+    ("span", "rdheader-rating__hozon-target"),
+    ("dl", "rdheader-subinfo__item--station"),
+    ("p", "rdheader-budget__icon--dinner"),
+    ("p", "rdheader-budget__icon--lunch"),
+    ("dd", "rdheader-subinfo__closed-text"),
+    ("div", "rstdtl-takeout-info"),
+    ("h3", "pr-comment-title"),
+    ("div", "pr-comment"),
+    ("div", "rstdtl-hygiene"),
+    ("aside", "rstdtl-side-banner"),
+}
+# 出現する要素をすべて保持する
+ALL_SELECTORS = {
+    ("p", "rstdtl-top-kodawari__title"),
+    ("span", "rstdtl-course-list__price-num"),
+    ("p", "rstdtl-rstinfo-coupon__description"),
+}
+
+
+def collect_tags(html):
+    # find()を何十回も呼ぶとその度に木全体を走査するため、1回の走査でまとめて集める
+    from bs4 import Tag
+    first = {}
+    found_all = {selector: [] for selector in ALL_SELECTORS}
+    for tag in html.descendants:
+        if not isinstance(tag, Tag):
+            continue
+        classes = tag.attrs.get("class")
+        if not classes:
+            continue
+        for class_name in classes:
+            selector = (tag.name, class_name)
+            if selector in FIRST_SELECTORS:
+                first.setdefault(selector, tag)
+            elif selector in found_all:
+                found_all[selector].append(tag)
+    return first, found_all
+
+
+def index_table(rstinfo_table):
+    # thのラベル -> thのインデックスを作る (同じラベルは最初のものを使う)
+    # exact: th.stringが完全に一致するもの (find("th", string=key)と同じ。子要素を含むthは対象外)
+    # stripped: <br>などの子要素を含めたテキストの前後の空白を取り除いたもの
+    exact = {}
+    stripped = {}
+    for th in rstinfo_table.find_all("th"):
+        if th.string is not None:
+            exact.setdefault(str(th.string), th)
+        stripped.setdefault(th.get_text(strip=True), th)
+    return exact, stripped
+
+
+def build_search_url(input_rst_name: str):
+    # 検索ページのURLは環境変数TABELOG_SEARCH_URLで差し替えられる (ベンチマーク用のスタブサーバーなど)
+    base_url: str = os.environ.get("TABELOG_SEARCH_URL", DEFAULT_SEARCH_URL)
+    query: str = urllib.parse.urlencode({'sw': input_rst_name})
+    return base_url + query
+
+
+def is_search_url(url: str):
+    return 'sw' in urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+
+
+def extract_url_info(html, input_rst_name: str):
+    # 検索結果の1ページ目に店名が完全一致の結果があればそれを使う
+    if html.find("a", string=input_rst_name):
+        name_tag = html.find("a", string=input_rst_name)
+    # 店名が完全一致の結果がない場合は検索結果の一番上のものを取得
+    else:
+        name_tag = html.find("a", class_="list-rst__rst-name-target")
+
+    return {"input_rst_name": input_rst_name,
+            "rst_name": str(name_tag.string if name_tag else ""),
+            "url": str(name_tag.get('href') if name_tag else ""),
+            "is_matched_name": input_rst_name == str(name_tag.string if name_tag else ""),
+            "created_at": datetime.datetime.now().isoformat()}
+
+
+def extract_search_listings(html):
+    # 検索結果ページに載っているすべての店舗の店名・URL・スコア・口コミ数・保存数を返す
+    # 同じページに載っていた店名は、あとから検索せずにURLを答えられる
+    listings = []
+    for cassette in html.find_all("div", class_="list-rst"):
+        name_tag = cassette.find("a", class_="list-rst__rst-name-target")
+        if name_tag is None or not name_tag.get("href"):
+            continue
+        score = cassette.find("span", class_="list-rst__rating-val")
+        num_reviews = cassette.find("em", class_="list-rst__rvw-count-num")
+        num_bookmarks = cassette.find("span", class_="list-rst__save-count-num")
+        listings.append({"rst_name": name_tag.get_text(strip=True),
+                         "url": str(name_tag.get("href")),
+                         "score": score.get_text(strip=True) if score else "",
+                         "num_reviews": num_reviews.get_text(strip=True) if num_reviews else "",
+                         "num_bookmarks": num_bookmarks.get_text(strip=True) if num_bookmarks else "",
+                         "created_at": datetime.datetime.now().isoformat()})
+    return listings
+
+
+def listing_to_url_info(listing: dict, input_rst_name: str):
+    # 検索結果ページの一覧から、extract_url_infoと同じ形式の結果を作る
+    return {"input_rst_name": input_rst_name,
+            "rst_name": listing["rst_name"],
+            "url": listing["url"],
+            "is_matched_name": input_rst_name == listing["rst_name"],
+            "created_at": datetime.datetime.now().isoformat()}
+
+
+def extract_rst_data(html, url: str):
+    first, found_all = collect_tags(html)
+    exact_index, stripped_index = index_table(first[("div", "rstinfo-table")])
+
+    def find_td(key: str, strip: bool = False):
+        # 「予約・<br>お問い合わせ」のように<br>を含むラベルはstrip=Trueで探す
+        th_tag = (stripped_index if strip else exact_index).get(key)
+        if th_tag is None:
+            return None
+        return th_tag.find_next("td")
+
+    def get_data_from_table(key: str, strip: bool = False):
+        # キーが存在しない場合には空文字
+        td_tag = find_td(key, strip)
+        if td_tag is None:
+            return ""
+        return '\n'.join([x for x in td_tag.stripped_strings])
+
+    def get_sns_url(sns_name: str):
+        # 公式アカウントキーが存在しない場合は空文字
+        td_tag = find_td("公式アカウント")
+        if td_tag is None:
+            return ""
+        # 該当のsnsアカウントが存在しない場合は空文字
+        a_tag = td_tag.find("a", class_=f"rstinfo-sns-{sns_name}")
+        if a_tag is None:
+            return ""
+        return a_tag.get("href")
+
+    station = first.get(("dl", "rdheader-subinfo__item--station"))
+    closed_text = first.get(("dd", "rdheader-subinfo__closed-text"))
+    pr_title = first.get(("h3", "pr-comment-title"))
+    pr_comment = first.get(("div", "pr-comment"))
+    hygiene = first.get(("div", "rstdtl-hygiene"))
+
+    return {
+        "url": url,
+        "name": str(first[("h2", "display-name")].find("span").get_text(strip=True)),
+        "has_official_badge": ("p", "owner-badge__icon") in first,
+        "score": str(first[("span", "rdheader-rating__score-val-dtl")].string),
+        "num_reviews": str(first[("span", "rdheader-rating__review-target")].find("em").string),
+        "num_bookmarks": str(first[("span", "rdheader-rating__hozon-target")].find("em").string),
+        "nearest_station": str(station.find("span", class_="linktree__parent-target-text").string if station is not None else ""),
+        "genre": str(find_td("ジャンル").find("span").string),
+        "budget_dinner": str(first[("p", "rdheader-budget__icon--dinner")].find("a", class_="rdheader-budget__price-target").string),
+        "budget_lunch": str(first[("p", "rdheader-budget__icon--lunch")].find("a", class_="rdheader-budget__price-target").string),
+        "regular_holiday": str(closed_text.get_text(strip=True) if closed_text is not None else ""),
+        "is_serve_takeout": ("div", "rstdtl-takeout-info") in first,
+        "pr_title": str(pr_title.string if pr_title else ""),
+        "pr-comment": '\n'.join([x for x in pr_comment.stripped_strings]) if pr_comment is not None else "",
+        "kodawari": '\n'.join([x.get_text(strip=True) for x in found_all[("p", "rstdtl-top-kodawari__title")]]),
+        "hygiene": '、'.join([x.get_text(strip=True) for x in hygiene.find_all("p", class_="rstdtl-hygiene__data")]) if hygiene else "",
+        "top-course": '、'.join([x.text for x in found_all[("span", "rstdtl-course-list__price-num")]]),
+        "coupon": '、'.join([x.text for x in found_all[("p", "rstdtl-rstinfo-coupon__description")]]),
+        "booking_inquiry": get_data_from_table(key="予約・お問い合わせ", strip=True),
+        "booking_availability": get_data_from_table(key="予約可否"),
+        "address": str(find_td("住所").find("p", class_="rstinfo-table__address").text),
+        "transportation": get_data_from_table(key="交通手段"),
+        "business_hours": get_data_from_table(key="営業時間・定休日", strip=True),
+        "payment_method": get_data_from_table(key="支払い方法"),
+        "service_charge": get_data_from_table(key="サービス料・チャージ", strip=True),
+        "num_seat": get_data_from_table(key="席数"),
+        "num_max_booking": get_data_from_table(key="最大予約可能人数"),
+        "private_room": get_data_from_table(key="個室"),
+        "charter": get_data_from_table(key="貸切"),
+        "smoking": get_data_from_table(key="禁煙・喫煙"),
+        "parking": get_data_from_table(key="駐車場"),
+        "space_equipment": get_data_from_table(key="空間・設備"),
+        "mobile_phone": get_data_from_table(key="携帯電話"),
+        "course": get_data_from_table(key="コース"),
+        "drink": get_data_from_table(key="ドリンク"),
+        "cuisine": get_data_from_table(key="料理"),
+        "go_to_eat": get_data_from_table(key="Go To Eat"),
+        "scene": get_data_from_table(key="利用シーン"),
+        "location": get_data_from_table(key="ロケーション"),
+        "service": get_data_from_table(key="サービス"),
+        "with_children": get_data_from_table(key="お子様連れ"),
+        "homepage": get_data_from_table(key="ホームページ"),
+        "twitter": get_sns_url(sns_name="twitter"),
+        "instagram": get_sns_url(sns_name="instagram"),
+        "facebook": get_sns_url(sns_name="facebook"),
+        "opening_date": get_data_from_table(key="オープン日"),
+        "telephone": get_data_from_table(key="電話番号"),
+        "other": get_data_from_table(key="備考"),
+        "has_google_ad": ("aside", "rstdtl-side-banner") in first,
+        "created_at": datetime.datetime.now().isoformat()
+    }
@@ -1,71 +1,161 @@
 import os
-import time
-import datetime
-import requests
-import urllib.parse
-from bs4 import BeautifulSoup
 import json
-import boto3
+import decimal
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from src.http_client import fetch, get_connection_stats, set_deadline
+from src.parser import parse_html
+from src.extractor import build_search_url, extract_url_info, extract_search_listings, listing_to_url_info
+from src.sqs_publisher import PublishError, publish_messages
+from src.dynamodb_utils import batch_get_items
+from src.rate_limit import get_fetch_concurrency, get_global_limiter
+from src.name_index import get_index
+from src.throttle import BlockedError, get_controller, plan_retries
+from src.sqs_batch import SqsBatch, call_or_error
+from src import aws
+from src import metrics
 
-dynamodb = boto3.resource("dynamodb")
-sqs = boto3.client('sqs')
+dynamodb = aws.resource("dynamodb")
+sqs = aws.client('sqs')
 
 
 def get_url_info(input_rst_name: str):
-    query: str = urllib.parse.urlencode({'sw': input_rst_name})
-    base_url: str = 'https://tabelog.com/rstLst/?'
-    search_url: str = base_url + query
-    html = BeautifulSoup(requests.get(search_url).content, 'html5lib')
-
-    # 検索結果の1ページ目に店名が完全一致の結果があればそれを使う
-    if html.find("a", string=input_rst_name):
-        name_tag = html.find("a", string=input_rst_name)
-    # 店名が完全一致の結果がない場合は検索結果の一番上のものを取得
-    else:
-        name_tag = html.find("a", class_="list-rst__rst-name-target")
+    search_url: str = build_search_url(input_rst_name)
+    with metrics.timer("search_fetch"):
+        content = fetch(search_url)
+    html = parse_html(content)
+    # 検索結果ページに載っている他の店舗も一緒に返す
+    with metrics.timer("extract"):
+        return extract_url_info(html, input_rst_name), extract_search_listings(html)
 
+
+def resolve_by_index(index, input_rst_name: str):
+    # 店名の索引で似た店名が見つかれば、検索せずにそのURLを使う
+    result = index.lookup(input_rst_name)
+    if result is None:
+        return None
+    # is_matched_nameは検索と同じく店名が完全一致した場合だけTrueにする (build_from_itemsはこれを見て入力の店名を索引に加える)
+    # 正規化した店名の類似度はname_match_scoreに入れる (DynamoDBはfloatを保存できないためDecimal)
+    rst_name, url, score = result
     return {"input_rst_name": input_rst_name,
-            "rst_name": str(name_tag.string if name_tag else ""),
-            "url": str(name_tag.get('href') if name_tag else ""),
-            "is_matched_name": input_rst_name == str(name_tag.string if name_tag else ""),
+            "rst_name": rst_name,
+            "url": url,
+            "is_matched_name": input_rst_name == rst_name,
+            "name_match_score": decimal.Decimal(str(round(score, 3))),
             "created_at": datetime.datetime.now().isoformat()}
 
 
 def handler(event, context):
-    table = dynamodb.Table(os.environ['DB_RST_URL_TABLE'])
-    # SQSのメッセージからレストラン名を取得
-    for i, record in enumerate(event['Records']):
-        input_rst_name: str = json.loads(record['body'])["name"]
-        use_cache: bool = json.loads(record['body'])["use_cache"]
-
-        # use_cacheがTrueの場合、DynamoDBにデータがあればそれを使う
-        if use_cache:
-            response = table.get_item(Key={"input_rst_name": input_rst_name})
-            if 'Item' in response:
-                item = response["Item"]
-            else:
-                # DynamoDBにデータが存在しなければ食べログサイトから取得してDynamoDBに保存
-                item = get_url_info(input_rst_name)
-                table.put_item(Item=item)
-                # 次のリクエストをする前に少し待機する
-                if i != len(event['Records']) - 1:
-                    time.sleep(2)
-        else:
-            # 食べログサイトから取得してDynamoDBに保存
-            item = get_url_info(input_rst_name)
-            table.put_item(Item=item)
-            # 次のリクエストをする前に少し待機する
-            if i != len(event['Records']) - 1:
-                time.sleep(2)
-
-        # SQSへスクレイピングリクエストを追加
-        request = {
-            "url": item["url"],
-            "use_cache": True
-        }
-        sqs.send_message(
-            QueueUrl=os.environ['SCRAPE_REQUEST_SQS_URL'],
-            DelaySeconds=0,
-            MessageBody=(json.dumps(request))
-        )
-    return
+    table_name = os.environ['DB_RST_URL_TABLE']
+    table = dynamodb.Table(table_name)
+    # Lambdaのタイムアウトまでに終えられないリクエストは送らず、リトライキューに戻す
+    set_deadline(context)
+    # SQSのメッセージからレストラン名を取得 (不正な形式のメッセージはDLQに送る)
+    metrics.record_queue_wait(event['Records'])
+    batch = SqsBatch("get_url", event['Records'], ("name", "use_cache"))
+    requests = batch.requests
+
+    # use_cacheがTrueの店名はまとめてDynamoDBから取得し、データがあればそれを使う
+    cached = batch_get_items(dynamodb, table_name, "input_rst_name",
+                             [request["name"] for request in requests if request["use_cache"]])
+    metrics.count("db_cache_hits", len(cached))
+
+    # キャッシュにない店名でも、以前に取得した検索結果ページに載っていれば検索せずにそれを使う
+    # (DB_RST_LISTING_TABLEが設定されている場合のみ。店名が完全一致したものだけを使う)
+    # 検索せずに見つかったものはlistedにまとめる
+    listing_table_name = os.environ.get('DB_RST_LISTING_TABLE', "")
+    listed = {}
+    if listing_table_name:
+        listings = batch_get_items(dynamodb, listing_table_name, "rst_name",
+                                   [request["name"] for request in requests
+                                    if request["use_cache"] and request["name"] not in cached])
+        listed = {name: listing_to_url_info(listing, name) for name, listing in listings.items()}
+
+    # 残りの店名は、NAME_INDEX_PATHの索引で表記の揺れを吸収して探す (全角・半角、空白、カタカナ・ひらがな)
+    index = get_index()
+    if index is not None:
+        names = [request["name"] for request in requests
+                 if request["use_cache"] and request["name"] not in cached and request["name"] not in listed]
+        for name in dict.fromkeys(names):
+            item = resolve_by_index(index, name)
+            if item is not None:
+                listed[name] = item
+
+    # 残りの店名は複数スレッドで並行して食べログサイトから取得する
+    # リクエストの間隔はFETCH_INTERVALで制御するため、平均のリクエスト頻度は変わらない
+    targets = list(dict.fromkeys([request["name"] for request in requests
+                                  if not (request["use_cache"] and (request["name"] in cached
+                                                                    or request["name"] in listed))]))
+    # 食べログにブロックされた店名はblockedにまとめ、最後にリトライキューに戻す
+    # それ以外の例外で失敗した店名はfailedにまとめ、その店名のメッセージだけを失敗にする (他の店名の結果は保存する)
+    with ThreadPoolExecutor(max_workers=get_fetch_concurrency()) as executor:
+        results = dict(zip(targets, executor.map(lambda name: call_or_error(get_url_info, name), targets)))
+    blocked = {name: result for name, result in results.items() if isinstance(result, BlockedError)}
+    failed = {name: result for name, result in results.items()
+              if isinstance(result, Exception) and name not in blocked}
+    results = {name: result for name, result in results.items() if not isinstance(result, Exception)}
+    fetched = {name: info for name, (info, _) in results.items()}
+
+    # 取得した結果はDynamoDBにまとめて保存
+    with metrics.timer("db_write"):
+        with table.batch_writer(overwrite_by_pkeys=["input_rst_name"]) as writer:
+            for item in list(fetched.values()) + list(listed.values()):
+                writer.put_item(Item=item)
+
+    # 検索結果ページに載っていたすべての店舗を保存し、以降の検索に使う
+    harvested = {}
+    if listing_table_name:
+        for _, listings in results.values():
+            for listing in listings:
+                harvested.setdefault(listing["rst_name"], listing)
+        with metrics.timer("db_write"):
+            with dynamodb.Table(listing_table_name).batch_writer(overwrite_by_pkeys=["rst_name"]) as writer:
+                for listing in harvested.values():
+                    writer.put_item(Item=listing)
+
+    # スクレイピングリクエストはまとめて送る
+    # 複数の店名が同じ店舗になった場合とURLが見つからなかった場合は送らない
+    # 送信できなかったスクレイピングリクエストは、元になった店名のメッセージを失敗にする (unsentにまとめる)
+    sources = {}
+    for request in requests:
+        if request["name"] in blocked or request["name"] in failed:
+            continue
+        item = fetched.get(request["name"]) or listed.get(request["name"]) or cached[request["name"]]
+        sources.setdefault(item["url"], []).append(request["name"])
+    scrape_requests = [{"url": url, "use_cache": True} for url in sources if url]
+
+    # SQSへスクレイピングリクエストを10件ずつまとめて追加
+    counts, unsent_requests = publish_messages(sqs, os.environ['SCRAPE_REQUEST_SQS_URL'], scrape_requests)
+    unsent = {}
+    for body in unsent_requests:
+        for name in sources[body["url"]]:
+            unsent[name] = PublishError(os.environ['SCRAPE_REQUEST_SQS_URL'], 1)
+
+    # ブロックされた店名は、Retry-Afterの間を空けて同じキューに戻す (リトライキュー)
+    retry_counts = {}
+    exhausted = []
+    if blocked:
+        blocked_requests = list({request["name"]: request for request in requests
+                                 if request["name"] in blocked}.values())
+        retries, delay, exhausted = plan_retries(blocked_requests, list(blocked.values()))
+        retry_counts, unsent_retries = publish_messages(sqs, os.environ['GET_URL_REQUEST_SQS_URL'], retries,
+                                                        delay_seconds=delay)
+        for body in unsent_retries:
+            unsent[body["name"]] = PublishError(os.environ['GET_URL_REQUEST_SQS_URL'], 1)
+        metrics.count("retry_queued", len(retries) - len(unsent_retries))
+
+    # 失敗した店名のメッセージだけをbatchItemFailuresとして返し、SQSに再配信させる
+    # キューに戻す回数の上限に達した店名とキューに送れなかった店名も失敗にし、DLQ_MAX_RECEIVE_COUNT回受け取ったものはDLQに送る
+    batch.fail("name", failed)
+    batch.fail("name", unsent)
+    batch.fail("name", {request["name"]: blocked[request["name"]] for request in exhausted})
+    response = batch.finish(sqs, os.environ.get('GET_URL_REQUEST_DLQ_URL', ""))
+    print(json.dumps({"requests": len(requests), "cached": len(cached), "listed": len(listed),
+                      "fetched": len(fetched), "harvested": len(harvested), "blocked": len(blocked),
+                      "exhausted": len(exhausted), "sqs": counts, "retry_sqs": retry_counts,
+                      "batch": batch.stats,
+                      "connection_stats": get_connection_stats(),
+                      "rate_limit": get_global_limiter().stats, "throttle": get_controller().snapshot(),
+                      "name_index": index.stats if index is not None else {}}))
+    metrics.flush("get_url")
+    return response
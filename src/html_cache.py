@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import gzip
+import hashlib
+import threading
+
+# 取得したHTMLをURLのハッシュをキーにしてディスクに保存するキャッシュ
+# HTML_CACHE_DIRが設定されている場合のみ有効になる
+#   HTML_CACHE_TTL: 有効期限(秒)
+#   HTML_CACHE_MAX_BYTES: キャッシュ全体の上限サイズ。超えた場合は最近使われていないものから削除する
+#   HTML_CACHE_OFFLINE: 1の場合はネットワークにアクセスせずキャッシュのみを使う
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+SUFFIX = ".html.gz"
+
+_lock = threading.Lock()
+_total_bytes = None
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+class CacheMissError(Exception):
+    pass
+
+
+def get_cache_dir():
+    return os.environ.get("HTML_CACHE_DIR", "")
+
+
+def is_enabled():
+    return bool(get_cache_dir())
+
+
+def is_offline():
+    return os.environ.get("HTML_CACHE_OFFLINE", "") == "1"
+
+
+def get_ttl():
+    return int(os.environ.get("HTML_CACHE_TTL", str(DEFAULT_TTL)))
+
+
+def get_max_bytes():
+    return int(os.environ.get("HTML_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES)))
+
+
+def get_path(url: str):
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(get_cache_dir(), digest[:2], digest + SUFFIX)
+
+
+def _read_entry(path: str):
+    # 1行目にURLと取得日時 (と検証子(ETag, Last-Modified)のJSON)、2行目以降にHTML本体を保存している
+    # 検証子のない以前の形式のエントリーも読めるようにする
+    with gzip.open(path, "rb") as f:
+        header = f.readline().rstrip(b"\n").decode("utf-8")
+        content = f.read()
+    url, fetched_at, *rest = header.split("\t")
+    validators = json.loads(rest[0]) if rest else {}
+    return url, float(fetched_at), content, validators
+
+
+def get(url: str, ignore_ttl: bool = False):
+    entry = get_entry(url, ignore_ttl)
+    return entry[0] if entry is not None else None
+
+
+def get_entry(url: str, ignore_ttl: bool = False):
+    # 戻り値: (HTML, 取得時の検証子の辞書)。キャッシュにない場合はNone
+    if not is_enabled():
+        return None
+    path = get_path(url)
+    try:
+        cached_url, fetched_at, content, validators = _read_entry(path)
+    except (FileNotFoundError, OSError, ValueError, EOFError):
+        stats["misses"] += 1
+        return None
+    # 有効期限切れ (オフライン時は期限切れでも使う)
+    if not ignore_ttl and not is_offline() and time.time() - fetched_at > get_ttl():
+        stats["misses"] += 1
+        return None
+    # 最終利用日時を更新してLRUの順序に反映する
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    stats["hits"] += 1
+    return content, validators
+
+
+def put(url: str, content: bytes, validators: dict = None):
+    global _total_bytes
+    if not is_enabled():
+        return
+    path = get_path(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+        header = f"{url}\t{time.time()}"
+        if validators:
+            header += "\t" + json.dumps(validators)
+        f.write(f"{header}\n".encode("utf-8"))
+        f.write(content)
+    size = os.path.getsize(tmp_path)
+    old_size = os.path.getsize(path) if os.path.exists(path) else 0
+    os.replace(tmp_path, path)
+
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = sum([os.path.getsize(p) for p in _iter_paths()])
+        else:
+            _total_bytes += size - old_size
+        if _total_bytes > get_max_bytes():
+            _evict()
+
+
+def _iter_paths():
+    cache_dir = get_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return
+    for sub_dir in os.listdir(cache_dir):
+        sub_path = os.path.join(cache_dir, sub_dir)
+        if not os.path.isdir(sub_path):
+            continue
+        for name in os.listdir(sub_path):
+            if name.endswith(SUFFIX):
+                yield os.path.join(sub_path, name)
+
+
+def _evict():
+    # 上限の9割になるまで最終利用日時が古いものから削除する
+    global _total_bytes
+    entries = []
+    for path in _iter_paths():
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    entries.sort()
+    total = sum([size for _, size, _ in entries])
+    limit = get_max_bytes() * 0.9
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        stats["evictions"] += 1
+    _total_bytes = total
+
+
+def iter_entries():
+    # キャッシュに保存されているすべてのページを (URL, HTML) で返す
+    for path in _iter_paths():
+        try:
+            url, _, content, _ = _read_entry(path)
+        except (OSError, ValueError, EOFError):
+            continue
+        yield url, content
@@ -0,0 +1,173 @@
+import os
+import time
+import threading
+from src import html_cache
+from src import metrics
+from src.rate_limit import get_limiter, get_global_limiter
+from src.throttle import BlockedError, detect_block, get_controller, get_max_retries, parse_retry_after
+
+# プロセス(Lambdaのコンテナ)内で共有するセッション
+# 接続を使い回すことでTCP/TLSのハンドシェイクを省く
+_session = None
+_session_lock = threading.Lock()
+# Lambdaの呼び出しの期限 (time.monotonic()の値)。ローカルで実行する場合はNone (期限なし)
+_deadline = None
+
+
+def create_session():
+    # requests(約0.1秒)は最初にリクエストするときに読み込む (キャッシュのみの呼び出しでは読み込まない)
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    # 環境変数で接続プール・リトライの設定を変更できる
+    # 429・503はブロックとしてsrc.throttleで扱うため、ここでは再送しない
+    pool_size = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+    retries = Retry(total=get_http_max_retries(), backoff_factor=get_backoff_factor(),
+                    status_forcelist=[500, 502, 504], respect_retry_after_header=False)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def get_http_max_retries():
+    return int(os.environ.get("HTTP_MAX_RETRIES", "5"))
+
+
+def get_backoff_factor():
+    return float(os.environ.get("HTTP_BACKOFF_FACTOR", "1"))
+
+
+def get_timeout():
+    return float(os.environ.get("HTTP_TIMEOUT", "10"))
+
+
+def set_deadline(context):
+    # ハンドラーの最初に呼び、Lambdaの残り時間から呼び出しの期限を決める (contextがNoneの場合は期限なし)
+    global _deadline
+    _deadline = None if context is None else time.monotonic() + context.get_remaining_time_in_millis() / 1000
+
+
+def get_request_budget():
+    # 1回のリクエストにかかりうる最大の秒数 (タイムアウト × 試行回数 + urllib3のリトライ間隔の合計) に、
+    # 結果を保存してバッチを終えるための余裕 (DEADLINE_MARGIN秒) を足したもの
+    retries = get_http_max_retries()
+    backoff = get_backoff_factor() * sum(2 ** i for i in range(retries))
+    return get_timeout() * (retries + 1) + backoff + float(os.environ.get("DEADLINE_MARGIN", "5"))
+
+
+def check_deadline(url: str = None):
+    # 残り時間でリクエストを終えられない場合は送らずにBlockedErrorにする
+    # 呼び出しの中で待ち続けてタイムアウトする (batchItemFailuresを返せずバッチ全体が再配信される) 代わりに、リトライキューに戻す
+    if _deadline is not None and _deadline - time.monotonic() < get_request_budget():
+        metrics.count("http_deadline")
+        raise BlockedError("deadline", url=url)
+
+
+def _get(url: str, headers=None):
+    # ブロックされた場合 (429・503・captchaのページ) は頻度と同時実行数を下げ、Retry-Afterの間待ってから
+    # THROTTLE_MAX_RETRIES回まで送り直す。それでもブロックされた場合とサーキットブレーカーが開いている場合はBlockedError
+    # Lambdaの残り時間が足りない場合も、待つ前と待った後にBlockedErrorにする (set_deadline)
+    controller = get_controller()
+    for attempt in range(get_max_retries() + 1):
+        check_deadline(url)
+        # 食べログへのリクエストの間隔を空ける (FETCH_INTERVAL)
+        # さらに同時に動く全てのLambdaで共有する上限 (GLOBAL_RATE_LIMIT) を超えないようにする
+        with metrics.timer("rate_limit_wait"):
+            controller.acquire()
+            try:
+                get_limiter().acquire()
+                get_global_limiter().acquire()
+                check_deadline(url)
+            except BaseException:
+                controller.leave()
+                raise
+        try:
+            response = get_session().get(url, headers=headers, timeout=get_timeout())
+        except BaseException:
+            controller.on_error()
+            raise
+        finally:
+            controller.leave()
+        # urllib3のRetryで再送した回数 (5xxエラー・接続エラー)
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            metrics.count("http_retries", len(retries.history))
+        metrics.count("bytes_fetched", len(response.content))
+        reason = detect_block(response.status_code, response.content)
+        if reason is None:
+            controller.on_success()
+            return response
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        controller.on_block(retry_after)
+        metrics.count("http_blocked")
+    raise BlockedError(reason, retry_after, url)
+
+
+def fetch(url: str):
+    # HTMLキャッシュが有効な場合はキャッシュを優先する
+    content = html_cache.get(url)
+    if content is not None:
+        metrics.count("html_cache_hits")
+        return content
+    if html_cache.is_offline():
+        raise html_cache.CacheMissError(url)
+
+    response = _get(url)
+    response.raise_for_status()
+    html_cache.put(url, response.content)
+    return response.content
+
+
+def fetch_if_modified(url: str, etag: str = None, last_modified: str = None):
+    # 前回取得時の検証子(ETag, Last-Modified)を付けて条件付きで取得する
+    # 戻り値: (HTML, 検証子の辞書)。変更がない(304)場合はHTMLがNone
+    # HTMLキャッシュから返す場合は、キャッシュに保存したときの検証子を返す
+    entry = html_cache.get_entry(url)
+    if entry is not None:
+        metrics.count("html_cache_hits")
+        return entry
+    if html_cache.is_offline():
+        raise html_cache.CacheMissError(url)
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = _get(url, headers)
+    # 304の応答にも新しい検証子が含まれる場合がある
+    validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+    validators = {key: value for key, value in validators.items() if value}
+    if response.status_code == 304:
+        return None, validators
+    response.raise_for_status()
+    html_cache.put(url, response.content, validators)
+    return response.content, validators
+
+
+def get_connection_stats():
+    # 接続プールごとの新規接続数とリクエスト数を集計する
+    # requests - connections が接続を使い回したリクエストの数
+    num_connections = 0
+    num_requests = 0
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                num_connections += pool.num_connections
+                num_requests += pool.num_requests
+    return {"requests": num_requests,
+            "connections": num_connections,
+            "reused": num_requests - num_connections}
@@ -0,0 +1,76 @@
+import os
+import time
+
+# 同時に動く複数のLambdaが同じURLを重複してスクレイピングしないよう、処理中の印をDynamoDBに置く
+# 印は結果をDynamoDBに保存し終えたら (保存に失敗した場合も) 消す。保存済みのURLはscrapeがuse_cacheで判定する
+#   DB_INFLIGHT_TABLE: 印を置くテーブル。未設定の場合は使わない
+#   INFLIGHT_TTL: 印の有効期間(秒)。Lambdaがタイムアウトして印が残った場合も、この秒数が過ぎれば再度処理できる
+#                 (Lambdaのタイムアウトより長く、SQSの再配信がmaxReceiveCountに達するまでの時間より短くする)
+DEFAULT_TTL = 120
+# batch_write_itemで一度に消せる最大件数
+MAX_BATCH_SIZE = 25
+
+
+class InFlightError(Exception):
+    # 他のワーカーが処理中のため、今は処理しなかった
+    pass
+
+_client = None
+
+
+def get_table_name():
+    return os.environ.get("DB_INFLIGHT_TABLE", "")
+
+
+def get_ttl():
+    return int(os.environ.get("INFLIGHT_TTL", str(DEFAULT_TTL)))
+
+
+def get_client():
+    # clientはスレッドセーフなので、並行して取得するスレッドで共有できる
+    global _client
+    if _client is None:
+        import boto3
+        _client = boto3.client("dynamodb")
+    return _client
+
+
+def claim(key: str):
+    # 印がない(または有効期間が過ぎた)場合のみ条件付きで印を置き、置けたらTrueを返す
+    table_name = get_table_name()
+    if not table_name:
+        return True
+    client = get_client()
+    now = int(time.time())
+    try:
+        client.put_item(TableName=table_name,
+                        Item={"key": {"S": key}, "expires_at": {"N": str(now + get_ttl())}},
+                        ConditionExpression="attribute_not_exists(#key) OR expires_at < :now",
+                        ExpressionAttributeNames={"#key": "key"},
+                        ExpressionAttributeValues={":now": {"N": str(now)}})
+        return True
+    except client.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def release(key: str):
+    # 処理に失敗した場合は印を消し、SQSの再配信で再度処理できるようにする
+    table_name = get_table_name()
+    if table_name:
+        get_client().delete_item(TableName=table_name, Key={"key": {"S": key}})
+
+
+def release_all(keys):
+    # 複数の印を25件ずつまとめて消す (消せなかった印はINFLIGHT_TTLで期限切れになる)
+    table_name = get_table_name()
+    keys = list(dict.fromkeys(keys))
+    if not table_name or not keys:
+        return
+    client = get_client()
+    for start in range(0, len(keys), MAX_BATCH_SIZE):
+        request = {table_name: [{"DeleteRequest": {"Key": {"key": {"S": key}}}}
+                                for key in keys[start:start + MAX_BATCH_SIZE]]}
+        for _ in range(3):
+            request = client.batch_write_item(RequestItems=request).get("UnprocessedItems")
+            if not request:
+                break
@@ -0,0 +1,176 @@
+import os
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+# パイプラインの段階ごとの処理時間とカウンターを集計する
+#   METRICS_FORMAT: ハンドラーの終了時に出力する形式
+#     json: 段階ごとのパーセンタイルをJSONで出力する, emf: CloudWatch Embedded Metric Format, none: 出力しない
+#   METRICS_NAMESPACE: EMFで出力する場合のCloudWatchの名前空間
+#
+# 段階 (1件ごとの処理時間を計測する)
+#   queue_wait: SQSにメッセージが送られてからハンドラーが受け取るまで
+#   search_fetch, detail_fetch: 検索結果ページ・店舗詳細ページの取得 (キャッシュとレート制限の待ち時間を含む)
+#   rate_limit_wait: レート制限の待ち時間
+#   parse, extract: HTMLの解析・データの抽出
+#   pool_extract: 抽出用のワーカープロセスでの解析と抽出 (ローカルの並行実行モード。処理待ちの時間を含む)
+#   db_read, db_write: DynamoDBの読み込み・書き込み
+#   db_scan: テーブル全体のscan
+#   sqs_send: SQSへのバッチ送信 (1回のAPI呼び出しごと)
+# カウンター
+#   http_retries, sqs_retries: リトライの回数
+#   http_blocked: 食べログにブロックされた応答 (429・503・captchaのページ) の数
+#   retry_queued: ブロックされて処理できず、リトライキューに入れた件数
+#   batch_item_failures: SQSに再配信させたメッセージ (batchItemFailures) の数
+#   dead_lettered: 処理できずにDLQに送ったメッセージの数
+#   html_cache_hits, db_cache_hits: HTMLキャッシュ・DynamoDBに保存済みのデータを使った件数
+#   bytes_fetched: 食べログから取得したHTMLのバイト数
+FORMATS = ("json", "emf", "none")
+DEFAULT_NAMESPACE = "TabelogScraping"
+PERCENTILES = (50, 95, 99)
+# EMFの1つのメトリクスに含められる値の数の上限
+MAX_EMF_VALUES = 100
+
+
+def percentile(sorted_values: list, p: float):
+    # nearest-rank法のパーセンタイル
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Metrics:
+    # 複数スレッドから記録できる
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self.lock:
+            self.timings.setdefault(name, []).append(seconds)
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name: str):
+        # 例外で終わった場合も時間を記録する
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self.lock:
+            self.timings = {}
+            self.counters = {}
+
+    def snapshot(self):
+        with self.lock:
+            return {name: list(values) for name, values in self.timings.items()}, dict(self.counters)
+
+    def summary(self):
+        # 段階ごとの件数・合計・パーセンタイル (ミリ秒) とカウンターを返す
+        timings, counters = self.snapshot()
+        stages = {}
+        for name, values in sorted(timings.items()):
+            values.sort()
+            stage = {"count": len(values), "total_ms": round(sum(values) * 1000, 1)}
+            for p in PERCENTILES:
+                stage[f"p{p}_ms"] = round(percentile(values, p) * 1000, 1)
+            stages[name] = stage
+        return {"stages": stages, "counters": counters}
+
+    def to_emf(self, namespace: str, dimensions: dict):
+        # CloudWatch Embedded Metric Formatのドキュメントを返す
+        # 段階ごとの処理時間は値の配列として出力し、CloudWatch側でパーセンタイルを集計できるようにする
+        # 1つのメトリクスの値は100個までのため、それを超える場合はドキュメントを分ける
+        timings, counters = self.snapshot()
+        num_documents = max([math.ceil(len(values) / MAX_EMF_VALUES) for values in timings.values()] + [1])
+        documents = []
+        for i in range(num_documents):
+            document = dict(dimensions)
+            definitions = []
+            for name, values in sorted(timings.items()):
+                chunk = values[i * MAX_EMF_VALUES:(i + 1) * MAX_EMF_VALUES]
+                if chunk:
+                    document[name] = [round(value * 1000, 3) for value in chunk]
+                    definitions.append({"Name": name, "Unit": "Milliseconds"})
+            # カウンターは最初のドキュメントにのみ含める
+            if i == 0:
+                for name, value in sorted(counters.items()):
+                    document[name] = value
+                    definitions.append({"Name": name, "Unit": "Bytes" if name.startswith("bytes_") else "Count"})
+            document["_aws"] = {"Timestamp": int(time.time() * 1000),
+                                "CloudWatchMetrics": [{"Namespace": namespace,
+                                                       "Dimensions": [list(dimensions.keys())],
+                                                       "Metrics": definitions}]}
+            documents.append(document)
+        return documents
+
+    def format_table(self):
+        # ローカル実行の終了時に表示する表
+        summary = self.summary()
+        lines = [f"{'stage':<16}{'count':>8}{'total_s':>10}" + "".join(f"{f'p{p}_ms':>10}" for p in PERCENTILES)]
+        for name, stage in summary["stages"].items():
+            lines.append(f"{name:<16}{stage['count']:>8}{stage['total_ms'] / 1000:>10.2f}"
+                         + "".join(f"{stage[f'p{p}_ms']:>10.1f}" for p in PERCENTILES))
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f"{name:<16}{value:>8}")
+        return "\n".join(lines)
+
+
+# プロセス(Lambdaのコンテナ)内で共有する集計
+# Lambdaではハンドラーの終了時にflush()で出力してリセットする
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def timer(name: str):
+    return _metrics.timer(name)
+
+
+def record(name: str, seconds: float):
+    _metrics.record(name, seconds)
+
+
+def count(name: str, value: int = 1):
+    _metrics.count(name, value)
+
+
+def get_format():
+    metrics_format = os.environ.get("METRICS_FORMAT", "json")
+    if metrics_format not in FORMATS:
+        raise ValueError(f"unknown METRICS_FORMAT: {metrics_format} (choose from {', '.join(FORMATS)})")
+    return metrics_format
+
+
+def get_namespace():
+    return os.environ.get("METRICS_NAMESPACE", DEFAULT_NAMESPACE)
+
+
+def record_queue_wait(records):
+    # SQSのSentTimestamp(ミリ秒)から、メッセージが送られてから受け取るまでの時間を記録する
+    now = time.time()
+    for sqs_record in records:
+        sent_timestamp = sqs_record.get("attributes", {}).get("SentTimestamp")
+        if sent_timestamp:
+            _metrics.record("queue_wait", max(now - int(sent_timestamp) / 1000, 0))
+
+
+def flush(handler_name: str):
+    # 1回の呼び出し分の集計を出力してリセットする
+    metrics_format = get_format()
+    if metrics_format == "json":
+        print(json.dumps({"handler": handler_name, "metrics": _metrics.summary()}))
+    elif metrics_format == "emf":
+        for document in _metrics.to_emf(get_namespace(), {"handler": handler_name}):
+            print(json.dumps(document))
+    _metrics.reset()
@@ -0,0 +1,148 @@
+import os
+import io
+import re
+import gzip
+import json
+import heapq
+import threading
+import unicodedata
+from collections import Counter
+
+# 店名 -> 店舗詳細URL の索引
+# 全角・半角、空白、カタカナ・ひらがなの違いを正規化し、文字のtrigramで似た店名を探す
+#   NAME_INDEX_PATH: 索引ファイルのパス (ローカルのパスまたは s3://bucket/key)。未設定の場合は使わない
+#   NAME_INDEX_THRESHOLD: 一致とみなす類似度 (0〜1)
+NGRAM_SIZE = 3
+DEFAULT_THRESHOLD = 0.8
+
+_IGNORED_CHARS = re.compile(r"[\s・･/／\-‐－]+")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize_name(name: str):
+    # NFKCで全角英数字・半角カナをそろえ、空白と区切り記号を取り除き、カタカナをひらがなにする
+    name = unicodedata.normalize("NFKC", name).casefold()
+    name = _IGNORED_CHARS.sub("", name)
+    return "".join([chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in name])
+
+
+def unique_names(names):
+    # 入力の店名から空行と完全に同じ店名の重複を取り除く
+    # 表記の違う店名はそのまま送る (入力の表記がDynamoDBのキー(input_rst_name)になるため。表記の揺れはget_urlで索引が吸収する)
+    return list(dict.fromkeys([name for name in names if name.strip()]))
+
+
+def ngrams(normalized: str):
+    # 短い店名でも比較できるよう、前後に印を付けてから分割する
+    padded = "^" * (NGRAM_SIZE - 1) + normalized + "$" * (NGRAM_SIZE - 1)
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+class NameIndex:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.names = []
+        self.urls = []
+        self.gram_counts = []
+        self.exact = {}
+        self.postings = {}
+        self.stats = {"matched": 0, "missed": 0}
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name: str, url: str):
+        normalized = normalize_name(name)
+        if not normalized or not url or normalized in self.exact:
+            return
+        entry_id = len(self.names)
+        grams = ngrams(normalized)
+        self.names.append(name)
+        self.urls.append(url)
+        self.gram_counts.append(len(grams))
+        self.exact[normalized] = entry_id
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(entry_id)
+
+    def search(self, name: str):
+        # 最も似ている店名を (店名, URL, 類似度) で返す (類似度はtrigramのDice係数)
+        # 類似度がしきい値未満の場合と、別のURLの店名が同じ類似度で並ぶ場合はNone
+        normalized = normalize_name(name)
+        entry_id = self.exact.get(normalized)
+        if entry_id is not None:
+            return self.names[entry_id], self.urls[entry_id], 1.0
+        grams = ngrams(normalized)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        scored = heapq.nlargest(2, [(2 * count / (len(grams) + self.gram_counts[i]), i)
+                                    for i, count in shared.items()])
+        if not scored or scored[0][0] < self.threshold:
+            return None
+        if len(scored) > 1 and scored[1][0] == scored[0][0] and self.urls[scored[1][1]] != self.urls[scored[0][1]]:
+            return None
+        score, entry_id = scored[0]
+        return self.names[entry_id], self.urls[entry_id], score
+
+    def lookup(self, name: str):
+        result = self.search(name)
+        self.stats["matched" if result else "missed"] += 1
+        return result
+
+    def dump(self, f):
+        # 店名とURLだけをgzip圧縮したJSON Linesで保存する (trigramは読み込み時に作り直す)
+        with gzip.GzipFile(fileobj=f, mode="wb") as gz:
+            for name, url in zip(self.names, self.urls):
+                gz.write((json.dumps([name, url], ensure_ascii=False) + "\n").encode("utf-8"))
+
+    @classmethod
+    def load(cls, f, threshold: float = DEFAULT_THRESHOLD):
+        index = cls(threshold)
+        with gzip.GzipFile(fileobj=f, mode="rb") as gz:
+            for line in gz:
+                name, url = json.loads(line)
+                index.add(name, url)
+        return index
+
+
+def build_from_items(items, threshold: float = DEFAULT_THRESHOLD):
+    # TabelogRstUrl・TabelogRstListingのアイテムから索引を作る
+    # 検索で完全一致しなかった入力の店名は別の店舗の可能性があるため使わない
+    index = NameIndex(threshold)
+    for item in items:
+        url = item.get("url")
+        if item.get("rst_name"):
+            index.add(item["rst_name"], url)
+        if item.get("input_rst_name") and item.get("is_matched_name"):
+            index.add(item["input_rst_name"], url)
+    return index
+
+
+def get_threshold():
+    return float(os.environ.get("NAME_INDEX_THRESHOLD", str(DEFAULT_THRESHOLD)))
+
+
+def read_index_file(path: str):
+    if path.startswith("s3://"):
+        import boto3
+        bucket, key = path[len("s3://"):].split("/", 1)
+        body = boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"].read()
+        return NameIndex.load(io.BytesIO(body), get_threshold())
+    with open(path, "rb") as f:
+        return NameIndex.load(f, get_threshold())
+
+
+def get_index():
+    # 最初に使うとき(Lambdaのコールドスタート)に1回だけ読み込み、コンテナ内で使い回す
+    # NAME_INDEX_PATHが未設定の場合はNone
+    global _index
+    path = os.environ.get("NAME_INDEX_PATH", "")
+    if not path:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = read_index_file(path)
+    return _index
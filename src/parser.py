@@ -0,0 +1,22 @@
+import os
+from src import metrics
+
+# BeautifulSoupで利用できるパーサー
+# html5libは最も寛容だが非常に遅いため、通常はlxmlを使う
+PARSERS = ("lxml", "html5lib", "html.parser")
+DEFAULT_PARSER = "lxml"
+
+
+def get_parser_name():
+    # 環境変数HTML_PARSERでパーサーを切り替えられる
+    parser = os.environ.get("HTML_PARSER", DEFAULT_PARSER)
+    if parser not in PARSERS:
+        raise ValueError(f"unknown HTML_PARSER: {parser} (choose from {', '.join(PARSERS)})")
+    return parser
+
+
+def parse_html(content, parser: str = None):
+    # bs4(約0.15秒)は解析するときに読み込む (キャッシュ・304のページのみの呼び出しでは読み込まない)
+    from bs4 import BeautifulSoup
+    with metrics.timer("parse"):
+        return BeautifulSoup(content, parser or get_parser_name())
@@ -1,9 +1,12 @@
 import os
 import json
-import boto3
+from src.sqs_publisher import PublishError, publish_messages
+from src.name_index import unique_names
+from src import aws
+from src import metrics
 
-s3 = boto3.client('s3')
-sqs = boto3.client('sqs')
+s3 = aws.client('s3')
+sqs = aws.client('sqs')
 
 
 def handler(event, context):
@@ -11,19 +14,18 @@ def handler(event, context):
     key = "test.csv"
 
     response = s3.get_object(Bucket=bucket, Key=key)
-    rst_names = response['Body'].read().decode('utf-8').splitlines()
+    lines = response['Body'].read().decode('utf-8').splitlines()
+    # 入力ファイル内で重複した店名は1回だけ検索する
+    rst_names = unique_names(lines)
 
-    for rst_name in rst_names:
-        # SQSへレストランURL取得リクエストを追加
-        request = {
-            "name": rst_name,
-            "use_cache": False
-        }
-        sqs.send_message(
-            QueueUrl=os.environ['GET_URL_REQUEST_SQS_URL'],
-            DelaySeconds=0,
-            MessageBody=(json.dumps(request))
-        )
+    # SQSへレストランURL取得リクエストを10件ずつまとめて追加
+    requests = ({"name": rst_name, "use_cache": False} for rst_name in rst_names)
+    counts, failed = publish_messages(sqs, os.environ['GET_URL_REQUEST_SQS_URL'], requests)
+    print(json.dumps({"lines": len(lines), "unique_names": len(rst_names), **counts}))
+    metrics.flush("publish_get_url_request_by_http")
+    # 送信できなかったメッセージがある場合は失敗させる
+    if failed:
+        raise PublishError(os.environ['GET_URL_REQUEST_SQS_URL'], len(failed))
 
     # httpレスポンス
     response = {
@@ -1,39 +1,54 @@
 import os
-from bs4 import BeautifulSoup
 import json
-import boto3
+from src.dynamodb_utils import parallel_scan
+from src.sqs_publisher import PublishError, publish_messages
+from src.refresh_schedule import select_stale
+from src import aws
+from src import metrics
 
-dynamodb = boto3.resource("dynamodb")
-sqs = boto3.client('sqs')
+sqs = aws.client('sqs')
 
 
 def scan_all():
-    table = dynamodb.Table(os.environ['DB_RST_URL_TABLE'])
-    response = table.scan()
-    data = response['Items']
-    # レスポンスに LastEvaluatedKey が含まれなくなるまでループ処理を実行する
-    while 'LastEvaluatedKey' in response:
-        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-        data.extend(response['Items'])
-    return data
+    # テーブルを並列にscanし、アイテムを1件ずつ返す
+    return parallel_scan(os.environ['DB_RST_URL_TABLE'])
+
+
+def get_refresh_options(event):
+    # クエリパラメータ mode=incremental&budget=N または環境変数REFRESH_MODE, REFRESH_BUDGET で指定する
+    # full: 全てのURLを再取得する, incremental: 再取得の時期を過ぎたURLを古い順に最大N件だけ再取得する
+    params = (event or {}).get("queryStringParameters") or {}
+    mode = params.get("mode", os.environ.get("REFRESH_MODE", "full"))
+    if mode not in ("full", "incremental"):
+        raise ValueError(f"unknown refresh mode: {mode}")
+    budget = int(params.get("budget", os.environ.get("REFRESH_BUDGET", "1000")))
+    return mode, budget
 
 
 def handler(event, context):
-    # DynamoDBからURLを取得
-    data = scan_all()
-
-    for da in data:
-        url = da['url']
-        # SQSへスクレイピングリクエストを追加
-        request = {
-            "url": url,
-            "use_cache": False
-        }
-        sqs.send_message(
-            QueueUrl=os.environ['SCRAPE_REQUEST_SQS_URL'],
-            DelaySeconds=0,
-            MessageBody=(json.dumps(request))
-        )
+    mode, budget = get_refresh_options(event)
+
+    # DynamoDBからURLを取得 (複数の店名が同じ店舗の場合があるため重複を取り除く)
+    with metrics.timer("db_scan"):
+        urls = list(dict.fromkeys([da['url'] for da in scan_all() if da.get('url')]))
+    summary = {"mode": mode, "urls": len(urls)}
+    if mode == "incremental":
+        # スクレイピング結果の確認日時と再取得の間隔から、時期を過ぎたURLだけを選ぶ
+        data = parallel_scan(os.environ['DB_RST_DATA_TABLE'],
+                             ProjectionExpression="#url, created_at, checked_at, revisit_interval",
+                             ExpressionAttributeNames={"#url": "url"})
+        urls, num_stale = select_stale(urls, data, budget)
+        summary.update({"budget": budget, "stale": num_stale})
+
+    # SQSへスクレイピングリクエストを10件ずつまとめて追加
+    requests = ({"url": url, "use_cache": False} for url in urls)
+    counts, failed = publish_messages(sqs, os.environ['SCRAPE_REQUEST_SQS_URL'], requests)
+    summary.update(counts)
+    print(json.dumps(summary))
+    metrics.flush("publish_scrape_request")
+    # 送信できなかったメッセージがある場合は失敗させる
+    if failed:
+        raise PublishError(os.environ['SCRAPE_REQUEST_SQS_URL'], len(failed))
 
     # httpレスポンス
     response = {
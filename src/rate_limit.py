@@ -0,0 +1,161 @@
+import os
+import abc
+import time
+import random
+import threading
+
+
+class PacingLimiter:
+    # リクエストの開始間隔をinterval秒以上空ける (複数スレッドから共有できる)
+    # 並行実行しても平均のリクエスト頻度は 1/interval 回/秒 を超えない
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.interval <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start_at = max(now, self.next_at)
+            self.next_at = start_at + self.interval
+        # 待機はロックの外で行い、他のスレッドは次の枠を予約できるようにする
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+class WindowRateLimiter(abc.ABC):
+    # 全てのワーカーで共有するレート制限 (固定ウィンドウ方式)
+    # window秒ごとの区間でlimit回までリクエストを通し、超えた場合は次の区間まで待つ
+    # 区間ごとのカウンターの持ち方はバックエンドごとにtry_acquireで実装する
+    # acquireは複数スレッドから呼ばれるため、statsの更新はstats_lockで守る
+    def __init__(self, limit: int, window: float = 1.0):
+        self.limit = limit
+        self.window = window
+        self.stats = {"acquired": 0, "throttled": 0}
+        self.stats_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def try_acquire(self, window_id: int):
+        pass
+
+    def _count(self, name: str):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def acquire(self):
+        while True:
+            now = time.time()
+            window_id = int(now // self.window)
+            if self.try_acquire(window_id):
+                self._count("acquired")
+                return
+            self._count("throttled")
+            # 次の区間まで待つ (待っていたワーカーが同時に再試行しないよう少しずらす)
+            time.sleep((window_id + 1) * self.window - now + random.uniform(0, self.window * 0.1))
+
+
+class LocalRateLimiter(WindowRateLimiter):
+    # プロセス内のメモリでカウントする (ローカル実行・ベンチマーク用)
+    def __init__(self, limit: int, window: float = 1.0):
+        super().__init__(limit, window)
+        self.window_id = None
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self, window_id: int):
+        with self.lock:
+            if window_id != self.window_id:
+                self.window_id = window_id
+                self.count = 0
+            if self.count >= self.limit:
+                return False
+            self.count += 1
+            return True
+
+
+class DynamoDBRateLimiter(WindowRateLimiter):
+    # DynamoDBの条件付き更新でカウントし、同時に動く全てのLambdaで上限を共有する
+    # 区間ごとに1アイテムを作り、古いアイテムはTTLで削除する
+    def __init__(self, dynamodb_client, table_name: str, limit: int, window: float = 1.0,
+                 key: str = "tabelog.com"):
+        super().__init__(limit, window)
+        self.client = dynamodb_client
+        self.table_name = table_name
+        self.key = key
+
+    def try_acquire(self, window_id: int):
+        expires_at = int((window_id + 1) * self.window) + 60
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"limiter_key": {"S": f"{self.key}#{window_id}"}},
+                UpdateExpression="ADD #count :one SET expires_at = :expires_at",
+                ConditionExpression="attribute_not_exists(#count) OR #count < :limit",
+                ExpressionAttributeNames={"#count": "count"},
+                ExpressionAttributeValues={":one": {"N": "1"}, ":limit": {"N": str(self.limit)},
+                                           ":expires_at": {"N": str(expires_at)}})
+            return True
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+
+class NoRateLimiter:
+    stats = {}
+
+    def acquire(self):
+        pass
+
+
+RATE_LIMIT_BACKENDS = ("none", "local", "dynamodb")
+
+_limiter = None
+_limiter_lock = threading.Lock()
+_global_limiter = None
+
+
+def get_fetch_interval():
+    # 食べログへのリクエストの間隔(秒)。0の場合は待機しない
+    return float(os.environ.get("FETCH_INTERVAL", "0"))
+
+
+def get_fetch_concurrency():
+    # 1回の呼び出しの中で並行して取得するページ数
+    return int(os.environ.get("FETCH_CONCURRENCY", "4"))
+
+
+def get_limiter():
+    # プロセス(Lambdaのコンテナ)内で共有し、呼び出しをまたいでも間隔を保つ
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = PacingLimiter(get_fetch_interval())
+    return _limiter
+
+
+def create_global_limiter():
+    # 環境変数でバックエンドと上限を切り替える
+    backend = os.environ.get("RATE_LIMIT_BACKEND", "none")
+    if backend not in RATE_LIMIT_BACKENDS:
+        raise ValueError(f"unknown rate limit backend: {backend} (choose from {', '.join(RATE_LIMIT_BACKENDS)})")
+    limit = int(os.environ.get("GLOBAL_RATE_LIMIT", "1"))
+    window = float(os.environ.get("GLOBAL_RATE_LIMIT_WINDOW", "1"))
+    if backend == "local":
+        return LocalRateLimiter(limit, window)
+    if backend == "dynamodb":
+        # clientはスレッドセーフなので、並行して取得するスレッドで共有できる
+        # boto3はこのバックエンドを使う場合のみ読み込む
+        import boto3
+        return DynamoDBRateLimiter(boto3.client("dynamodb"), os.environ["DB_RATE_LIMIT_TABLE"], limit, window)
+    return NoRateLimiter()
+
+
+def get_global_limiter():
+    global _global_limiter
+    if _global_limiter is None:
+        with _limiter_lock:
+            if _global_limiter is None:
+                _global_limiter = create_global_limiter()
+    return _global_limiter
@@ -0,0 +1,64 @@
+import os
+import math
+import heapq
+import datetime
+
+# ページごとの再取得の間隔(秒)を、変更の頻度に合わせて調整する
+# 前回から変更があったページは間隔を半分に、なかったページは倍にする
+#   REFRESH_INITIAL_INTERVAL: 初回スクレイピング後の間隔
+#   REFRESH_MIN_INTERVAL / REFRESH_MAX_INTERVAL: 間隔の下限と上限
+DAY = 24 * 60 * 60
+
+
+def get_initial_interval():
+    return int(os.environ.get("REFRESH_INITIAL_INTERVAL", str(7 * DAY)))
+
+
+def get_min_interval():
+    return int(os.environ.get("REFRESH_MIN_INTERVAL", str(DAY)))
+
+
+def get_max_interval():
+    return int(os.environ.get("REFRESH_MAX_INTERVAL", str(90 * DAY)))
+
+
+def next_interval(previous, changed: bool):
+    # previousは前回保存したアイテム (初回はNone)
+    if not previous or "revisit_interval" not in previous:
+        return get_initial_interval()
+    interval = float(previous["revisit_interval"])
+    interval = interval / 2 if changed else interval * 2
+    return int(min(max(interval, get_min_interval()), get_max_interval()))
+
+
+def staleness(item, now: datetime.datetime):
+    # 前回確認してからの経過時間 / 再取得の間隔 (1以上なら再取得の時期を過ぎている)
+    checked_at = item.get("checked_at") or item.get("created_at")
+    if not checked_at:
+        return math.inf
+    elapsed = (now - datetime.datetime.fromisoformat(checked_at)).total_seconds()
+    return elapsed / float(item.get("revisit_interval") or get_initial_interval())
+
+
+def select_stale(urls, data_items, budget: int, now: datetime.datetime = None):
+    # urlsのうち再取得の時期を過ぎたものを、時期を過ぎている割合が大きい順にbudget件まで返す
+    # data_itemsはTabelogRstDataのアイテムで、まだスクレイピングしていないURLを最優先する
+    # 戻り値: (選んだURLのリスト, 時期を過ぎていたURLの数)
+    now = now or datetime.datetime.now()
+    scores = {item["url"]: staleness(item, now) for item in data_items}
+    heap = []
+    num_stale = 0
+    for i, url in enumerate(dict.fromkeys(urls)):
+        if not url:
+            continue
+        score = scores.get(url, math.inf)
+        if score < 1:
+            continue
+        num_stale += 1
+        # budget件だけをヒープに残す (同じ値の場合は先に出てきたURLを優先する)
+        entry = (score, -i, url)
+        if len(heap) < budget:
+            heapq.heappush(heap, entry)
+        elif heap and entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return [url for _, _, url in sorted(heap, reverse=True)], num_stale
@@ -0,0 +1,191 @@
+import os
+import csv
+
+FIELDNAMES = ["URL",
+              "店名",
+              "公式マーク有無",
+              "食べログスコア",
+              "レビュー数",
+              "ブックマーク数",
+              "最寄り駅",
+              "ジャンル",
+              "予算（昼）",
+              "予算（夜）",
+              "定休日",
+              "テイクアウト実施有無",
+              "PRタイトル",
+              "PRコメント",
+              "こだわり",
+              "感染症対策",
+              "コース料金",
+              "クーポン",
+              "予約・問い合わせ",
+              "予約可否",
+              "住所",
+              "交通手段",
+              "営業時間・定休日",
+              "支払い方法",
+              "サービス料・チャージ",
+              "席数",
+              "最大予約可能人数",
+              "個室",
+              "貸切",
+              "喫煙・禁煙",
+              "駐車場",
+              "空間・設備",
+              "携帯電話",
+              "コース",
+              "ドリンク",
+              "料理",
+              "Go to Eat",
+              "利用シーン",
+              "ロケーション",
+              "サービス",
+              "お子様連れ",
+              "ホームページ",
+              "公式アカウント（Twitter）",
+              "公式アカウント（Instagram）",
+              "公式アカウント（Facebook）",
+              "オープン日",
+              "電話番号",
+              "備考",
+              "Google広告表示有無"]
+
+
+def to_csv_row(da: dict):
+    return {"URL": da["url"],
+            "店名": da["name"],
+            "公式マーク有無": da["has_official_badge"],
+            "食べログスコア": da["score"],
+            "レビュー数": da["num_reviews"],
+            "ブックマーク数": da["num_bookmarks"],
+            "最寄り駅": da["nearest_station"],
+            "ジャンル": da["genre"],
+            "予算（昼）": da["budget_dinner"],
+            "予算（夜）": da["budget_lunch"],
+            "定休日": da["regular_holiday"],
+            "テイクアウト実施有無": da["is_serve_takeout"],
+            "PRタイトル": da["pr_title"],
+            "PRコメント": da["pr-comment"],
+            "こだわり": da["kodawari"],
+            "感染症対策": da["hygiene"],
+            "コース料金": da["top-course"],
+            "クーポン": da["coupon"],
+            "予約・問い合わせ": da["booking_inquiry"],
+            "予約可否": da["booking_availability"],
+            "住所": da["address"],
+            "交通手段": da["transportation"],
+            "営業時間・定休日": da["business_hours"],
+            "支払い方法": da["payment_method"],
+            "サービス料・チャージ": da["service_charge"],
+            "席数": da["num_seat"],
+            "最大予約可能人数": da["num_max_booking"],
+            "個室": da["private_room"],
+            "貸切": da["charter"],
+            "喫煙・禁煙": da["smoking"],
+            "駐車場": da["parking"],
+            "空間・設備": da["space_equipment"],
+            "携帯電話": da["mobile_phone"],
+            "コース": da["course"],
+            "ドリンク": da["drink"],
+            "料理": da["cuisine"],
+            "Go to Eat": da["go_to_eat"],
+            "利用シーン": da["scene"],
+            "ロケーション": da["location"],
+            "サービス": da["service"],
+            "お子様連れ": da["with_children"],
+            "ホームページ": da["homepage"],
+            "公式アカウント（Twitter）": da["twitter"],
+            "公式アカウント（Instagram）": da["instagram"],
+            "公式アカウント（Facebook）": da["facebook"],
+            "オープン日": da["opening_date"],
+            "電話番号": da["telephone"],
+            "備考": da["other"],
+            "Google広告表示有無": da["has_google_ad"]}
+
+
+class CsvResultWriter:
+    # スクレイピング結果を1件ずつcsvに書き込む
+    # batch_size件ごとにファイルへフラッシュするため、途中で異常終了しても書き込み済みの結果は残る
+    # append=Trueの場合は既存のファイルに追記する (ヘッダーはファイルが空の場合のみ書く)
+    def __init__(self, file_path: str, append: bool = False, batch_size: int = 100):
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.buffer = []
+        self.done_names = []
+        self.num_rows = 0
+        write_header = not (append and os.path.exists(file_path) and os.path.getsize(file_path) > 0)
+        self.file = open(file_path, 'a' if append else 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDNAMES)
+        if write_header:
+            self.writer.writeheader()
+
+    def write(self, da: dict, input_rst_name: str = None):
+        self.buffer.append(to_csv_row(da))
+        self.mark_done(input_rst_name)
+
+    def mark_done(self, input_rst_name: str = None):
+        # 処理済みの店名はcsvのフラッシュ後に完了ログへ記録する (再開時に使う)
+        if input_rst_name is not None:
+            self.done_names.append(input_rst_name)
+        if len(self.buffer) + len(self.done_names) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.writer.writerows(self.buffer)
+        self.num_rows += len(self.buffer)
+        self.buffer = []
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        if self.done_names:
+            with open(get_done_log_path(self.file_path), 'a') as f:
+                f.write(''.join([f"{name}\n" for name in self.done_names]))
+            self.done_names = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def get_done_log_path(file_path: str):
+    return file_path + ".done"
+
+
+def get_retry_log_path(file_path: str):
+    return file_path + ".retry"
+
+
+class RetryQueue:
+    # 失敗した店名を<csvファイル名>.retryに1行ずつ記録する
+    # 入力ファイルと同じ形式のため、そのまま入力ファイルとして渡して再実行できる
+    # 前回の実行の記録は実行の開始時に消す (再実行時に読み込んだあとで消すため、同じファイルを入力にできる)
+    def __init__(self, file_path: str):
+        self.file_path = get_retry_log_path(file_path)
+        self.num_names = 0
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+    def add(self, input_rst_name: str):
+        with open(self.file_path, 'a') as f:
+            f.write(f"{input_rst_name}\n")
+        self.num_names += 1
+
+
+def load_progress(file_path: str):
+    # 途中まで出力済みのcsvから、処理済みのURLと店名を読み込む
+    done_urls = set()
+    done_names = set()
+    if os.path.exists(file_path):
+        with open(file_path, newline='') as f:
+            for row in csv.DictReader(f):
+                done_urls.add(row["URL"])
+    if os.path.exists(get_done_log_path(file_path)):
+        with open(get_done_log_path(file_path)) as f:
+            done_names = set(f.read().splitlines())
+    return done_urls, done_names
@@ -0,0 +1,186 @@
+import os
+import re
+import datetime
+
+# スクレイピング結果を型付きの列でParquetに書き出す
+# csvと異なりスコア・口コミ数・保存数・席数などを数値として持ち、列ごとに圧縮するため、
+# 集計する側で文字列を解析し直す必要がなく、ファイルも小さくなる
+#   PARQUET_COMPRESSION: 圧縮方式 (zstd, snappy, gzip, none)
+#   PARQUET_ROW_GROUP_SIZE: 1つのrow groupの件数。この件数ごとに書き出し、それ以上はメモリに溜めない
+# pyarrowは大きいため、Parquetで出力する場合のみ読み込む (Lambdaでは pyarrow を含むレイヤーが必要)
+DEFAULT_COMPRESSION = "zstd"
+DEFAULT_ROW_GROUP_SIZE = 10000
+
+# (列名, アイテムの属性名, 型)
+# 型: string, bool, float (最初の数値), int (最初の整数。"1,234" や "40席" にも対応), timestamp (ISO 8601)
+COLUMNS = [("url", "url", "string"),
+           ("name", "name", "string"),
+           ("has_official_badge", "has_official_badge", "bool"),
+           ("score", "score", "float"),
+           ("num_reviews", "num_reviews", "int"),
+           ("num_bookmarks", "num_bookmarks", "int"),
+           ("nearest_station", "nearest_station", "string"),
+           ("genre", "genre", "string"),
+           ("budget_lunch", "budget_lunch", "string"),
+           ("budget_dinner", "budget_dinner", "string"),
+           ("regular_holiday", "regular_holiday", "string"),
+           ("is_serve_takeout", "is_serve_takeout", "bool"),
+           ("pr_title", "pr_title", "string"),
+           ("pr_comment", "pr-comment", "string"),
+           ("kodawari", "kodawari", "string"),
+           ("hygiene", "hygiene", "string"),
+           ("top_course", "top-course", "string"),
+           ("coupon", "coupon", "string"),
+           ("booking_inquiry", "booking_inquiry", "string"),
+           ("booking_availability", "booking_availability", "string"),
+           ("address", "address", "string"),
+           ("transportation", "transportation", "string"),
+           ("business_hours", "business_hours", "string"),
+           ("payment_method", "payment_method", "string"),
+           ("service_charge", "service_charge", "string"),
+           ("num_seat", "num_seat", "int"),
+           ("num_max_booking", "num_max_booking", "int"),
+           ("private_room", "private_room", "string"),
+           ("charter", "charter", "string"),
+           ("smoking", "smoking", "string"),
+           ("parking", "parking", "string"),
+           ("space_equipment", "space_equipment", "string"),
+           ("mobile_phone", "mobile_phone", "string"),
+           ("course", "course", "string"),
+           ("drink", "drink", "string"),
+           ("cuisine", "cuisine", "string"),
+           ("go_to_eat", "go_to_eat", "string"),
+           ("scene", "scene", "string"),
+           ("location", "location", "string"),
+           ("service", "service", "string"),
+           ("with_children", "with_children", "string"),
+           ("homepage", "homepage", "string"),
+           ("twitter", "twitter", "string"),
+           ("instagram", "instagram", "string"),
+           ("facebook", "facebook", "string"),
+           ("opening_date", "opening_date", "string"),
+           ("telephone", "telephone", "string"),
+           ("other", "other", "string"),
+           ("has_google_ad", "has_google_ad", "bool"),
+           ("created_at", "created_at", "timestamp")]
+
+_NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+
+def parse_float(value):
+    # "3.58" -> 3.58, "-" や空文字 (スコアなし) -> None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    match = _NUMBER.search(str(value or ""))
+    return float(match.group().replace(",", "")) if match else None
+
+
+def parse_int(value):
+    # "1,234" -> 1234, "40席" -> 40, "着席時 40人、立食時 60人" -> 40
+    number = parse_float(value)
+    return int(number) if number is not None else None
+
+
+def parse_bool(value):
+    # DynamoDBのboolと、csvから読み込んだ文字列の両方に対応する
+    if isinstance(value, bool):
+        return value
+    if value is None or value == "":
+        return None
+    return str(value).lower() in ("true", "1")
+
+
+def parse_timestamp(value):
+    try:
+        return datetime.datetime.fromisoformat(str(value)) if value else None
+    except ValueError:
+        return None
+
+
+PARSERS = {"string": lambda value: None if value is None else str(value),
+           "bool": parse_bool,
+           "float": parse_float,
+           "int": parse_int,
+           "timestamp": parse_timestamp}
+
+
+def get_compression():
+    compression = os.environ.get("PARQUET_COMPRESSION", DEFAULT_COMPRESSION)
+    return None if compression == "none" else compression
+
+
+def get_row_group_size():
+    return int(os.environ.get("PARQUET_ROW_GROUP_SIZE", str(DEFAULT_ROW_GROUP_SIZE)))
+
+
+def is_available():
+    # pyarrowを読み込めるか (LambdaではpyarrowのLambdaレイヤーを追加した場合のみ)
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_schema():
+    import pyarrow as pa
+    types = {"string": pa.string(), "bool": pa.bool_(), "float": pa.float64(), "int": pa.int64(),
+             "timestamp": pa.timestamp("us")}
+    return pa.schema([(name, types[type_name]) for name, _, type_name in COLUMNS])
+
+
+class ParquetResultWriter:
+    # スクレイピング結果を列ごとのバッファに溜め、row_group_size件ごとに1つのrow groupとして書き出す
+    # fにはファイルのパスまたは書き込み可能なファイルオブジェクト (S3MultipartWriterなど) を渡せる
+    # Parquetは閉じるときにフッターを書くため、csvと異なり既存のファイルへの追記はできない
+    def __init__(self, f, row_group_size: int = None, compression: str = None):
+        import pyarrow.parquet as pq
+        self.schema = get_schema()
+        self.row_group_size = row_group_size or get_row_group_size()
+        self.writer = pq.ParquetWriter(f, self.schema, compression=compression or get_compression())
+        self.columns = {name: [] for name, _, _ in COLUMNS}
+        self.num_buffered = 0
+        self.num_rows = 0
+
+    def write(self, da: dict, input_rst_name: str = None):
+        for name, key, type_name in COLUMNS:
+            self.columns[name].append(PARSERS[type_name](da.get(key)))
+        self.num_buffered += 1
+        if self.num_buffered >= self.row_group_size:
+            self.flush()
+
+    def write_rows(self, items):
+        for da in items:
+            self.write(da)
+
+    def mark_done(self, input_rst_name: str = None):
+        # CsvResultWriterと同じインターフェース (Parquetでは途中からの再開に対応しないため記録しない)
+        pass
+
+    def flush(self):
+        import pyarrow as pa
+        if not self.num_buffered:
+            return
+        table = pa.Table.from_pydict(self.columns, schema=self.schema)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.num_rows += self.num_buffered
+        self.columns = {name: [] for name in self.columns}
+        self.num_buffered = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def dump_to_parquet(pages, f):
+    # DynamoDBのscanのページを順に書き出す (dump_to_csvと同じ引数)
+    with ParquetResultWriter(f) as writer:
+        for page in pages:
+            writer.write_rows(page)
+    return writer.num_rows
@@ -0,0 +1,61 @@
+import io
+
+# マルチパートアップロードの1パートの大きさ (最後のパート以外は5MB以上である必要がある)
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+class S3MultipartWriter(io.RawIOBase):
+    # 書き込まれたデータをpart_sizeごとにS3へマルチパートアップロードする
+    # ファイル全体をメモリや/tmpに置かずにS3へ書き出せる
+    def __init__(self, s3_client, bucket: str, key: str, part_size: int = DEFAULT_PART_SIZE, **kwargs):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.num_bytes = 0
+        response = s3_client.create_multipart_upload(Bucket=bucket, Key=key, **kwargs)
+        self.upload_id = response["UploadId"]
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buffer.extend(b)
+        self.num_bytes += len(b)
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+        return len(b)
+
+    def _upload_part(self):
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(Bucket=self.bucket, Key=self.key, PartNumber=part_number,
+                                              UploadId=self.upload_id, Body=bytes(self.buffer))
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.closed:
+            return
+        # 残りのデータを最後のパートとしてアップロードしてから完了する
+        if self.buffer or not self.parts:
+            self._upload_part()
+        self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                 MultipartUpload={"Parts": self.parts})
+        super().close()
+
+    def abort(self):
+        if self.closed:
+            return
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        self.buffer = bytearray()
+        super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        # 途中で失敗した場合は中途半端なファイルを残さないようにアップロードを中止する
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
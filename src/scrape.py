@@ -1,138 +1,163 @@
 import os
-import datetime
-import time
-import requests
-from bs4 import BeautifulSoup
 import json
-import boto3
-
-dynamodb = boto3.resource("dynamodb")
-sqs = boto3.client("sqs")
-
-
-def scrape(url: str):
-    html = BeautifulSoup(requests.get(url).content, "html5lib")
-    rstinfo_table = html.find("div", class_="rstinfo-table")
-
-    def filter_booking_inquiry(tag):
-        if tag.name == 'th' and tag.get_text(strip=True) == '予約・お問い合わせ':
-            return True
-        return False
-
-    def filter_business_hours(tag):
-        if tag.name == 'th' and tag.get_text(strip=True) == '営業時間・定休日':
-            return True
-        return False
-
-    def filter_service_charge(tag):
-        if tag.name == 'th' and tag.get_text(strip=True) == 'サービス料・チャージ':
-            return True
-        return False
-
-    def get_pr_comment():
-        if html.find("div", class_="pr-comment") is None:
-            return ""
-        return '\n'.join([x for x in html.find("div", class_="pr-comment").stripped_strings])
-
-    def get_data_from_table(key: str):
-        # キーが存在しない場合には空文字
-        if rstinfo_table.find("th", string=key) is None:
-            return ""
-        return '\n'.join([x for x in rstinfo_table.find("th", string=key).find_next("td").stripped_strings])
-
-    def get_data_from_table_by_filter(filter):
-        # キーが存在しない場合には空文字
-        if rstinfo_table.find(filter) is None:
-            return ""
-        return '\n'.join([x for x in rstinfo_table.find(filter).find_next("td").stripped_strings])
-
-    def get_sns_url(sns_name: str):
-        # 公式アカウントキーが存在しない場合は空文字
-        th_tag = rstinfo_table.find("th", string="公式アカウント")
-        if th_tag is None:
-            return ""
-        # 該当のsnsアカウントが存在しない場合は空文字
-        a_tag = th_tag.find_next("td").find(
-            "a", class_=f"rstinfo-sns-{sns_name}")
-        if a_tag is None:
-            return ""
-        return a_tag.get("href")
-
-    return {
-        "url": url,
-        "name": str(html.find("h2", class_="display-name").find("span").get_text(strip=True)),
-        "has_official_badge": html.find("p", class_="owner-badge__icon") is not None,
-        "score": str(html.find("span", class_="rdheader-rating__score-val-dtl").string),
-        "num_reviews": str(html.find("span", class_="rdheader-rating__review-target").find("em").string),
-        "num_bookmarks": str(html.find("span", class_="rdheader-rating__hozon-target").find("em").string),
-        "nearest_station": str(html.find("dl", class_="rdheader-subinfo__item--station").find("span", class_="linktree__parent-target-text").string if html.find("dl", class_="rdheader-subinfo__item--station") is not None else ""),
-        "genre": str(rstinfo_table.find("th", string="ジャンル").find_next("td").find("span").string),
-        "budget_dinner": str(html.find("p", class_="rdheader-budget__icon--dinner").find("a", class_="rdheader-budget__price-target").string),
-        "budget_lunch": str(html.find("p", class_="rdheader-budget__icon--lunch").find("a", class_="rdheader-budget__price-target").string),
-        "regular_holiday": str(html.find("dd", class_="rdheader-subinfo__closed-text").get_text(strip=True) if html.find("dd", class_="rdheader-subinfo__closed-text") is not None else ""),
-        "is_serve_takeout": html.find("div", class_="rstdtl-takeout-info") is not None,
-        "pr_title": str(html.find("h3", class_="pr-comment-title").string if html.find("h3", class_="pr-comment-title") else ""),
-        "pr-comment": get_pr_comment(),
-        "kodawari": '\n'.join([x.get_text(strip=True) for x in html.find_all("p", class_="rstdtl-top-kodawari__title")]),
-        "hygiene": '、'.join([x.get_text(strip=True) for x in html.find("div", class_="rstdtl-hygiene").find_all("p", class_="rstdtl-hygiene__data")]) if html.find("div", class_="rstdtl-hygiene") else "",
-        "top-course": '、'.join([x.text for x in html.find_all("span", class_="rstdtl-course-list__price-num")]),
-        "coupon": '、'.join([x.text for x in html.find_all("p", class_="rstdtl-rstinfo-coupon__description")]),
-        "booking_inquiry": get_data_from_table_by_filter(filter_booking_inquiry),
-        "booking_availability": get_data_from_table(key="予約可否"),
-        "address": str(rstinfo_table.find("th", string="住所").find_next("td").find("p", class_="rstinfo-table__address").text),
-        "transportation": get_data_from_table(key="交通手段"),
-        "business_hours": get_data_from_table_by_filter(filter_business_hours),
-        "payment_method": get_data_from_table(key="支払い方法"),
-        "service_charge": get_data_from_table_by_filter(filter_service_charge),
-        "num_seat": get_data_from_table(key="席数"),
-        "num_max_booking": get_data_from_table(key="最大予約可能人数"),
-        "private_room": get_data_from_table(key="個室"),
-        "charter": get_data_from_table(key="貸切"),
-        "smoking": get_data_from_table(key="禁煙・喫煙"),
-        "parking": get_data_from_table(key="駐車場"),
-        "space_equipment": get_data_from_table(key="空間・設備"),
-        "mobile_phone": get_data_from_table(key="携帯電話"),
-        "course": get_data_from_table(key="コース"),
-        "drink": get_data_from_table(key="ドリンク"),
-        "cuisine": get_data_from_table(key="料理"),
-        "go_to_eat": get_data_from_table(key="Go To Eat"),
-        "scene": get_data_from_table(key="利用シーン"),
-        "location": get_data_from_table(key="ロケーション"),
-        "service": get_data_from_table(key="サービス"),
-        "with_children": get_data_from_table(key="お子様連れ"),
-        "homepage": get_data_from_table(key="ホームページ"),
-        "twitter": get_sns_url(sns_name="twitter"),
-        "instagram": get_sns_url(sns_name="instagram"),
-        "facebook": get_sns_url(sns_name="facebook"),
-        "opening_date": get_data_from_table(key="オープン日"),
-        "telephone": get_data_from_table(key="電話番号"),
-        "other": get_data_from_table(key="備考"),
-        "has_google_ad": html.find("aside", class_="rstdtl-side-banner") is not None,
-        "created_at": datetime.datetime.now().isoformat()
-    }
+import hashlib
+import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from src.http_client import fetch_if_modified, get_connection_stats, set_deadline
+from src.parser import parse_html
+from src.extractor import extract_rst_data
+from src.dynamodb_utils import batch_get_items
+from src.rate_limit import get_fetch_concurrency, get_global_limiter
+from src.refresh_schedule import next_interval
+from src.sqs_publisher import PublishError, publish_messages
+from src.throttle import BlockedError, get_controller, plan_retries
+from src.sqs_batch import SqsBatch, call_or_error
+from src import inflight
+from src import aws
+from src import metrics
+
+dynamodb = aws.resource("dynamodb")
+sqs = aws.client('sqs')
+
+
+def scrape(url: str, previous=None):
+    # previousに前回保存したアイテムを渡すと、変更がないページは解析せずにアイテムをNoneで返す
+    # 戻り値: (アイテム, "changed" | "not_modified" | "same_hash", 応答の検証子)
+    # 変更がない場合も、次回の条件付きリクエストのために応答の検証子を返す
+    previous = previous or {}
+    with metrics.timer("detail_fetch"):
+        content, validators = fetch_if_modified(url, previous.get("etag"), previous.get("last_modified"))
+    if content is None:
+        return None, "not_modified", validators
+    # 検証子に対応していないページはHTMLのハッシュを比べる
+    content_hash = hashlib.sha256(content).hexdigest()
+    if content_hash == previous.get("content_hash"):
+        return None, "same_hash", validators
+
+    html = parse_html(content)
+    with metrics.timer("extract"):
+        item = extract_rst_data(html, url)
+    item["content_hash"] = content_hash
+    item.update(validators)
+    return item, "changed", validators
+
+
+def scrape_once(url: str, previous=None, claim: bool = True):
+    # 他のワーカーが処理中のURLはスキップする (DB_INFLIGHT_TABLEが設定されている場合)
+    # claim=Falseの場合 (use_cacheがFalseの明示的な再取得) は印を確認せずに取得する
+    if claim and not inflight.claim(url):
+        return None, "in_flight", {}
+    try:
+        return scrape(url, previous)
+    except Exception:
+        inflight.release(url)
+        raise
 
 
 def handler(event, context):
-    table = dynamodb.Table(os.environ['DB_RST_DATA_TABLE'])
-    # SQSのメッセージからスクレイプ対象のURLを取得
-    for i, record in enumerate(event['Records']):
-        url = json.loads(record["body"])["url"]
-        # URLが空の場合は処理をスキップ
-        if not url:
-            continue
-        use_cache: bool = json.loads(record['body'])["use_cache"]
-
-        # use_cacheがTrueの場合、DynamoDBにデータがあれば処理をしない
-        if use_cache:
-            response = table.get_item(Key={"url": url})
-            if 'Item' in response:
-                continue
-
-        # スクレイピング結果を取得してDynamoDBに保存
-        item = scrape(url)
-        table.put_item(Item=item)
-
-        # 次のリクエストをする前に少し待機する
-        if i != len(event['Records']) - 1:
-            time.sleep(2)
-    return
+    table_name = os.environ['DB_RST_DATA_TABLE']
+    table = dynamodb.Table(table_name)
+    # Lambdaのタイムアウトまでに終えられないリクエストは送らず、リトライキューに戻す
+    set_deadline(context)
+    # SQSのメッセージからスクレイプ対象のURLを取得 (URLが空の場合は処理をスキップ、不正な形式のメッセージはDLQに送る)
+    metrics.record_queue_wait(event['Records'])
+    batch = SqsBatch("scrape", event['Records'], ("url", "use_cache"))
+    requests = [request for request in batch.requests if request["url"]]
+
+    # 保存済みのアイテムをまとめてDynamoDBから取得する
+    # use_cacheがTrueのURLはデータがあれば処理をせず、それ以外は前回の検証子を使って再取得する
+    saved = batch_get_items(dynamodb, table_name, "url", [request["url"] for request in requests])
+    cached = {request["url"] for request in requests if request["use_cache"] and request["url"] in saved}
+    metrics.count("db_cache_hits", len(cached))
+    # 同じバッチ内で重複したURLは1回だけスクレイピングする
+    targets = list(dict.fromkeys([request["url"] for request in requests
+                                  if not (request["use_cache"] and request["url"] in saved)]))
+    refresh = {request["url"] for request in requests if not request["use_cache"]}
+
+    # スクレイピングは複数スレッドで並行して行い、通信の待ち時間を重ねる
+    # リクエストの間隔はFETCH_INTERVALで制御するため、平均のリクエスト頻度は変わらない
+    # 結果は取得し終えてからDynamoDBにまとめて保存する (batch_writerはスレッドセーフではないためメインスレッドで書き込む)
+    # 前回から変更がないページは保存せず、確認日時と再取得の間隔 (と応答にあれば新しい検証子) だけを更新する
+    # 食べログにブロックされたURLはblockedにまとめ、最後にリトライキューに戻す
+    # それ以外の例外 (ページの構造が違うなど) で失敗したURLはfailedにまとめ、そのURLのメッセージだけを失敗にする
+    statuses = Counter()
+    changed = []
+    unchanged = {}
+    blocked = {}
+    failed = {}
+    # 処理中の印は保存し終えたら消す (保存に失敗した場合も消し、SQSの再配信で再度処理できるようにする)
+    in_flight = {}
+    claimed = []
+    try:
+        with ThreadPoolExecutor(max_workers=get_fetch_concurrency()) as executor:
+            results = executor.map(lambda url: call_or_error(scrape_once, url, saved.get(url),
+                                                             url not in refresh), targets)
+            for url, result in zip(targets, results):
+                if isinstance(result, BlockedError):
+                    blocked[url] = result
+                    continue
+                if isinstance(result, Exception):
+                    failed[url] = result
+                    continue
+                item, status, validators = result
+                statuses[status] += 1
+                if status == "in_flight":
+                    in_flight[url] = inflight.InFlightError(url)
+                    continue
+                if url not in refresh:
+                    claimed.append(url)
+                if item is None:
+                    unchanged[url] = validators
+                    continue
+                item["checked_at"] = item["changed_at"] = item["created_at"]
+                item["revisit_interval"] = next_interval(saved.get(url), changed=True)
+                changed.append(item)
+
+        checked_at = datetime.datetime.now().isoformat()
+        with metrics.timer("db_write"):
+            with table.batch_writer(overwrite_by_pkeys=["url"]) as writer:
+                for item in changed:
+                    writer.put_item(Item=item)
+            for url, validators in unchanged.items():
+                values = {":checked_at": checked_at, ":interval": next_interval(saved.get(url), changed=False)}
+                values.update({f":{key}": value for key, value in validators.items()})
+                table.update_item(Key={"url": url},
+                                  UpdateExpression="SET " + ", ".join(
+                                      ["checked_at = :checked_at", "revisit_interval = :interval"]
+                                      + [f"{key} = :{key}" for key in validators]),
+                                  ExpressionAttributeValues=values)
+    finally:
+        inflight.release_all(claimed)
+
+    # ブロックされたURLは、Retry-Afterの間を空けて同じキューに戻す (リトライキュー)
+    retry_counts = {}
+    exhausted = []
+    unsent = {}
+    if blocked:
+        blocked_requests = list({request["url"]: request for request in requests
+                                 if request["url"] in blocked}.values())
+        retries, delay, exhausted = plan_retries(blocked_requests, list(blocked.values()))
+        retry_counts, unsent_retries = publish_messages(sqs, os.environ['SCRAPE_REQUEST_SQS_URL'], retries,
+                                                        delay_seconds=delay)
+        unsent = {body["url"]: PublishError(os.environ['SCRAPE_REQUEST_SQS_URL'], 1) for body in unsent_retries}
+        metrics.count("retry_queued", len(retries) - len(unsent_retries))
+
+    # 失敗したURLのメッセージだけをbatchItemFailuresとして返し、SQSに再配信させる
+    # キューに戻す回数の上限に達したURLとキューに戻せなかったURLも失敗にし、DLQ_MAX_RECEIVE_COUNT回受け取ったものはDLQに送る
+    batch.fail("url", failed)
+    batch.fail("url", unsent)
+    batch.fail("url", {request["url"]: blocked[request["url"]] for request in exhausted})
+    # 他のワーカーが処理中だったURLは、DLQには送らずに再配信させる (再配信時には保存済みのデータを使う)
+    batch.retry("url", in_flight)
+    response = batch.finish(sqs, os.environ.get('SCRAPE_REQUEST_DLQ_URL', ""))
+    print(json.dumps({"requests": len(requests), "cached": len(cached), "scraped": len(targets),
+                      "changed": statuses["changed"],
+                      "unchanged": statuses["not_modified"] + statuses["same_hash"],
+                      "not_modified": statuses["not_modified"], "in_flight": statuses["in_flight"],
+                      "blocked": len(blocked), "exhausted": len(exhausted), "retry_sqs": retry_counts,
+                      "batch": batch.stats,
+                      "connection_stats": get_connection_stats(), "rate_limit": get_global_limiter().stats,
+                      "throttle": get_controller().snapshot()}))
+    metrics.flush("scrape")
+    return response
@@ -0,0 +1,196 @@
+import json
+import sqlite3
+import decimal
+import threading
+
+# DynamoDBのテーブル (TabelogRstUrl, TabelogRstData, TabelogRstListing) と同じ構成のSQLiteのデータベース
+# ローカル実行の結果の保存先・キャッシュと、ハンドラーを動かす際のDynamoDBの代わりに使う
+# アイテム全体をJSONで持ち、キーと検索に使う属性は列にしてインデックスを張る
+#   sqlite3 results.sqlite "SELECT json_extract(item, '$.name'), json_extract(item, '$.score') FROM TabelogRstData"
+
+# テーブル名 -> (パーティションキー, インデックスを張る属性)
+TABLES = {"TabelogRstUrl": ("input_rst_name", ["url", "created_at"]),
+          "TabelogRstData": ("url", ["created_at"]),
+          "TabelogRstListing": ("rst_name", ["url"])}
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_PAGE_SIZE = 1000
+
+
+def _default(value):
+    # boto3のresourceが返す数値 (Decimal) をJSONに変換する
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class SqliteStore:
+    # WALモードで開き、書き込みはbatch_size件ごとに1つのトランザクションでコミットする
+    # (同じ接続からはコミット前の書き込みも読める。複数スレッドから使える)
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.num_pending = 0
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # WALではNORMALでもデータベースは壊れない (電源断時に直近のコミットが失われる可能性のみ)
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            for table_name, (key_name, index_names) in TABLES.items():
+                columns = "".join([f", {name} TEXT" for name in index_names])
+                self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" '
+                                        f'({key_name} TEXT PRIMARY KEY{columns}, item TEXT NOT NULL)')
+                for name in index_names:
+                    self.connection.execute(f'CREATE INDEX IF NOT EXISTS "{table_name}_{name}" '
+                                            f'ON "{table_name}" ({name})')
+
+    def get_item(self, table_name: str, key: str):
+        key_name, _ = TABLES[table_name]
+        with self.lock:
+            row = self.connection.execute(f'SELECT item FROM "{table_name}" WHERE {key_name} = ?',
+                                          (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_items(self, table_name: str, keys):
+        # キーの値 -> アイテム の辞書を返す (SQLiteの変数の上限を超えないよう分けて取得する)
+        key_name, _ = TABLES[table_name]
+        keys = list(dict.fromkeys(keys))
+        items = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.connection.execute(
+                    f'SELECT {key_name}, item FROM "{table_name}" WHERE {key_name} IN ({", ".join("?" * len(chunk))})',
+                    chunk).fetchall()
+                items.update({key: json.loads(item) for key, item in rows})
+        return items
+
+    def put_item(self, table_name: str, item: dict):
+        # 同じキーのアイテムは上書きする
+        key_name, index_names = TABLES[table_name]
+        names = [key_name] + index_names
+        values = [item.get(name) for name in names] + [json.dumps(item, ensure_ascii=False, default=_default)]
+        with self.lock:
+            self.connection.execute(f'INSERT OR REPLACE INTO "{table_name}" ({", ".join(names)}, item) '
+                                    f'VALUES ({", ".join("?" * (len(names) + 1))})', values)
+            self._written()
+
+    def update_item(self, table_name: str, key: str, values: dict):
+        # 属性の一部を更新する (アイテムがない場合はキーと属性だけのアイテムを作る)
+        key_name, _ = TABLES[table_name]
+        with self.lock:
+            item = self.get_item(table_name, key) or {key_name: key}
+            item.update(values)
+            self.put_item(table_name, item)
+
+    def _written(self):
+        self.num_pending += 1
+        if self.num_pending >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+            self.num_pending = 0
+
+    def scan_page(self, table_name: str, after: int = 0, segment: int = 0, total_segments: int = 1,
+                  limit: int = DEFAULT_PAGE_SIZE):
+        # rowidの順にlimit件を返す。segmentごとに rowid % total_segments == segment の行を返す (並列scan用)
+        # 戻り値: (アイテムのリスト, 次のページのafter。最後のページの場合はNone)
+        with self.lock:
+            rows = self.connection.execute(f'SELECT rowid, item FROM "{table_name}" WHERE rowid > ? '
+                                           f'AND rowid % ? = ? ORDER BY rowid LIMIT ?',
+                                           (after, total_segments, segment, limit)).fetchall()
+        items = [json.loads(item) for _, item in rows]
+        return items, (rows[-1][0] if len(rows) == limit else None)
+
+    def iter_pages(self, table_name: str, page_size: int = DEFAULT_PAGE_SIZE):
+        after = 0
+        while after is not None:
+            items, after = self.scan_page(table_name, after, limit=page_size)
+            if items:
+                yield items
+
+    def count(self, table_name: str):
+        with self.lock:
+            return self.connection.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SqliteBatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.table.store.commit()
+
+
+class SqliteTable:
+    # boto3のDynamoDB.Tableのうち、このリポジトリで使う操作のみ
+    def __init__(self, store: SqliteStore, table_name: str):
+        self.store = store
+        self.table_name = table_name
+        self.key_name = TABLES[table_name][0]
+
+    def batch_writer(self, **kwargs):
+        return SqliteBatchWriter(self)
+
+    def put_item(self, Item, **kwargs):
+        self.store.put_item(self.table_name, Item)
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        item = self.store.get_item(self.table_name, Key[self.key_name])
+        return {"Item": item} if item is not None else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, **kwargs):
+        # "SET a = :a, b = :b" の形式のみ対応する
+        values = {}
+        for assignment in UpdateExpression[len("SET "):].split(","):
+            name, value = [x.strip() for x in assignment.split("=")]
+            values[name] = ExpressionAttributeValues[value]
+        self.store.update_item(self.table_name, Key[self.key_name], values)
+        return {}
+
+    def scan(self, ExclusiveStartKey=None, Segment=0, TotalSegments=1, Limit=DEFAULT_PAGE_SIZE, **kwargs):
+        # ProjectionExpressionなどは無視してアイテム全体を返す
+        after = ExclusiveStartKey["rowid"] if ExclusiveStartKey else 0
+        items, after = self.store.scan_page(self.table_name, after, Segment, TotalSegments, Limit)
+        response = {"Items": items, "Count": len(items)}
+        if after is not None:
+            response["LastEvaluatedKey"] = {"rowid": after}
+        return response
+
+
+class SqliteDynamoDB:
+    # boto3のDynamoDBのresourceの代わり
+    # src.get_url.dynamodb などに代入すると、ハンドラーをAWSなしで動かせる
+    def __init__(self, store: SqliteStore):
+        self.store = store
+
+    def Table(self, table_name: str):
+        return SqliteTable(self.store, table_name)
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for table_name, request in RequestItems.items():
+            key_name = TABLES[table_name][0]
+            items = self.store.get_items(table_name, [key[key_name] for key in request["Keys"]])
+            responses[table_name] = list(items.values())
+        return {"Responses": responses}
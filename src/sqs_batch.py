@@ -0,0 +1,105 @@
+import os
+import json
+import datetime
+from src.sqs_publisher import publish_messages
+from src import metrics
+
+# SQSのバッチのメッセージごとに失敗を扱う (イベントソースのReportBatchItemFailures)
+# 失敗したメッセージだけをbatchItemFailuresとして返し、成功したメッセージは再配信させない
+# 何度受け取っても処理できないメッセージ (不正な形式・壊れたページなど) は、失敗の理由と一緒にDLQへ送る
+#   DLQ_MAX_RECEIVE_COUNT: この回数受け取っても処理できなかったメッセージをDLQに送る
+# DLQのURLが設定されていない場合は送らずに、batchItemFailuresとしてSQSの再配信 (RedrivePolicy) に任せる
+DEFAULT_MAX_RECEIVE_COUNT = 3
+
+
+def get_max_receive_count():
+    return int(os.environ.get("DLQ_MAX_RECEIVE_COUNT", str(DEFAULT_MAX_RECEIVE_COUNT)))
+
+
+def call_or_error(func, *args):
+    # 例外は送出せずに戻り値として返す (並行して処理している他のメッセージの結果を失わないため)
+    try:
+        return func(*args)
+    except Exception as e:
+        return e
+
+
+def get_receive_count(record: dict):
+    return int(record.get("attributes", {}).get("ApproximateReceiveCount", "1"))
+
+
+def describe_error(error):
+    return f"{type(error).__name__}: {error}"
+
+
+class SqsBatch:
+    # required_keysがないメッセージとJSONでないメッセージは、受け取った時点でDLQに送る
+    # messageIdがないレコード (ローカル実行・ベンチマーク) はバッチ内の順番をIDとして使う
+    def __init__(self, handler_name: str, records: list, required_keys=()):
+        self.handler_name = handler_name
+        self.entries = []
+        self.failures = {}
+        self.dead_letters = {}
+        self.stats = {}
+        for i, record in enumerate(records):
+            message_id = record.get("messageId", str(i))
+            try:
+                request = json.loads(record["body"])
+                missing = [key for key in required_keys if key not in request]
+                if missing:
+                    raise ValueError(f"missing keys: {', '.join(missing)}")
+            except (ValueError, TypeError) as e:
+                self.dead_letter(message_id, record, e)
+                continue
+            self.entries.append((message_id, record, request))
+
+    @property
+    def requests(self):
+        return [request for _, _, request in self.entries]
+
+    def fail(self, key: str, errors: dict):
+        # request[key]がerrorsにあるメッセージを失敗にする (同じ店名・URLのメッセージはまとめて失敗する)
+        # DLQ_MAX_RECEIVE_COUNT回受け取っても失敗したメッセージはDLQに送る
+        max_receive_count = get_max_receive_count()
+        for message_id, record, request in self.entries:
+            if request.get(key) not in errors:
+                continue
+            error = errors[request[key]]
+            if get_receive_count(record) >= max_receive_count:
+                self.dead_letter(message_id, record, error)
+            else:
+                self.failures[message_id] = describe_error(error)
+
+    def retry(self, key: str, errors: dict):
+        # 他のワーカーが処理中などで今は処理できないメッセージを、DLQには送らずに再配信させる
+        # (何度も続く場合はキューのRedrivePolicyでDLQに移される)
+        for message_id, _, request in self.entries:
+            if request.get(key) in errors:
+                self.failures[message_id] = describe_error(errors[request[key]])
+
+    def dead_letter(self, message_id: str, record: dict, error):
+        self.dead_letters[message_id] = {
+            "handler": self.handler_name,
+            "message_id": message_id,
+            "body": record.get("body"),
+            "reason": describe_error(error),
+            "receive_count": get_receive_count(record),
+            "failed_at": datetime.datetime.now().isoformat()}
+
+    def finish(self, sqs, dlq_url: str):
+        # DLQに送り、ハンドラーの戻り値 (batchItemFailures) を返す
+        # DLQのURLがない場合とDLQに送れなかったメッセージは、失敗としてSQSの再配信に任せる (メッセージを失わないため)
+        # DLQに送れたメッセージは失敗にしない (再配信されてDLQに重複して送られないように)
+        failures = dict(self.failures)
+        counts = {}
+        if self.dead_letters:
+            unsent = list(self.dead_letters.values())
+            if dlq_url:
+                counts, unsent = publish_messages(sqs, dlq_url, unsent)
+            failures.update({letter["message_id"]: letter["reason"] for letter in unsent})
+        metrics.count("batch_item_failures", len(failures))
+        metrics.count("dead_lettered", counts.get("sent", 0))
+        self.stats = {"failed": len(failures), "dead_lettered": counts.get("sent", 0),
+                      "reasons": sorted(set(failures.values()) | {letter["reason"] for letter in
+                                                                   self.dead_letters.values()})[:10]}
+        return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failures]}
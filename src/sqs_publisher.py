@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from src import metrics
+
+# send_message_batchで一度に送れる最大件数
+MAX_BATCH_SIZE = 10
+
+
+class PublishError(Exception):
+    # リトライしても送信できなかったメッセージがある場合に送出する
+    def __init__(self, queue_url: str, num_failed: int):
+        super().__init__(f"{num_failed} messages could not be sent to {queue_url}")
+        self.queue_url = queue_url
+        self.num_failed = num_failed
+
+
+def get_max_workers():
+    return int(os.environ.get("SQS_PUBLISH_WORKERS", "8"))
+
+
+def _chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def send_batch(sqs, queue_url: str, bodies: list, max_retries: int = 3, delay_seconds: int = 0):
+    # 失敗したメッセージのみを指数バックオフしながら再送する
+    # delay_secondsを指定すると、その秒数が経つまでメッセージを受け取れないようにする (最大900秒)
+    # 戻り値: (送信できた件数, 送信できなかったメッセージのリスト, リトライ回数)
+    entries = {str(i): json.dumps(body) for i, body in enumerate(bodies)}
+    retries = 0
+    for attempt in range(max_retries + 1):
+        if attempt > 0:
+            retries += 1
+            time.sleep(0.1 * 2 ** (attempt - 1))
+        try:
+            with metrics.timer("sqs_send"):
+                response = sqs.send_message_batch(
+                    QueueUrl=queue_url,
+                    Entries=[{"Id": i, "MessageBody": body, "DelaySeconds": delay_seconds}
+                             for i, body in entries.items()])
+        except Exception as e:
+            print(f"send_message_batch failed: {e}")
+            continue
+        entries = {x["Id"]: entries[x["Id"]] for x in response.get("Failed", [])}
+        if not entries:
+            break
+    if retries:
+        metrics.count("sqs_retries", retries)
+    return len(bodies) - len(entries), [bodies[int(i)] for i in entries], retries
+
+
+def publish_messages(sqs, queue_url: str, bodies, max_workers: int = None, max_retries: int = 3,
+                     delay_seconds: int = 0):
+    # メッセージを10件ずつのバッチにまとめ、複数スレッドで並行して送信する
+    # bodiesはジェネレーターでもよく、送信中のバッチ数はmax_workersの数倍までに抑える
+    # 戻り値: (件数の集計, 送信できなかったメッセージのリスト)
+    # 呼び出し側は送信できなかったメッセージの元になったメッセージを失敗にするか、PublishErrorを送出する
+    max_workers = max_workers or get_max_workers()
+    counts = {"sent": 0, "failed": 0, "batches": 0, "retries": 0}
+    failed_bodies = []
+
+    def collect(future):
+        sent, failed, retries = future.result()
+        counts["sent"] += sent
+        counts["failed"] += len(failed)
+        counts["retries"] += retries
+        failed_bodies.extend(failed)
+        counts["batches"] += 1
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = []
+        for batch in _chunks(bodies, MAX_BATCH_SIZE):
+            pending.append(executor.submit(send_batch, sqs, queue_url, batch, max_retries, delay_seconds))
+            if len(pending) >= max_workers * 4:
+                collect(pending.pop(0))
+        for future in pending:
+            collect(future)
+    return counts, failed_bodies
@@ -0,0 +1,305 @@
+import os
+import math
+import time
+import datetime
+import threading
+import email.utils
+from collections import deque
+
+# 食べログの応答からブロックされたことを検知し、リクエストの頻度と同時実行数を調整する (AIMD)
+# 429・503とcaptcha・アクセス制限のページをブロックとみなし、頻度と同時実行数をTHROTTLE_DECREASE倍に下げて
+# Retry-After (ない場合はTHROTTLE_BACKOFF秒から倍々) の間は送らない。成功するたびに少しずつ戻す
+# 連続してブロックされた場合はサーキットブレーカーを開き、リトライで食べログに負荷をかけずに処理を保留する
+#   THROTTLE_MAX_RPS: 頻度の上限 (0の場合はブロックされるまで制限せず、ブロックされた時点の頻度を上限とする)
+#   THROTTLE_MIN_RPS: 頻度の下限
+#   THROTTLE_INCREASE: 成功1回あたりに上げる頻度 (回/秒)
+#   THROTTLE_DECREASE: ブロックされたときに頻度と同時実行数に掛ける割合
+#   THROTTLE_MAX_CONCURRENCY: 同時実行数の上限 (0の場合は頻度と同様)
+#   THROTTLE_BACKOFF: Retry-Afterがない場合に待つ秒数 (連続してブロックされるたびに倍にする)
+#   THROTTLE_MAX_WAIT: 1回のリクエストで待つ最大の秒数。これより長く待つ必要がある場合は待たずにBlockedErrorにする
+#   THROTTLE_MAX_RETRIES: ブロックされたリクエストを待ってから送り直す回数
+#   THROTTLE_MAX_ATTEMPTS: Lambdaでブロックされたリクエストをキューに戻す回数の上限
+#   CIRCUIT_FAILURE_THRESHOLD: サーキットブレーカーを開く連続したブロックの回数
+#   CIRCUIT_COOLDOWN, CIRCUIT_MAX_COOLDOWN: サーキットブレーカーを開いておく秒数 (試しに送ったリクエストが失敗するたびに倍にする) と上限
+BLOCK_STATUS_CODES = (429, 503)
+# captcha・アクセス制限のページに含まれる文字列 (200で返される場合がある)
+BLOCK_PAGE_MARKERS = (b"g-recaptcha", b"h-captcha", b"cf-chl-",
+                      "アクセスが集中".encode(), "不正なアクセス".encode(), "ロボットではない".encode())
+# 実際の頻度を求める区間(秒)
+RATE_WINDOW = 10.0
+# SQSのメッセージの遅延の上限(秒)
+MAX_DELAY_SECONDS = 900
+
+
+class BlockedError(Exception):
+    # reason: http_429, http_503, captcha, backoff (待ち時間がTHROTTLE_MAX_WAITを超える), circuit_open,
+    #         deadline (Lambdaの残り時間が足りない)
+    def __init__(self, reason: str, retry_after: float = None, url: str = None):
+        super().__init__(f"blocked ({reason}){f' {url}' if url else ''}"
+                         f"{f', retry after {retry_after:.1f}s' if retry_after is not None else ''}")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.url = url
+
+
+class CircuitOpenError(BlockedError):
+    # サーキットブレーカーが開いているため送らなかった (retry_after秒後に試せる)
+    def __init__(self, retry_after: float):
+        super().__init__("circuit_open", retry_after)
+
+
+def parse_retry_after(value):
+    # Retry-Afterヘッダー (秒数またはHTTP日付) を秒数にする。解釈できない場合はNone
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max((when - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+
+
+def detect_block(status_code: int, content: bytes):
+    # ブロックされた応答の理由を返す (通常の応答はNone)
+    if status_code in BLOCK_STATUS_CODES:
+        return f"http_{status_code}"
+    if status_code == 200 and content and any(marker in content for marker in BLOCK_PAGE_MARKERS):
+        return "captcha"
+    return None
+
+
+class CircuitBreaker:
+    # 成功をはさまずにthreshold回ブロックされたらcooldown秒の間リクエストを止める (open)
+    # cooldownが過ぎたら1件だけ試し (half_open)、成功すれば再開し、失敗すればcooldownを倍にして止める
+    def __init__(self, threshold: int = 5, cooldown: float = 60.0, max_cooldown: float = 900.0):
+        self.threshold = threshold
+        self.initial_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def check(self, now: float):
+        # 送ってよければ何もせず、止めている間はCircuitOpenErrorを送出する
+        if self.state == "closed":
+            return
+        if now < self.open_until:
+            raise CircuitOpenError(self.open_until - now)
+        if self.probing:
+            # 試しに送ったリクエストの結果を待っている
+            raise CircuitOpenError(1.0)
+        self.state = "half_open"
+        self.probing = True
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != "closed":
+            self.state = "closed"
+            self.probing = False
+            self.cooldown = self.initial_cooldown
+
+    def record_failure(self, now: float):
+        self.failures += 1
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open(now)
+        elif self.state == "closed" and self.failures >= self.threshold:
+            self._open(now)
+
+    def record_error(self):
+        # ブロック以外のエラー (接続エラーなど) の場合は、次のリクエストで試し直す
+        self.probing = False
+
+    def _open(self, now: float):
+        self.state = "open"
+        self.open_until = now + self.cooldown
+        self.probing = False
+
+
+class AdaptiveController:
+    # プロセス(Lambdaのコンテナ)内のすべてのリクエストで共有する (複数スレッドから使える)
+    # 頻度(rate)・同時実行数(limit)がNoneの場合は制限しない
+    def __init__(self, max_rps: float = 0.0, min_rps: float = 0.05, increase: float = 0.1, decrease: float = 0.5,
+                 max_concurrency: int = 0, backoff: float = 5.0, max_wait: float = 60.0, breaker=None):
+        self.max_rps = max_rps or None
+        self.min_rps = min_rps
+        self.increase = increase
+        self.decrease = decrease
+        self.max_concurrency = max_concurrency or None
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.breaker = breaker or CircuitBreaker()
+        self.rate = self.max_rps
+        self.limit = self.max_concurrency
+        # 上限がない場合に、ブロックされた時点の頻度・同時実行数まで戻ったら制限をやめる
+        self.rate_ceiling = self.max_rps
+        self.limit_ceiling = self.max_concurrency
+        self.in_flight = 0
+        self.next_at = 0.0
+        self.blocked_until = 0.0
+        self.started = deque()
+        self.condition = threading.Condition()
+        self.stats = {"blocked": 0, "circuit_open": 0, "decreases": 0}
+
+    def try_enter(self):
+        # 同時実行数に空きがあれば枠を1つ使う
+        with self.condition:
+            if self.limit is not None and self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def reserve(self):
+        # 送ってよい時刻までの秒数を返し、次のリクエストの枠を予約する
+        # サーキットブレーカーが開いている場合と、待ち時間がmax_waitを超える場合はBlockedErrorを送出する
+        with self.condition:
+            now = time.monotonic()
+            try:
+                self.breaker.check(now)
+            except CircuitOpenError:
+                self.stats["circuit_open"] += 1
+                raise
+            if self.blocked_until - now > self.max_wait:
+                raise BlockedError("backoff", self.blocked_until - now)
+            start_at = max(now, self.next_at, self.blocked_until)
+            if self.rate is not None:
+                self.next_at = start_at + 1 / self.rate
+            self.started.append(start_at)
+            while self.started and self.started[0] < now - RATE_WINDOW:
+                self.started.popleft()
+            return start_at - now
+
+    def acquire(self):
+        # スレッドから使う場合 (同時実行数の枠が空くまで待ち、送ってよい時刻まで眠る)
+        # 戻ったらリクエストを送り、結果に応じてon_success, on_block, on_errorのいずれかとleaveを呼ぶ
+        with self.condition:
+            while self.limit is not None and self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        try:
+            delay = self.reserve()
+        except BlockedError:
+            self.leave()
+            raise
+        if delay > 0:
+            time.sleep(delay)
+
+    def _observed_rate(self, now: float):
+        if not self.started:
+            return self.min_rps
+        return len(self.started) / max(now - self.started[0], 1.0)
+
+    def on_success(self):
+        # 加算的に戻す (同時実行数は現在の同時実行数の分だけ成功したら1つ増やす)
+        with self.condition:
+            self.breaker.record_success()
+            if self.rate is not None:
+                self.rate += self.increase
+                if self.rate_ceiling is not None and self.rate >= self.rate_ceiling:
+                    self.rate = self.max_rps
+            if self.limit is not None:
+                self.limit += 1 / self.limit
+                if self.limit_ceiling is not None and self.limit >= self.limit_ceiling:
+                    self.limit = self.max_concurrency
+            self.condition.notify_all()
+
+    def on_block(self, retry_after: float = None):
+        with self.condition:
+            now = time.monotonic()
+            self.stats["blocked"] += 1
+            # 同時に送っていたリクエストがまとめてブロックされた場合は1回だけ下げ、サーキットブレーカーにも1回として数える
+            if now < self.blocked_until:
+                if self.breaker.state == "half_open":
+                    self.breaker.record_failure(now)
+            else:
+                self.breaker.record_failure(now)
+                self.stats["decreases"] += 1
+                if self.rate is None:
+                    self.rate_ceiling = self._observed_rate(now)
+                    self.rate = self.rate_ceiling
+                if self.limit is None:
+                    self.limit_ceiling = max(self.in_flight, 1)
+                    self.limit = self.limit_ceiling
+                self.rate = max(self.rate * self.decrease, self.min_rps)
+                self.limit = max(self.limit * self.decrease, 1)
+            if retry_after is None:
+                retry_after = self.backoff * 2 ** max(self.breaker.failures - 1, 0)
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def on_error(self):
+        with self.condition:
+            self.breaker.record_error()
+
+    def snapshot(self):
+        with self.condition:
+            return dict(self.stats, state=self.breaker.state,
+                        rate=round(self.rate, 3) if self.rate is not None else None,
+                        limit=round(self.limit, 1) if self.limit is not None else None)
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def create_controller():
+    breaker = CircuitBreaker(threshold=int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5")),
+                             cooldown=float(os.environ.get("CIRCUIT_COOLDOWN", "60")),
+                             max_cooldown=float(os.environ.get("CIRCUIT_MAX_COOLDOWN", "900")))
+    return AdaptiveController(max_rps=float(os.environ.get("THROTTLE_MAX_RPS", "0")),
+                              min_rps=float(os.environ.get("THROTTLE_MIN_RPS", "0.05")),
+                              increase=float(os.environ.get("THROTTLE_INCREASE", "0.1")),
+                              decrease=float(os.environ.get("THROTTLE_DECREASE", "0.5")),
+                              max_concurrency=int(os.environ.get("THROTTLE_MAX_CONCURRENCY", "0")),
+                              backoff=float(os.environ.get("THROTTLE_BACKOFF", "5")),
+                              max_wait=float(os.environ.get("THROTTLE_MAX_WAIT", "60")),
+                              breaker=breaker)
+
+
+def get_controller():
+    # プロセス(Lambdaのコンテナ)内で共有し、呼び出しをまたいでもブロックされた状態を保つ
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = create_controller()
+    return _controller
+
+
+def get_max_retries():
+    return int(os.environ.get("THROTTLE_MAX_RETRIES", "2"))
+
+
+def get_max_attempts():
+    return int(os.environ.get("THROTTLE_MAX_ATTEMPTS", "5"))
+
+
+def plan_retries(requests: list, errors: list):
+    # ブロックされて処理できなかったリクエストをキューに戻す際のメッセージと遅延(秒)を返す
+    # 戻した回数はメッセージのattemptに数え、THROTTLE_MAX_ATTEMPTS回に達したものはexhaustedとして返す
+    # 戻り値: (戻すメッセージ, 遅延, exhausted)
+    max_attempts = get_max_attempts()
+    retries = []
+    exhausted = []
+    for request in requests:
+        attempt = request.get("attempt", 0) + 1
+        if attempt >= max_attempts:
+            exhausted.append(request)
+        else:
+            retries.append(dict(request, attempt=attempt))
+    waits = [e.retry_after for e in errors if e.retry_after is not None]
+    delay = min(math.ceil(max(waits + [0])), MAX_DELAY_SECONDS)
+    return retries, delay, exhausted